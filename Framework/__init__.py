@@ -1,15 +1,27 @@
 import functools
+from contextvars import ContextVar
+
+from starlette.concurrency import run_in_threadpool
 from typing import Generic, OrderedDict, Callable, Dict, Any, Optional, List, Union
 
 from pydantic import BaseModel, Field
 
+import Framework.deadline as deadline
+import Framework.incremental as incremental
+import Framework.instrumentation as instrumentation
 import Framework.warnings as warnings
 from Framework.abc.Endpoint import ABCEndpoint
 from Framework.abc.Stack import ABCStack
 from Framework.abc.StackTracer import ABCStackTracer
 from Framework.base import Calculation, InternalException, InModel, OutModel
-from Framework.decorators import SIGNING_KEY, _serialize_warning_header, RuleErrorHandler, RuleWarningHandler, \
-    RuleTraceabilityHandler, RuleSignedHandler, StackTraceabilityHandler
+from Framework.decorators import SIGNING_KEY, _serialize_warning_header, _is_async, RuleErrorHandler, \
+    RuleWarningHandler, RuleTraceabilityHandler, RuleSignedHandler, StackTraceabilityHandler, RuleBatchHandler, \
+    RuleCacheHandler, MerkleSignedHandler, RuleCompiledHandler, RuleProcessHandler, RuleCoalescingHandler
+from Framework.coalesce import SingleFlight
+from Framework.graph import StackGraph
+from Framework.merkle import verify_signed_tree
+from Framework.streaming import RuleStreamHandler
+from Framework.remote import RemoteRule, RemoteError
 
 
 def setup_logging():
@@ -47,34 +59,127 @@ class SimpleStackTracer(ABCStackTracer, OrderedDict[str, BaseModel]):
     """
     This stack tracer provides intermediates as an Ordered Dictionary to preserve the order of the sub calls
     However when calling the same calculation twice on the same level on a stack, it would overwrite the latest entry.
+    Hence, it raises a KeyError instead, use the ListStackTracer for stacks that call the same calculation repeatedly.
+
+    Stacks with an async calculate function are provided with awaitable sub calculations.
+    Synchronous dependencies are then run in the threadpool, so that the event loop is not blocked.
+
+    The results are stored in a context variable, i.e. they are scoped to the request (context) that is calculating.
+    Hence, one stack instance can serve many concurrent requests.
     """
     def __init__(self, stack: ABCStack):
         super().__init__()
         self.stack = stack
         self.dependencies = set()
-        self.results = OrderedDict[str, BaseModel]()
+        self._results = ContextVar(f'{type(stack).__name__}_results')
 
     def reset(self):
-        self.results = OrderedDict[str, BaseModel]()
+        self._results.set(OrderedDict[str, BaseModel]())
+
+    @property
+    def results(self) -> OrderedDict[str, BaseModel]:
+        try:
+            return self._results.get()
+        except LookupError:  # nothing has been recorded in this context yet
+            self.reset()
+            return self._results.get()
 
     def __call__(self, dependency: Union[ABCStack, ABCEndpoint]) -> Callable:
         self.dependencies.add(dependency)
-        # todo: Instead of hard coding, match the signed function
-        fn = dependency.vault[2][-1]
+        # call the signed function, or its cache if the dependency is cacheable (coalesced if it coalesces calls)
+        layers = {name: fn for name, _, fn in dependency.vault}
+        fn = layers.get('coalesced', layers.get('cached', layers['signed']))
+        if _is_async(fn) and not _is_async(self.stack.vault[0][-1]):
+            raise TypeError(f'{self.stack.name} cannot await {dependency.name}, '
+                            f'please define the calculate function of the stack as async def!')
+
+        def record(call_result):
+            self.record(dependency.name, call_result)
+            return call_result
+
+        layer = f'call.{dependency.name}'
+        signed_type = layers['signed'].return_type
+        verify_key = getattr(dependency, 'verify_key', None)  # remote rules are signed by another service
+
+        def reuse(input_model: BaseModel) -> Optional[BaseModel]:
+            # when recalculating incrementally, the previous result is reused if the input is unchanged
+            reused = incremental.reuse(dependency.name, dependency.owner, input_model, signed_type, SIGNING_KEY,
+                                       verify_key)
+            if reused is not None:
+                logger.info('%s is reusing the previous result of %s', self.stack.name, dependency.name)
+            return reused
+
+        def call(input_model: BaseModel):
+            reused = reuse(input_model)
+            if reused is not None:
+                return reused
+            # no sub calculation is started once the deadline of the request has passed
+            with incremental.nested(dependency.name), deadline.guard(dependency.name):
+                return fn(input_model=input_model)
 
         @functools.wraps(fn)
         def inner(input_model: BaseModel):
-            logger.info((f'{self.stack.name} is calling {dependency.name}\n'
-                          f'...with following data {input_model}'))
-            call_result = fn(input_model=input_model)
-            if dependency.name in self.results:
-                raise KeyError(f'{dependency.name} has already been recorded and should not be overwritten. '
-                               f'please use a different type of tracer!')
-            self.results[dependency.name] = call_result
-            return call_result
+            # formatted by the logger only if the level is enabled
+            logger.info('%s is calling %s\n...with following data %s', self.stack.name, dependency.name, input_model)
+            if instrumentation.enabled:
+                with instrumentation.timer(self.stack.name, layer):
+                    return record(call(input_model))
+            return record(call(input_model))
+
+        async def call_async(input_model: BaseModel):
+            reused = reuse(input_model)
+            if reused is not None:
+                return reused
+            with incremental.nested(dependency.name), deadline.guard(dependency.name):
+                if _is_async(fn):
+                    return await deadline.wait(fn(input_model=input_model), dependency.name)
+                return await run_in_threadpool(fn, input_model=input_model)
 
-        return inner
+        @functools.wraps(fn)
+        async def async_inner(input_model: BaseModel):
+            # formatted by the logger only if the level is enabled
+            logger.info('%s is calling %s\n...with following data %s', self.stack.name, dependency.name, input_model)
+            if instrumentation.enabled:
+                with instrumentation.timer(self.stack.name, layer):
+                    return record(await call_async(input_model))
+            return record(await call_async(input_model))
+
+        return async_inner if _is_async(self.stack.vault[0][-1]) else inner
+
+    def record(self, name: str, call_result: BaseModel):
+        if name in self.results:
+            raise KeyError(f'{name} has already been recorded and should not be overwritten. '
+                           f'please use a different type of tracer!')
+        self.results[name] = call_result
+
+    def order(self, names: List[str]):
+        for name in names:
+            self.results.move_to_end(name)
 
     @property
     def intermediates(self) -> OrderedDict[str, BaseModel]:
         return self.results
+
+
+class ListStackTracer(SimpleStackTracer):
+    """
+    This stack tracer records each sub call, i.e. the same calculation may be called several times on a stack.
+    The calls are kept as a list, the intermediates name repeated calls by their number, e.g. Add, Add#2, Add#3
+    """
+    def reset(self):
+        self._results.set([])
+
+    def record(self, name: str, call_result: BaseModel):
+        self.results.append((name, call_result))
+
+    def order(self, names: List[str]):
+        position = {name: index for index, name in enumerate(names)}
+        self.results.sort(key=lambda item: position.get(item[0], len(position)))
+
+    @property
+    def intermediates(self) -> OrderedDict[str, BaseModel]:
+        intermediates, counts = OrderedDict[str, BaseModel](), dict()
+        for name, call_result in self.results:
+            counts[name] = counts.get(name, 0) + 1
+            intermediates[name if counts[name] == 1 else f'{name}#{counts[name]}'] = call_result
+        return intermediates
@@ -1,10 +1,38 @@
+import functools
 import inspect
 from abc import ABC, abstractmethod
-from typing import Generic, List, get_args
+from typing import Any, Generic, List, Mapping, Optional, Union, get_args
 
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Depends
+from starlette.responses import PlainTextResponse
 
+import Framework.audit as audit
+import Framework.deadline as deadline
+import Framework.instrumentation as instrumentation
+import Framework.process as process
+from Framework.admission import Admission
 from Framework.base import InModel, OutModel, Calculation, InternalException
+from Framework.cache import LRUCache
+from Framework.coalesce import SingleFlight
+from Framework.negotiation import accept_header, openapi_content
+from Framework.streaming import NDJSONResponse
+
+
+def _route_endpoint(fn, admission: Optional[Admission]):
+    """
+    FastAPI awaits coroutine functions only, decorated calculations are therefore wrapped into one.
+    Each request is admitted by the admission control of the rule first, synchronous calculations then run in the
+    threadpool (see Framework.admission). Handlers, that admit their requests on their own (streams), are routed
+    without admission.
+    """
+
+    @functools.wraps(fn)
+    async def endpoint(*args, **kwargs):
+        if admission is None:
+            return await fn(*args, **kwargs)
+        return await admission.run(fn, *args, **kwargs)
+
+    return endpoint
 
 
 class ABCEndpoint(ABC, Generic[InModel, OutModel]):
@@ -15,10 +43,29 @@ class ABCEndpoint(ABC, Generic[InModel, OutModel]):
      - provide a local http server (via main_app)
      - enforce subclasses to implement the calculate method (@abstractmethod)
      - decorate subclasses via __init__, which must be called when instantiating a concrete subclass via super
+     - provide a batch endpoint for each subclass (via calculate_batch, which is set by _decorate_self)
+     - provide a streaming endpoint for each subclass (via calculate_stream, which is set by _decorate_self)
     todo: better to split responsibilities?!
     """
     rules = set()
     owner = "SomeOwner"
+    # deterministic calculations may opt in to memoize their signed responses (ttl in seconds, None = no expiry)
+    cacheable = False
+    cache_size = 1024
+    cache_ttl = None
+    # identical concurrent calls may opt in to wait for the calculation in flight instead of calculating on their own
+    coalesce = False
+    # maximum number of inputs of a stream that are calculated (or waiting to be sent) at a time
+    stream_window = 64
+    # maximum length of a line (input) of a stream in bytes, longer lines are answered with an error item
+    stream_line_bytes = 2 ** 20
+    # admission control (see Framework.admission): maximum number of requests calculated at a time (None = unlimited),
+    # maximum number of requests waiting for them (None = unbounded) and the priority for the threadpool (higher first)
+    max_concurrency = None
+    max_queue = None
+    priority = 0
+    # default deadline of the requests in seconds (None = no deadline), clients may set an earlier one (see deadline)
+    timeout = None
     _endpoint_kwargs = dict()
 
     def __init_subclass__(cls, **kwargs):
@@ -38,7 +85,7 @@ class ABCEndpoint(ABC, Generic[InModel, OutModel]):
     def _populate_class_variables(cls, kwargs):
         cls.tag = kwargs.pop('tag', cls.__name__)
         cls.summary = kwargs.pop('summary', "Not sure what to put here yet...")
-        for key, value in kwargs:
+        for key, value in kwargs.items():
             setattr(cls, key, value)
 
     @classmethod
@@ -49,28 +96,63 @@ class ABCEndpoint(ABC, Generic[InModel, OutModel]):
         return [Calculation(name=rule.__name__, endpoint="/" + rule.__name__) for rule in cls.rules]
 
     @classmethod
-    def main_app(cls):
-        """
-        This method is used to spin up FastAPI
-        First, provide the method to list all available/concrete calculations
-        Secondly, mount all available/concrete endpoints
-        :return: app that can be served with uvicorn
-        """
+    def _app(cls, endpoints) -> FastAPI:
         app = FastAPI(title="System")
         app.get("/calculations",
                 response_model=List[Calculation],
                 summary="List available calculations",
                 response_description="Provides name and endpoint of the available calculations",
                 tags=['top-level'])(cls.list_calculations)
-        for rule in cls.rules:
-            r: ABCEndpoint = rule()
+        for r in endpoints:
             app.include_router(r.app, tags=[r.tag])
         return app
 
+    @classmethod
+    def main_app(cls, lazy: bool = False, warm_up: bool = False, openapi_cache: Optional[str] = None,
+                 metrics: bool = False, audit_log: Union[str, Mapping[str, Any], None] = None):
+        """
+        This method is used to spin up FastAPI
+        First, provide the method to list all available/concrete calculations
+        Secondly, mount all available/concrete endpoints
+        :param lazy: instantiate (i.e. decorate) each rule on its first request instead of on startup
+        :param warm_up: instantiate the lazy rules in a background thread after startup
+        :param openapi_cache: file to store the OpenAPI schema, it is reused as long as the rules do not change
+        :param metrics: time each layer, provide the timings at /metrics and as Server-Timing header on request
+        :param audit_log: directory to record each signed result in or a mapping of the arguments of the audit log,
+            e.g. {"directory": "audit", "policy": "block"} (see Framework.audit.AuditLog)
+        :return: app that can be served with uvicorn
+        """
+        # the lazy endpoints rely on the decorators, which in turn rely on this module
+        from Framework.lazy import LazyEndpoint, cache_openapi
+        if lazy:
+            endpoints = [LazyEndpoint(rule) for rule in cls.rules]
+            app = cls._app(endpoints)
+            # the response models are known once the rules are decorated, hence the schema is based on a non lazy app
+            cache_openapi(app, cls.rules, openapi_cache, lambda: cls._app([e.instance for e in endpoints]).openapi())
+            if warm_up:
+                app.router.add_event_handler("startup", functools.partial(LazyEndpoint.warm_up, endpoints))
+        else:
+            app = cls._app([rule() for rule in cls.rules])
+            cache_openapi(app, cls.rules, openapi_cache, app.openapi)
+        process_rules = [rule for rule in cls.rules if getattr(rule, 'executor', None) == "process"]
+        if process_rules:  # pre-warm the process pool, so that each worker holds its own rule instances
+            app.router.add_event_handler("startup", functools.partial(process.start, process_rules))
+            app.router.add_event_handler("shutdown", process.shutdown)
+        if metrics:
+            instrumentation.enable()
+            app.add_middleware(instrumentation.ServerTimingMiddleware)
+            app.get("/metrics", response_class=PlainTextResponse, summary="Timings of each layer in Prometheus format",
+                    tags=['top-level'])(instrumentation.render)
+        if audit_log is not None:  # on startup, so that each (forked) worker runs its own writer
+            app.router.add_event_handler("startup", functools.partial(audit.enable, **audit.options(audit_log)))
+            app.router.add_event_handler("shutdown", audit.disable)
+        return app
+
     @abstractmethod
     def calculate(self, input_model: InModel) -> OutModel:
         """
         To be overridden by concrete subclasses (content owner)
+        May also be defined as async def, e.g. when waiting for I/O
         """
         pass
 
@@ -81,6 +163,8 @@ class ABCEndpoint(ABC, Generic[InModel, OutModel]):
         Shall decorates standalone rules or stacks
         Is called automatically when instantiating a concrete subclass
         Intended to modify self.vault with sequential decorations of the calculation function
+        and to set self.calculate_batch to a handler that calculates a list of inputs
+        as well as self.calculate_stream to a handler that calculates a stream of inputs
         """
         pass
 
@@ -100,25 +184,47 @@ class ABCEndpoint(ABC, Generic[InModel, OutModel]):
     def update_endpoint_kwargs(self, **values):
         self._endpoint_kwargs.update(values)
 
+    def add_endpoint_dependency(self, dependency):
+        """
+        Decorators may add dependencies (e.g. to read a header) to the calculation endpoint
+        """
+        self._endpoint_kwargs['dependencies'] = self._endpoint_kwargs.get('dependencies', []) + [dependency]
+
     @property
     def _responses(self) -> dict:
         """
         This method is used to add some response types that are common over all services
+        The responses may be encoded in binary formats as well, depending on the Accept header
         """
-        return {
+        responses = {
+            200: {'content': openapi_content()},
             567: {'description': 'An error has been thrown in the internal calculation. Blame the content owner!',
-                  'model': InternalException}
+                  'model': InternalException, 'content': openapi_content()},
+            504: {'description': 'The deadline of the request (X-Deadline, X-Timeout or the default) has passed',
+                  'model': InternalException, 'content': openapi_content()}
         }
+        if self.max_concurrency is not None:
+            responses[503] = {'description': 'The calculation is busy and its queue is full, please try again later',
+                              'model': InternalException, 'content': openapi_content()}
+        return responses
+
+    @classmethod
+    def _input_model(cls) -> InModel:
+        return get_args(cls.__orig_bases__[0])[0]
 
     @property
     def input_model(self) -> InModel:
-        return get_args(self.__orig_bases__[0])[0]
+        return self._input_model()
 
-    def input_schema(self):
-        return self.input_model.schema()
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def input_schema(cls):
+        return cls._input_model().schema()
 
-    def mapping(self):
-        return {name: field.field_info.extra.get('mapping') for name, field in self.input_model.__fields__.items()
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def mapping(cls):
+        return {name: field.field_info.extra.get('mapping') for name, field in cls._input_model().__fields__.items()
                 if field.field_info.extra.get('mapping')}
 
     def __init__(self):
@@ -126,18 +232,44 @@ class ABCEndpoint(ABC, Generic[InModel, OutModel]):
         Init is called when instantiating the concrete subclasses (rules/stacks/...)
         """
         self.name = self.__class__.__name__  # Use the name of the child class as the name
+        self._endpoint_kwargs = dict()  # not shared between the subclasses
         """
         vault contains a sequence of tuples ("name", return type, (decorated) function)
         each decoration adds an element to this sequence
         """
         self.vault = [("original", inspect.signature(self.calculate).return_annotation, self.calculate)]
+        # like the admission, the cache and the calculations in flight are shared by all instances of the rule
+        self.cache = LRUCache.of(type(self)) if self.cacheable else None
+        self.flights = SingleFlight.of(type(self)) if self.coalesce else None
+        self.admission = Admission.of(type(self))
         self.init_endpoint_kwargs()
         # decorate self will modify self.vault
         self._decorate_self()
         self.init_endpoint_kwargs()
+        self.add_endpoint_dependency(Depends(accept_header))
+        self.add_endpoint_dependency(Depends(deadline.header(self.timeout)))
         # initialize the endpoint
         self.app = APIRouter()
         self.app.get(self._endpoint_kwargs.get('path', '') + "/schema", summary=f'Obtain the input_schema')(
             self.input_schema)
         self.app.get(self._endpoint_kwargs.get('path', '') + "/mapping", summary=f'Obtain mappings')(self.mapping)
-        self.app.post(**self._endpoint_kwargs)(self.calculate)
+        if self.cache is not None:
+            self.app.get(self._endpoint_kwargs.get('path', '') + "/cache", summary='Obtain cache statistics')(
+                self.cache.stats)
+        if self.flights is not None:
+            self.app.get(self._endpoint_kwargs.get('path', '') + "/coalescing", summary='Obtain coalescing statistics')(
+                self.flights.stats)
+        if self.admission.limited:
+            self.app.get(self._endpoint_kwargs.get('path', '') + "/admission", summary='Obtain admission statistics')(
+                self.admission.stats)
+        self.app.post(**self._endpoint_kwargs)(_route_endpoint(self.calculate, self.admission))
+        self.app.post(self._endpoint_kwargs.get('path', '') + "/batch",
+                      response_model=self.calculate_batch.return_type,
+                      dependencies=self.calculate_batch.request_dependencies(self.timeout),
+                      responses={200: {'content': openapi_content()}},
+                      summary='Calculate a list of inputs, results, warnings and errors are provided per item'
+                      )(_route_endpoint(self.calculate_batch, self.admission))
+        self.app.post(self._endpoint_kwargs.get('path', '') + "/stream", response_class=NDJSONResponse,
+                      dependencies=self.calculate_stream.request_dependencies(self.timeout),
+                      summary='Calculate newline delimited json inputs, each item is streamed back when it is ready'
+                      )(_route_endpoint(self.calculate_stream, None))
@@ -1,19 +1,56 @@
 from abc import ABC
-from typing import Generic
+from typing import Generic, List
 
 from Framework import ABCEndpoint, InModel, OutModel, RuleTraceabilityHandler, RuleSignedHandler, RuleWarningHandler, \
-    RuleErrorHandler
+    RuleErrorHandler, RuleBatchHandler, RuleCacheHandler, RuleCompiledHandler, RuleProcessHandler, RuleStreamHandler, \
+    RuleCoalescingHandler
 
 
 class ABCRule(ABCEndpoint, ABC, Generic[InModel, OutModel]):
+    """
+    The abstract base class for a standalone rule
+    With compiled = True, requests are served by a single pass through all decorators (see RuleCompiledHandler)
+    With executor = "process", CPU bound calculations are run in a process pool instead of the threadpool
+    """
+    compiled = False
+    executor = "thread"
+
+    def calculate_batch(self, input_models: List[InModel]) -> List[OutModel]:
+        """
+        May be overridden by concrete subclasses (content owner) to calculate several inputs at once (e.g. vectorized)
+        By default, calculate is called for each input
+        Warnings should name the indices of the inputs they concern, e.g. warnings.warn('negative', items=[0, 3]),
+        otherwise the inputs are calculated one by one to attribute them
+        """
+        return [self.vault[0][-1](input_model) for input_model in input_models]
 
     def _decorate_self(self):
+        if self.executor not in ("thread", "process"):
+            raise ValueError(f'{self.name} has an unknown executor {self.executor}, please choose thread or process!')
+        if self.executor == "process":
+            rph = RuleProcessHandler(original_class=self)
+            self.vault.append(("process", self.vault[-1][1], rph))
         rth = RuleTraceabilityHandler(original_class=self, name=self.name)
         self.vault.append(("traceable", rth.return_type, rth))
         rsh = RuleSignedHandler(original_class=self, traceable_model=rth.return_type)
         self.vault.append(("signed", rsh.return_type, rsh))
+        if self.cache is not None:
+            rch = RuleCacheHandler(original_class=self, cache=self.cache)
+            self.vault.append(("cached", self.vault[-1][1], rch))
+        if self.flights is not None:
+            rco = RuleCoalescingHandler(original_class=self, flights=self.flights)
+            self.vault.append(("coalesced", self.vault[-1][1], rco))
         rwh = RuleWarningHandler(original_class=self)
         self.vault.append(("warning_handling", self.vault[-1][1], rwh))
         reh = RuleErrorHandler(original_class=self)
         self.vault.append(("error_handling", self.vault[-1][1], reh))
+        # the cache and the coalescing avoid the whole chain of decorators anyway
+        if self.compiled and self.cache is None and self.flights is None:
+            self.vault.append(("compiled", self.vault[-1][1], RuleCompiledHandler(original_class=self)))
         self.calculate = self.vault[-1][-1]
+        # only use the batch function of the content owner if it has been overridden
+        vectorized = type(self).calculate_batch is not ABCRule.calculate_batch
+        self.calculate_batch = RuleBatchHandler(original_class=self,
+                                                batch_callable=self.calculate_batch if vectorized else None)
+        self.calculate_stream = RuleStreamHandler(original_class=self, batch_handler=self.calculate_batch,
+                                                  window=self.stream_window, line_bytes=self.stream_line_bytes)
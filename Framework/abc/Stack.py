@@ -1,26 +1,44 @@
+import functools
+import inspect
 from abc import ABC
-from typing import Generic
+from typing import Any, Dict, Generic
+
+from pydantic import create_model
+
+import Framework.incremental as incremental
 
 from Framework.base import InModel, OutModel
 from Framework.abc.StackTracer import ABCStackTracer
-from Framework.abc.Endpoint import ABCEndpoint
+from Framework.abc.Endpoint import ABCEndpoint, _route_endpoint
 
-from Framework.decorators import StackTraceabilityHandler, RuleSignedHandler, RuleErrorHandler, RuleWarningHandler
+from Framework.decorators import StackTraceabilityHandler, RuleSignedHandler, RuleErrorHandler, RuleWarningHandler, \
+    RuleBatchHandler, RuleCacheHandler, MerkleSignedHandler, RuleCoalescingHandler, SIGNING_KEY
+from Framework.streaming import RuleStreamHandler
 
 
 class ABCStack(ABCEndpoint, ABC, Generic[InModel, OutModel]):
     """
     The abstract base class for a stack
     Each stack has a tracer that manages/logs the calls to sub calculations
+
+    With signing_mode = "merkle", the stack signs a digest of its input, output and the hashes of its intermediates
+    instead of the whole nested response (see Framework.merkle)
+
+    POST /{name}/recalculate calculates a new input incrementally from a previous signed response of the stack,
+    i.e. sub calculations whose input is unchanged are reused (see Framework.incremental)
     """
+    signing_mode = "full"
+
     @property
     def _responses(self) -> dict:
         """
         Use the default responses, but add the ones of the decorated function
         :return:
         """
-        return {**super()._responses,
-                200: {'model': self.vault[-1][1], 'description': 'Success, inputs, intermediates and outputs'}
+        responses = super()._responses
+        return {**responses,
+                200: {**responses.get(200, {}),
+                      'model': self.vault[-1][1], 'description': 'Success, inputs, intermediates and outputs'}
                 }
 
     def __init__(self, tracer: ABCStackTracer):
@@ -30,6 +48,35 @@ class ABCStack(ABCEndpoint, ABC, Generic[InModel, OutModel]):
         """
         self.tracer = tracer
         super().__init__()
+        self.recalculate = self._recalculate_endpoint()
+        self.app.post(**{**self._endpoint_kwargs, 'path': self._endpoint_kwargs['path'] + "/recalculate",
+                         'summary': 'Calculate a new input, reusing the unchanged results of a previous response'}
+                      )(_route_endpoint(self.recalculate, self.admission))
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def _recalculation_model(cls):
+        return create_model(f'{cls.__name__}Recalculation', input=(cls._input_model(), ...),
+                            previous=(Dict[str, Any], ...))
+
+    def _recalculate_endpoint(self):
+        calculate = self.calculate
+
+        def previous_response(recalculation):
+            return incremental.previous_response(recalculation.previous, self.name, self.owner, SIGNING_KEY)
+
+        if calculate.is_async:
+            async def recalculate(recalculation):
+                with previous_response(recalculation):
+                    return await calculate(recalculation.input)
+        else:
+            def recalculate(recalculation):
+                with previous_response(recalculation):
+                    return calculate(recalculation.input)
+        recalculate.is_async = calculate.is_async
+        recalculate.__signature__ = inspect.Signature([inspect.Parameter(
+            'recalculation', inspect.Parameter.KEYWORD_ONLY, annotation=self._recalculation_model())])
+        return recalculate
 
     def _decorate_self(self):
         """
@@ -38,8 +85,20 @@ class ABCStack(ABCEndpoint, ABC, Generic[InModel, OutModel]):
         """
         rts = StackTraceabilityHandler(original_class=self, tracer=self.tracer)
         self.vault.append(("traceable_stack", rts.return_type, rts))
-        rsh = RuleSignedHandler(original_class=self, traceable_model=rts.return_type)
+        signed_handlers = {"full": RuleSignedHandler, "merkle": MerkleSignedHandler}
+        if self.signing_mode not in signed_handlers:
+            raise ValueError(f'{self.name} has an unknown signing mode {self.signing_mode}, '
+                             f'please choose one of {list(signed_handlers)}!')
+        rsh = signed_handlers[self.signing_mode](original_class=self, traceable_model=rts.return_type)
         self.vault.append(("signed", rsh.return_type, rsh))
+        if self.cache is not None:
+            self.vault.append(("cached", self.vault[-1][1], RuleCacheHandler(original_class=self, cache=self.cache)))
+        if self.flights is not None:
+            self.vault.append(("coalesced", self.vault[-1][1],
+                               RuleCoalescingHandler(original_class=self, flights=self.flights)))
         self.vault.append(("error_handling", self.vault[-1][1], RuleErrorHandler(original_class=self)))
         self.vault.append(("warning_handling", self.vault[-1][1], RuleWarningHandler(original_class=self)))
         self.calculate = self.vault[-1][-1]  # override the calculate method
+        self.calculate_batch = RuleBatchHandler(original_class=self)
+        self.calculate_stream = RuleStreamHandler(original_class=self, batch_handler=self.calculate_batch,
+                                                  window=self.stream_window, line_bytes=self.stream_line_bytes)
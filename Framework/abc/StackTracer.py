@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import TypeVar, Generic, Callable
+from typing import TypeVar, Generic, Callable, List
 
 from Framework.abc.Endpoint import ABCEndpoint
 
@@ -18,6 +18,14 @@ class ABCStackTracer(ABC, Generic[T]):
     def reset(self):
         """
         Before each calculation, the results from old runs need to be erased
+        Concurrent calculations must not erase each other's results, i.e. the results shall be request scoped
+        """
+        pass
+
+    def order(self, names: List[str]):
+        """
+        Sub calculations that run concurrently are recorded in the order they finish.
+        Tracers that preserve the order of the sub calls shall record the given names in the given order instead.
         """
         pass
 
@@ -0,0 +1,204 @@
+import enum
+import inspect
+import io
+import json
+import zipfile
+from abc import ABC, abstractmethod
+from typing import Generic, List, Dict, Optional, get_args
+
+from pydantic import ValidationError, create_model
+from pydantic.fields import SHAPE_SINGLETON
+from starlette.requests import Request
+
+import Framework.audit as audit
+import Framework.warnings as warnings
+from Framework import InModel, OutModel, RuleErrorHandler, SIGNING_KEY, _serialize_warning_header
+from Framework.abc.Rule import ABCRule
+from Framework.serialization import sign_canonical, encode_batch_item, PreEncodedJSONResponse
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency, that is required by vectorized rules only
+    np = None
+
+_DTYPES = {float: 'float64', int: 'int64', bool: 'bool', str: 'str'}
+_KINDS = {float: 'fiu', int: 'iu', bool: 'b', str: 'U'}  # the kinds of arrays, whose values are valid for the type
+
+
+class ABCVectorRule(ABCRule, ABC, Generic[InModel, OutModel]):
+    """
+    The abstract base class for a vectorized rule (requires numpy)
+    Concrete subclasses implement calculate_columns instead of calculate: each field of the input model is provided as
+    numpy array (one row per input), each field of the output model is returned as array of the same length.
+    calculate and calculate_batch are derived from calculate_columns.
+
+    On top of the endpoints of a rule, POST /{name}/columns accepts a json object of column arrays
+    or a numpy .npz file (Content-Type: application/x-npz) and responds with either
+     - a single signed response of the input and output columns (layout=columns), or
+     - a signed traceable response per row, like the batch endpoint (layout=rows)
+    The columns are validated like the fields of the input model (malformed columns are answered with 422), columns of
+    plain fields (bool, int, float or str without constraints or validators) are validated by the kind of their array.
+    """
+
+    class Layouts(enum.Enum):
+        columns = "columns"
+        rows = "rows"
+
+    def __init__(self):
+        if np is None:
+            raise ImportError(f'{type(self).__name__} is a vectorized rule, which requires numpy, please install it!')
+        self._input_type, self._output_type = get_args(type(self).__orig_bases__[0])
+        self._input_fields = self._input_type.__fields__
+        self._output_fields = self._output_type.__fields__
+        self._root_validated = bool(self._input_type.__pre_root_validators__ or
+                                    self._input_type.__post_root_validators__)
+
+        # the decorators rely on the signature of calculate, which is generic for vectorized rules
+        def calculate(input_model):
+            return ABCVectorRule.calculate(self, input_model)
+
+        calculate.__doc__ = type(self).calculate_columns.__doc__
+        calculate.__signature__ = inspect.Signature(
+            [inspect.Parameter('input_model', inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=self._input_type)],
+            return_annotation=self._output_type)
+        self.calculate = calculate
+        super().__init__()
+        self.columnar_response_type = create_model(
+            f'{self.name}ColumnarResponse', input=(self._columns_model(self._input_type), ...),
+            output=(self._columns_model(self._output_type), ...), signatures=(dict, ...))
+        self.app.post(self._endpoint_kwargs.get('path', '') + "/columns", response_model=self.columnar_response_type,
+                      summary='Calculate columns of inputs (json object of arrays or application/x-npz) at once'
+                      )(self.calculate_columnar)
+
+    @abstractmethod
+    def calculate_columns(self, columns: Dict[str, 'np.ndarray']) -> Dict[str, 'np.ndarray']:
+        """
+        To be overridden by concrete subclasses (content owner)
+        :param columns: the fields of the input model as numpy arrays of equal length
+        :return: the fields of the output model as numpy arrays of the same length
+        Warnings should name the rows they concern, e.g. warnings.warn('a four', items=np.flatnonzero(x == 4))
+        """
+        pass
+
+    def calculate(self, input_model: InModel) -> OutModel:
+        return self._rows(self.calculate_columns(self._columns([input_model])), 1)[0]
+
+    def calculate_batch(self, input_models: List[InModel]) -> List[OutModel]:
+        return self._rows(self.calculate_columns(self._columns(input_models)), len(input_models))
+
+    @staticmethod
+    def _columns_model(model_type):
+        return create_model(f'{model_type.__name__}Columns',
+                            **{name: (List[field.outer_type_], ...) for name, field in model_type.__fields__.items()})
+
+    @staticmethod
+    def _dtype(field) -> str:
+        return _DTYPES.get(field.type_, 'object') if field.shape == SHAPE_SINGLETON else 'object'
+
+    def _columns(self, input_models: list) -> Dict[str, 'np.ndarray']:
+        return {name: np.array([getattr(model, name) for model in input_models], dtype=self._dtype(field))
+                for name, field in self._input_fields.items()}
+
+    @staticmethod
+    def _is_plain(field) -> bool:
+        """
+        Whether any value of the type of the field is valid, i.e. the field is neither constrained nor validated
+        """
+        return field.type_ in _DTYPES and field.shape == SHAPE_SINGLETON and not field.allow_none and \
+            not field.class_validators and not field.pre_validators and not field.post_validators
+
+    def _validate_columns(self, columns: dict) -> dict:
+        """
+        Validate the values of the input columns like pydantic validates the fields of the input model
+        """
+        errors, validated = [], dict(columns)
+        for name, column in columns.items():
+            field = self._input_fields.get(name)
+            if field is None:
+                continue
+            if not isinstance(column, (list, np.ndarray)):
+                raise ValueError(f'{self.name} expects the column {name} to be an array')
+            if self._is_plain(field):
+                array = np.asarray(column)
+                if array.dtype.kind in _KINDS[field.type_]:
+                    validated[name] = array
+                    continue
+            if isinstance(column, np.ndarray):
+                column = column.tolist()
+            values = []
+            for index, value in enumerate(column):
+                value, error = field.validate(value, {}, loc=(name, index), cls=self._input_type)
+                if error:
+                    errors.append(error)
+                values.append(value)
+            validated[name] = values
+        if errors:
+            raise ValidationError(errors, self._input_type)
+        return validated
+
+    def _input_models(self, columns: Dict[str, 'np.ndarray']) -> list:
+        names = list(columns)
+        return [self._input_type(**dict(zip(names, row))) for row in zip(*(columns[name].tolist() for name in names))]
+
+    def _check_columns(self, columns: dict, fields: dict, length: Optional[int] = None) -> Dict[str, 'np.ndarray']:
+        """
+        Convert the columns to arrays of the types of the fields, missing optional fields are filled with their default
+        """
+        missing = [name for name, field in fields.items() if name not in columns and field.required]
+        if missing:
+            raise KeyError(f'{self.name} is missing the columns {missing}')
+        arrays = {name: np.asarray(columns[name], dtype=self._dtype(field)) for name, field in fields.items()
+                  if name in columns}
+        lengths = {array.shape[0] if array.ndim == 1 else -1 for array in arrays.values()}
+        if -1 in lengths or len(lengths | ({length} if length is not None else set())) > 1:
+            raise ValueError(f'{self.name} expects one dimensional columns of equal length, got {sorted(lengths)}')
+        length = lengths.pop() if lengths else length or 0
+        for name, field in fields.items():
+            if name not in arrays:
+                arrays[name] = np.full(length, field.default, dtype=self._dtype(field))
+        return arrays
+
+    def _rows(self, columns: dict, length: int) -> list:
+        columns = self._check_columns(columns, self._output_fields, length)
+        names = list(columns)
+        return [self._output_type(**dict(zip(names, row))) for row in zip(*(columns[name].tolist() for name in names))]
+
+    def _parse_columns(self, body: bytes, content_type: str) -> Dict[str, 'np.ndarray']:
+        if content_type.startswith('application/x-npz'):
+            with np.load(io.BytesIO(body), allow_pickle=False) as npz:
+                columns = {name: npz[name] for name in npz.files}
+        else:
+            columns = json.loads(body)
+            if not isinstance(columns, dict):
+                raise ValueError(f'{self.name} expects a json object of columns')
+        columns = self._check_columns(self._validate_columns(columns), self._input_fields)
+        if self._root_validated:  # validators across fields require the input models
+            return self._columns(self._input_models(columns))
+        return columns
+
+    def _calculate_columnar(self, columns: Dict[str, 'np.ndarray'], layout: Layouts):
+        with warnings.collect() as list_wng:
+            try:
+                if layout is self.Layouts.rows:
+                    items = self.calculate_batch(self._input_models(columns))
+                    body = b'[' + b','.join(encode_batch_item(item) for item in items) + b']'
+                else:
+                    length = len(next(iter(columns.values()))) if columns else 0
+                    outputs = self._check_columns(self.calculate_columns(columns), self._output_fields, length)
+                    content = {'input': {name: column.tolist() for name, column in columns.items()},
+                               'output': {name: column.tolist() for name, column in outputs.items()}}
+                    signatures, body, _ = sign_canonical(content, self.owner, SIGNING_KEY)
+                    if audit.enabled:
+                        audit.record(self.name, content['input'], signatures)
+            except Exception as e:  # catch exceptions in the content owner routine
+                return RuleErrorHandler._error_response(e)
+        headers = {'X-DATPro-Warnings': _serialize_warning_header(list_wng)} if list_wng else None
+        return PreEncodedJSONResponse(content=body, headers=headers)
+
+    async def calculate_columnar(self, request: Request, layout: Layouts = Layouts.columns):
+        try:
+            columns = self._parse_columns(await request.body(), request.headers.get('content-type', ''))
+        except (KeyError, ValueError, TypeError, EOFError, zipfile.BadZipFile) as e:  # malformed columns of the client
+            return RuleErrorHandler._error_response(e, status_code=422)
+        # admitted once the body has been read, like the other routes the calculation is run in the threadpool
+        return await self.admission.run(self._calculate_columnar, columns, layout)
@@ -0,0 +1,227 @@
+"""
+Admission control: per rule concurrency limits, bounded wait queues and priorities.
+
+Rules may limit the number of their requests that are calculated at a time (max_concurrency = n), further requests
+wait in a queue of at most max_queue requests (None = unbounded) and are rejected right away, when it is full
+(503 with an InternalException of type AdmissionRejected), instead of piling up until they time out.
+All synchronous calculations share the workers of the threadpool on top, which are granted by the priority of the rules
+(higher first, FIFO within the same priority). Hence, the requests of a cheap rule with a high priority are served
+before the queued requests of an expensive one, which is in turn prevented from occupying all workers by its limit.
+
+Requests are admitted on their route only, the sub calls of a stack run within the admission of the stack.
+A stream holds its admission until the whole response has been sent, its lines are calculated within (see hold).
+"""
+import asyncio
+import contextlib
+import heapq
+import itertools
+import os
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple, Type
+
+from starlette.concurrency import run_in_threadpool
+
+import Framework.deadline as deadline
+import Framework.instrumentation as instrumentation
+from Framework.deadline import DeadlineExceeded
+from Framework.registry import PerRuleClass
+
+_gates = weakref.WeakSet()
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class Gate:
+    """
+    At most capacity holders at a time (None = unlimited), waiters are granted by priority and order of arrival.
+    Like SingleFlight, a gate is thread safe and may be shared by several event loops (e.g. of test clients).
+    """
+
+    def __init__(self, name: str, capacity: Optional[int] = None, max_queue: Optional[int] = None):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: List[Tuple[int, int, Future]] = []  # heap of (-priority, arrival, future)
+        self._arrival = itertools.count()
+        self._lock = threading.Lock()
+        _gates.add(self)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _join(self, priority: int) -> Optional[Tuple[int, int, Future]]:
+        """
+        :return: None if admitted right away, otherwise the entry in the queue
+        """
+        with self._lock:
+            if self.capacity is None or (self.running < self.capacity and not self._waiters):
+                self.running += 1
+                self.admitted += 1
+                return None
+            if self.max_queue is not None and len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(f'{self.name} is busy ({self.running} running, {len(self._waiters)} queued), '
+                                        f'please try again later')
+            entry = (-priority, next(self._arrival), Future())
+            heapq.heappush(self._waiters, entry)
+            return entry
+
+    def _leave(self, entry: Tuple[int, int, Future]):
+        with self._lock:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                return
+        if not entry[-1].cancel():  # the slot has been handed over already
+            self.release()
+
+    async def acquire(self, priority: int = 0):
+        entry = self._join(priority)
+        if entry is None:
+            return
+        try:
+            await asyncio.wrap_future(entry[-1])
+        except asyncio.CancelledError:  # e.g. the client has disconnected
+            self._leave(entry)
+            raise
+
+    def release(self):
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self.running -= 1
+                    return
+                future = heapq.heappop(self._waiters)[-1]
+            if future.set_running_or_notify_cancel():  # i.e. the waiter has not been cancelled meanwhile
+                with self._lock:
+                    self.admitted += 1
+                future.set_result(None)  # hand the slot over to the next waiter
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'running': self.running, 'queued': self.queued, 'admitted': self.admitted,
+                    'rejected': self.rejected, 'capacity': self.capacity, 'max_queue': self.max_queue}
+
+
+# the default executor of the event loop, which runs the synchronous calculations, has as many workers
+THREADPOOL = Gate('threadpool', capacity=min(32, (os.cpu_count() or 1) + 4))
+
+
+class Admission(PerRuleClass):
+    """
+    The admission control of a rule, which is shared by all of its instances (and its lazy endpoint)
+    """
+
+    def __init__(self, name: str, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None,
+                 priority: int = 0):
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError(f'{name} has to allow at least one concurrent calculation (max_concurrency)!')
+        if max_queue is not None and max_concurrency is None:
+            raise ValueError(f'{name} has a max_queue but no max_concurrency, please set both!')
+        if not isinstance(priority, int):
+            raise ValueError(f'{name} has a priority of {priority!r}, please choose an integer!')
+        self.gate = Gate(name, max_concurrency, max_queue)
+        self.priority = priority
+
+    @classmethod
+    def from_rule_class(cls, rule_class: Type) -> 'Admission':
+        return cls(rule_class.__name__, rule_class.max_concurrency, rule_class.max_queue, rule_class.priority)
+
+    @property
+    def limited(self) -> bool:
+        return self.gate.capacity is not None
+
+    def stats(self) -> dict:
+        return {**self.gate.stats(), 'priority': self.priority}
+
+    @contextlib.asynccontextmanager
+    async def admit(self, threadpool: bool):
+        """
+        :param threadpool: whether a worker of the threadpool has to be granted as well
+        """
+        await self.gate.acquire(self.priority)
+        try:
+            if threadpool:
+                await THREADPOOL.acquire(self.priority)
+                try:
+                    yield
+                finally:
+                    THREADPOOL.release()
+            else:
+                yield
+        finally:
+            self.gate.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Calculate once admitted (unless the deadline has passed meanwhile), synchronous calculations are run in the
+        threadpool, async ones are cancelled on the deadline, unless they apply it to each of their items (batches)
+        :return: the response of the calculation or the error response, if the request has been rejected
+        """
+        is_async = getattr(fn, 'is_async', False)
+        try:
+            async with self.admit(threadpool=not is_async):
+                with deadline.guard(self.gate.name):
+                    if is_async and getattr(fn, 'deadline_per_item', False):
+                        return await fn(*args, **kwargs)
+                    if is_async:
+                        return await deadline.wait(fn(*args, **kwargs), self.gate.name)
+                    return await run_in_threadpool(fn, *args, **kwargs)
+        except (AdmissionRejected, DeadlineExceeded) as e:
+            return error_response(e)
+
+    async def hold(self) -> Callable[[], None]:
+        """
+        Admit a request for longer than a single calculation, e.g. a stream.
+        Its calculations are run within the admission by calculate, one at a time if the concurrency is limited.
+        :return: the release of the admission, to be called exactly once when the request has finished
+        """
+        await self.gate.acquire(self.priority)
+        return self.gate.release
+
+    async def calculate(self, fn, *args, is_async: bool = False):
+        """
+        A calculation of a request, that is held (see hold): synchronous calculations are run in the threadpool,
+        once a worker has been granted
+        """
+        if is_async:
+            return await fn(*args)
+        await THREADPOOL.acquire(self.priority)
+        try:
+            return await run_in_threadpool(fn, *args)
+        finally:
+            THREADPOOL.release()
+
+
+def error_response(e: Exception):
+    """
+    The response to a request, that has been rejected (503) or whose deadline has passed before it was admitted (504)
+    """
+    # the decorators rely on the endpoints, which in turn rely on this module
+    from Framework.decorators import RuleErrorHandler
+    return RuleErrorHandler._error_response(e, status_code=503 if isinstance(e, AdmissionRejected) else 504)
+
+
+def _collect() -> List[str]:
+    gates = sorted(list(_gates), key=lambda g: g.name)
+    lines = []
+    for metric, kind, help_text, attribute in (
+            ('running', 'gauge', 'Number of admitted requests', 'running'),
+            ('queued', 'gauge', 'Number of requests waiting to be admitted', 'queued'),
+            ('rejected_total', 'counter', 'Number of requests rejected because the queue was full', 'rejected')):
+        lines += [f'# HELP datpro_admission_{metric} {help_text}', f'# TYPE datpro_admission_{metric} {kind}']
+        lines += [f'datpro_admission_{metric}{{gate="{gate.name}"}} {getattr(gate, attribute)}' for gate in gates
+                  if gate is THREADPOOL or gate.capacity is not None]
+    return lines
+
+
+instrumentation.register_collector(_collect)
@@ -0,0 +1,267 @@
+"""
+Audit trail of the signed results: rule name, input hash, signatures and timestamp of each signed result
+(responses, the sub calls of stacks and the items of batches, but not the cache hits, which have been signed before).
+
+Recording does not add latency to the requests: the results are put into a bounded queue, which a background thread
+writes in batches to segmented log files (json lines), each batch committed by a single fsync (group commit).
+After the first entry of a batch, the writer waits commit_delay seconds for further ones, instead of waking up (and
+competing for the interpreter) on each single entry.
+Entries are durable once their batch has been committed, entries still queued are lost if the process crashes.
+If the queue is full, the entries are dropped (policy = "drop", counted) or the calculation waits for the writer
+(policy = "block", back pressure, which stalls the event loop for async calculations).
+
+Each process (e.g. each worker of Framework.serve) writes its own segments, audit-<start ms>-<pid>-<n>.jsonl,
+a new segment is started once the current one exceeds segment_bytes.
+Entries are looked up by input hash (see Framework.cache.json_hash of the input of a signed response) with
+    python -m Framework.audit_reader <directory> <input hash> [--rule <name>]
+    python -m Framework.audit_reader <directory> --input '{"x": 1.0, "y": 2.0}'
+"""
+import inspect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Union
+
+import Framework.instrumentation as instrumentation
+from Framework.cache import json_hash
+
+POLICIES = ('drop', 'block')
+enabled = False
+_sink: Optional['AuditLog'] = None
+logger = logging.getLogger('Framework')
+
+
+class AuditLog:
+    """
+    :param directory: of the segments, created if it does not exist
+    :param max_queue: maximum number of entries waiting for the writer
+    :param policy: "drop" or "block" the entries while the queue is full
+    :param batch_size: maximum number of entries committed at once
+    :param commit_delay: seconds to wait for further entries after the first one of a batch
+    :param segment_bytes: size at which a new segment is started
+    :param fsync: commit each batch to disk, otherwise it is up to the operating system when to write
+    """
+
+    def __init__(self, directory: str, max_queue: int = 10000, policy: str = 'drop', batch_size: int = 1024,
+                 commit_delay: float = 0.005, segment_bytes: int = 64 * 2 ** 20, fsync: bool = True):
+        if policy not in POLICIES:
+            raise ValueError(f'unknown audit policy {policy}, please choose one of {POLICIES}!')
+        self.directory = directory
+        self.policy = policy
+        self.batch_size = batch_size
+        self.commit_delay = commit_delay
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.written = self.dropped = self.commits = self.segments = self.errors = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._prefix = f'audit-{int(time.time() * 1000):013d}-{os.getpid()}'
+        self._thread = threading.Thread(target=self._run, name='AuditWriter', daemon=True)
+
+    def start(self) -> 'AuditLog':
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+        return self
+
+    def submit(self, rule: str, input_data: Any, signatures: dict) -> bool:
+        """
+        Queue a signed result, the input is hashed by the writer
+        :return: False if the entry has been dropped
+        """
+        entry = (time.time(), rule, input_data, signatures)
+        if self.policy == 'drop':
+            try:
+                self._queue.put_nowait(entry)
+                return True
+            except queue.Full:
+                return self._drop()
+        while True:  # block, unless the writer is gone
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                if not self._thread.is_alive():
+                    return self._drop()
+
+    def _drop(self, count: int = 1) -> bool:
+        with self._lock:
+            self.dropped += count
+        return False
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Commit the queued entries and stop the writer
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    @staticmethod
+    def _encode(entry: tuple) -> bytes:
+        timestamp, rule, input_data, signatures = entry
+        # the input of merkle signed stacks is known by its hash already (see Framework.merkle)
+        input_hash = input_data if isinstance(input_data, str) else json_hash(input_data)
+        return (json.dumps({'ts': timestamp, 'rule': rule, 'input': input_hash, 'signatures': signatures},
+                           separators=(',', ':')) + '\n').encode()
+
+    def _open_segment(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        path = os.path.join(self.directory, f'{self._prefix}-{self.segments:04d}.jsonl')
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = 0
+        self.segments += 1
+        if self.fsync:  # the new segment itself has to survive a crash as well
+            directory = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def _commit(self, entries: List[tuple]):
+        data = b''.join(map(self._encode, entries))
+        if self._fd is None or self._size >= self.segment_bytes:
+            self._open_segment()
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+        if self.fsync:
+            os.fsync(self._fd)
+        self._size += len(data)
+        self.written += len(entries)
+        self.commits += 1
+
+    def _run(self):
+        stop = False
+        while not stop:
+            entries = [self._queue.get()]
+            if entries[0] is not None:
+                time.sleep(self.commit_delay)
+            # whatever has been queued in the meantime is committed along (group commit)
+            while len(entries) < self.batch_size:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in entries
+            entries = [entry for entry in entries if entry is not None]
+            if not entries:
+                continue
+            try:
+                self._commit(entries)
+            except Exception as e:  # e.g. the disk is full, the writer carries on with the next batch
+                self.errors += 1
+                self._drop(len(entries))
+                logger.error(f'{len(entries)} audit entries could not be written to {self.directory}: {e}')
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def stats(self) -> dict:
+        return {'directory': self.directory, 'queued': self._queue.qsize(), 'written': self.written,
+                'dropped': self.dropped, 'commits': self.commits, 'segments': self.segments, 'errors': self.errors}
+
+
+def options(audit_log: Union[str, Mapping[str, Any]]) -> Dict[str, Any]:
+    """
+    The arguments of the AuditLog, validated before any worker starts recording
+    :param audit_log: the directory or a mapping of the arguments of AuditLog,
+        e.g. {"directory": "audit", "policy": "block"}
+    """
+    kwargs = {'directory': audit_log} if isinstance(audit_log, str) else dict(audit_log)
+    try:
+        inspect.signature(AuditLog).bind(**kwargs)
+    except TypeError as e:
+        raise ValueError(f'invalid audit log options {kwargs}: {e}') from e
+    if kwargs.get('policy', 'drop') not in POLICIES:
+        raise ValueError(f'unknown audit policy {kwargs["policy"]}, please choose one of {POLICIES}!')
+    return kwargs
+
+
+def enable(directory: str, **kwargs) -> AuditLog:
+    """
+    Start recording the signed results of this process (see AuditLog for the arguments)
+    """
+    global enabled, _sink
+    disable()
+    _sink = AuditLog(directory, **kwargs).start()
+    enabled = True
+    return _sink
+
+
+def disable():
+    """
+    Stop recording, the queued entries are committed
+    """
+    global enabled, _sink
+    enabled = False
+    sink, _sink = _sink, None
+    if sink is not None:
+        sink.close()
+
+
+def record(rule: str, input_data: Any, signatures: dict):
+    """
+    Record a signed result, to be called if enabled only
+    :param input_data: the (serialized) input or its hash
+    """
+    sink = _sink
+    if sink is not None:
+        sink.submit(rule, input_data, signatures)
+
+
+def stats() -> Optional[dict]:
+    sink = _sink
+    return None if sink is None else sink.stats()
+
+
+def segments(directory: str) -> List[str]:
+    """
+    :return: the paths of the segments in the order they have been started
+    """
+    names = sorted(name for name in os.listdir(directory) if name.startswith('audit-') and name.endswith('.jsonl'))
+    return [os.path.join(directory, name) for name in names]
+
+
+def read(directory: str, input_hash: Optional[str] = None, rule: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    The entries of all segments, optionally only those of the input hash and of the rule
+    A partially written last line (e.g. after a crash) is skipped
+    """
+    needle = input_hash.encode() if input_hash else None
+    for path in segments(directory):
+        with open(path, 'rb') as stream:
+            for line in stream:
+                if needle is not None and needle not in line:  # cheap filter before parsing
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if (input_hash is None or entry.get('input') == input_hash) and \
+                        (rule is None or entry.get('rule') == rule):
+                    yield entry
+
+
+def _collect() -> List[str]:
+    current = stats()
+    if current is None:
+        return []
+    lines = []
+    for metric, kind, help_text, key in (
+            ('queued', 'gauge', 'Number of audit entries waiting for the writer', 'queued'),
+            ('written_total', 'counter', 'Number of audit entries written', 'written'),
+            ('dropped_total', 'counter', 'Number of audit entries dropped (queue full or write error)', 'dropped'),
+            ('commits_total', 'counter', 'Number of batches committed (fsync)', 'commits')):
+        lines += [f'# HELP datpro_audit_{metric} {help_text}', f'# TYPE datpro_audit_{metric} {kind}',
+                  f'datpro_audit_{metric} {current[key]}']
+    return lines
+
+
+instrumentation.register_collector(_collect)
+
@@ -0,0 +1,33 @@
+"""
+Look up the entries of the audit log (see Framework.audit) by input, e.g.
+    python -m Framework.audit_reader <directory> <input hash> [--rule <name>]
+    python -m Framework.audit_reader <directory> --input '{"x": 1.0, "y": 2.0}'
+The entries found are printed as json lines, the exit status is 1 if there are none.
+"""
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+import Framework.audit as audit
+from Framework.cache import json_hash
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m Framework.audit_reader',
+                                     description='Look up audit entries by input')
+    parser.add_argument('directory', help='the directory of the segments')
+    parser.add_argument('input_hash', nargs='?', help='the hash of the input (json_hash)')
+    parser.add_argument('--input', help='the input as json (as in the signed response), instead of its hash')
+    parser.add_argument('--rule', help='only the entries of this rule')
+    args = parser.parse_args(argv)
+    input_hash = json_hash(json.loads(args.input)) if args.input else args.input_hash
+    found = 0
+    for entry in audit.read(args.directory, input_hash, args.rule):
+        print(json.dumps(entry))
+        found += 1
+    return 0 if found else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
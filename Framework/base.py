@@ -1,6 +1,6 @@
 from typing import TypeVar, Generic, Optional, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from pydantic.generics import GenericModel
 
 
@@ -18,6 +18,16 @@ class InternalException(BaseModel):
         return cls(msg=str(e), exception_type=type(e).__name__)
 
 
+class TracedModel(BaseModel):
+    """
+    The base of the traceable (and signed) response models
+    The json produced when signing is kept, so that it can be written to the response without serializing again,
+    along with the hash of the canonical json that has been signed
+    """
+    _body: Optional[bytes] = PrivateAttr(default=None)
+    _hash: Optional[str] = PrivateAttr(default=None)
+
+
 InModel = TypeVar('InModel', bound=BaseModel)
 OutModel = TypeVar('OutModel', bound=BaseModel)
 
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Type
+
+from canonicaljson import encode_canonical_json
+from pydantic import BaseModel
+
+from Framework.registry import PerRuleClass
+
+
+def json_hash(json_object: Any) -> str:
+    """
+    The hash of the canonical json representation, i.e. equal objects share the same hash
+    """
+    return hashlib.sha256(encode_canonical_json(json_object)).hexdigest()
+
+
+def canonical_hash(model: BaseModel) -> str:
+    """
+    The hash of the canonical json representation of a model, i.e. equal inputs share the same hash
+    """
+    return json_hash(model.dict())
+
+
+class LRUCache(PerRuleClass):
+    """
+    A thread safe cache with least recently used eviction.
+    Entries older than ttl (in seconds) are considered as expired, ttl=None keeps them until they are evicted.
+    The cache of a rule (LRUCache.of) is shared by all of its instances.
+    """
+    _missing = object()
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_rule_class(cls, rule_class: Type) -> 'LRUCache':
+        return cls(max_size=rule_class.cache_size, ttl=rule_class.cache_ttl)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, self._missing)
+            if entry is not self._missing and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                entry = self._missing
+            if entry is self._missing:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {'size': len(self), 'max_size': self.max_size, 'ttl': self.ttl, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations}
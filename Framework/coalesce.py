@@ -0,0 +1,144 @@
+"""
+Request coalescing (single flight): while a calculation for a key is in flight,
+identical concurrent calls wait for its result instead of calculating on their own.
+
+Only the result of the calculation and the exceptions raised by it are shared with the waiting calls.
+Failures of the request of the leader, i.e. its cancellation (e.g. the client disconnected) and its deadline, are not:
+the flight is abandoned and one of the waiting calls calculates it instead (as new leader).
+Each waiting call waits until its own deadline at most.
+"""
+import asyncio
+import concurrent.futures
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple, Type
+
+import Framework.deadline as deadline
+import Framework.instrumentation as instrumentation
+from Framework.deadline import DeadlineExceeded
+from Framework.registry import PerRuleClass
+
+_flights = weakref.WeakSet()
+_ABANDONED = object()  # the result of a flight, whose leader has been cancelled or has exceeded its deadline
+
+
+def _shared(exception: BaseException) -> bool:
+    """
+    Whether the exception has been raised by the calculation, rather than being specific to the request of the leader
+    """
+    return isinstance(exception, Exception) and not isinstance(exception, DeadlineExceeded)
+
+
+class SingleFlight(PerRuleClass):
+    """
+    A thread safe registry of the calculations in flight, that is shared by threads and event loops alike
+    The calculations in flight of a rule (SingleFlight.of) are shared by all of its instances.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, Future] = dict()
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        _flights.add(self)
+
+    @classmethod
+    def from_rule_class(cls, rule_class: Type) -> 'SingleFlight':
+        return cls(rule_class.__name__)
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        :return: the future of the calculation in flight and whether the caller has to calculate it (leader)
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._in_flight[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def _land(self, key: Hashable, future: Future, result: Any = None, exception: BaseException = None):
+        with self._lock:
+            del self._in_flight[key]
+        if exception is None:
+            future.set_result(result)
+        elif _shared(exception):
+            future.set_exception(exception)
+        else:  # the waiting calls take over
+            future.set_result(_ABANDONED)
+
+    def _deadline_exceeded(self) -> DeadlineExceeded:
+        return DeadlineExceeded(f'The deadline of the request has passed while waiting for {self.name} in flight')
+
+    def _wait(self, future: Future) -> Any:
+        remaining = deadline.remaining()
+        if remaining is not None:
+            concurrent.futures.wait([future], timeout=max(remaining, 0.))
+            if not future.done():
+                raise self._deadline_exceeded()
+        return future.result()
+
+    async def _await(self, future: Future) -> Any:
+        # shielded, the future is shared with the other calls and must not be cancelled along with this one
+        waiting = asyncio.shield(asyncio.wrap_future(future))
+        remaining = deadline.remaining()
+        if remaining is None:
+            return await waiting
+        try:
+            return await asyncio.wait_for(waiting, max(remaining, 0.))
+        except asyncio.TimeoutError:
+            if future.done():  # the calculation itself has raised a TimeoutError
+                return future.result()
+            raise self._deadline_exceeded() from None
+
+    def call(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            result = self._wait(future)
+            if result is not _ABANDONED:
+                return result
+        try:
+            result = fn()
+        except BaseException as e:
+            self._land(key, future, exception=e)
+            raise
+        self._land(key, future, result)
+        return result
+
+    async def acall(self, key: Hashable, fn: Callable[[], Awaitable]) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            result = await self._await(future)
+            if result is not _ABANDONED:
+                return result
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._land(key, future, exception=e)
+            raise
+        self._land(key, future, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'leaders': self.leaders, 'coalesced': self.coalesced, 'in_flight': len(self._in_flight)}
+
+
+def _collect() -> List[str]:
+    totals = dict()
+    for flight in list(_flights):
+        totals[flight.name] = totals.get(flight.name, 0) + flight.coalesced
+    return ['# HELP datpro_coalesced_calls_total Number of calls that waited for an identical calculation in flight',
+            '# TYPE datpro_coalesced_calls_total counter'] + \
+           [f'datpro_coalesced_calls_total{{rule="{name}"}} {total}' for name, total in sorted(totals.items())]
+
+
+instrumentation.register_collector(_collect)
@@ -0,0 +1,162 @@
+"""
+Request deadlines, which propagate through the traced sub calls of stacks.
+
+The deadline of a request is the earliest of the X-Deadline header (unix time in seconds), the X-Timeout header
+(seconds) and the default timeout of the requested rule (timeout = seconds, None = no deadline).
+It is kept in a context variable, i.e. it applies to all sub calls of the request, also to those in the threadpool.
+Once the deadline has passed, no further (sub) calculation is started, instead a DeadlineExceeded is raised, which the
+error handler responds with 504. Async calculations in flight are cancelled on the deadline, synchronous ones cannot be
+interrupted: they finish, but their stack stops right after.
+
+The compute saved that way is estimated per rule by its skipped calls times their mean duration (plus the remaining
+mean duration of the cancelled ones).
+"""
+import asyncio
+import contextlib
+import threading
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Dict, List, Optional
+
+from fastapi import Header
+
+import Framework.instrumentation as instrumentation
+from Framework.headers import context_header
+
+_deadline: ContextVar[Optional[float]] = ContextVar('deadline', default=None)  # time.monotonic() of the deadline
+_lock = threading.Lock()
+_stats: Dict[str, list] = dict()  # rule -> [calls, seconds, skipped, cancelled, saved seconds]
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _at(timeout: Optional[float], x_deadline: Optional[float], x_timeout: Optional[float]) -> Optional[float]:
+    now = time.monotonic()
+    candidates = [now + seconds for seconds in (timeout, x_timeout) if seconds is not None]
+    if x_deadline is not None:
+        candidates.append(now + x_deadline - time.time())
+    return min(candidates) if candidates else None
+
+
+def start(timeout: Optional[float] = None, x_deadline: Optional[float] = None, x_timeout: Optional[float] = None):
+    """
+    Set the deadline of the current request (context)
+    :param timeout: the default timeout of the rule in seconds
+    :param x_deadline: the deadline requested by the client as unix time in seconds
+    :param x_timeout: the timeout requested by the client in seconds
+    """
+    _deadline.set(_at(timeout, x_deadline, x_timeout))
+
+
+def header(timeout: Optional[float] = None):
+    """
+    :return: the dependency to set the deadline of a request to the rule with the given default timeout
+    """
+    @context_header(_deadline)
+    def deadline_header(x_deadline: Optional[float] = Header(None), x_timeout: Optional[float] = Header(None)):
+        return _at(timeout, x_deadline, x_timeout)
+
+    return deadline_header
+
+
+def remaining() -> Optional[float]:
+    """
+    :return: the seconds left until the deadline of the current request, None if there is no deadline
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _entry(name: str) -> list:
+    entry = _stats.get(name)
+    if entry is None:
+        entry = _stats[name] = [0, 0., 0, 0, 0.]
+    return entry
+
+
+def _mean(entry: list) -> float:
+    return entry[1] / entry[0] if entry[0] else 0.
+
+
+def _exceeded(name: str, elapsed: Optional[float] = None) -> DeadlineExceeded:
+    """
+    Account for a skipped (elapsed is None) or a cancelled calculation
+    """
+    with _lock:
+        entry = _entry(name)
+        if elapsed is None:
+            entry[2] += 1
+            entry[4] += _mean(entry)
+        else:
+            entry[3] += 1
+            entry[4] += max(_mean(entry) - elapsed, 0.)
+    return DeadlineExceeded(f'The deadline of the request has passed, '
+                            f'{name} has been {"skipped" if elapsed is None else "cancelled"}')
+
+
+def _observe(name: str, seconds: float):
+    with _lock:
+        entry = _entry(name)
+        entry[0] += 1
+        entry[1] += seconds
+
+
+@contextlib.contextmanager
+def guard(name: str):
+    """
+    Raise a DeadlineExceeded instead of starting the calculation if the deadline has passed already
+    """
+    deadline = _deadline.get()
+    started = time.monotonic()
+    if deadline is not None and started >= deadline:
+        raise _exceeded(name)
+    yield
+    _observe(name, time.monotonic() - started)
+
+
+async def wait(awaitable: Awaitable, name: str):
+    """
+    Await the calculation, but cancel it on the deadline
+    """
+    seconds = remaining()
+    if seconds is None:
+        return await awaitable
+    started = time.monotonic()
+    try:
+        return await asyncio.wait_for(awaitable, max(seconds, 0.))
+    except asyncio.TimeoutError:
+        raise _exceeded(name, time.monotonic() - started) from None
+
+
+def stats() -> Dict[str, dict]:
+    """
+    :return: per rule, the completed calls and their mean duration, the skipped and cancelled calls
+        as well as the estimated seconds saved
+    """
+    with _lock:
+        return {name: {'calls': entry[0], 'mean_seconds': _mean(entry), 'skipped': entry[2], 'cancelled': entry[3],
+                       'saved_seconds': entry[4]} for name, entry in sorted(_stats.items())}
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def _collect() -> List[str]:
+    current = stats()
+    lines = []
+    for metric, kind, help_text, key in (
+            ('skipped_calls_total', 'counter', 'Number of calculations not started as the deadline had passed',
+             'skipped'),
+            ('cancelled_calls_total', 'counter', 'Number of async calculations cancelled on the deadline', 'cancelled'),
+            ('saved_seconds_total', 'counter', 'Estimated compute saved by skipping and cancelling calculations',
+             'saved_seconds')):
+        lines += [f'# HELP datpro_deadline_{metric} {help_text}', f'# TYPE datpro_deadline_{metric} {kind}']
+        lines += [f'datpro_deadline_{metric}{{rule="{name}"}} {values[key]}' for name, values in current.items()]
+    return lines
+
+
+instrumentation.register_collector(_collect)
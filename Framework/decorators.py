@@ -1,22 +1,35 @@
+import asyncio
 import enum
 import functools
 import inspect
 from abc import ABC, abstractmethod
-from typing import Callable, Type, OrderedDict, Any
+from contextvars import ContextVar
+from typing import Callable, Type, OrderedDict, Any, List, Optional
 
 from fastapi import Depends, Header
 from fastapi.encoders import jsonable_encoder
 from pydantic import create_model
-from signedjson.key import generate_signing_key
 from signedjson.sign import sign_json
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 
+import Framework.audit as audit
+import Framework.deadline as deadline
+import Framework.instrumentation as instrumentation
+import Framework.keys as keys
+import Framework.process as process
 import Framework.warnings as warnings
 from Framework import ABCEndpoint
-from Framework.base import InternalException, CalculationModel, InModel
+from Framework.base import InternalException, CalculationModel, InModel, TracedModel
+from Framework.cache import LRUCache, canonical_hash
+from Framework.coalesce import SingleFlight
+from Framework.deadline import DeadlineExceeded
+from Framework.headers import context_header
+from Framework.merkle import merkle_digest, node_hash
+from Framework.negotiation import accept_header, binary_media_type, binary_response
+from Framework.serialization import serialize, sign_canonical, encode_json, PreEncodedJSONResponse
 
 
-SIGNING_KEY = generate_signing_key('test')
+SIGNING_KEY = keys.load_signing_key()
 
 
 def _serialize_warning_header(wng_list):
@@ -27,6 +40,48 @@ def _serialize_warning_header(wng_list):
     return header_str
 
 
+def _warning_messages(wng_list):
+    return [x.message.args[0] for x in wng_list]
+
+
+def _replay_warnings(list_wng):
+    """
+    Raise recorded warnings again, e.g. so that they cascade up to the warning handler
+    """
+    warnings.replay(list_wng)
+
+
+def _is_traced_stack(original_class: ABCEndpoint) -> bool:
+    return any(name == 'traceable_stack' for name, _, _ in original_class.vault)
+
+
+def _dependencies_key(endpoint: ABCEndpoint) -> tuple:
+    """
+    The sub calculations a stack instance has been built with (e.g. injected via its constructor), recursively
+    """
+    dependencies = getattr(getattr(endpoint, 'tracer', None), 'dependencies', ())
+    return tuple(sorted((dependency.name, type(dependency).__module__, type(dependency).__qualname__,
+                         _dependencies_key(dependency)) for dependency in dependencies))
+
+
+def _calculation_key(input_model: InModel, traced_stack: Optional[ABCEndpoint]):
+    """
+    The key of a calculation (canonical hash of the input), the responses of stacks depend on the trace level and
+    on the sub calculations of the stack instance as well, as the cache and the flights are shared by all instances
+    """
+    key = canonical_hash(input_model)
+    if traced_stack is not None:
+        return key, StackTraceabilityHandler._trace_level.get().value, _dependencies_key(traced_stack)
+    return key
+
+
+def _is_async(fn: Callable) -> bool:
+    """
+    A (decorated) calculation has to be awaited if it is a coroutine function or decorates one
+    """
+    return inspect.iscoroutinefunction(fn) or getattr(fn, 'is_async', False)
+
+
 class DATProDecorator(ABC):
 
     def __init__(self, original_class: ABCEndpoint):
@@ -39,6 +94,8 @@ class DATProDecorator(ABC):
         # for x in functools.WRAPPER_ASSIGNMENTS:
         #     print((x, getattr(fn, x)))
         functools.update_wrapper(self, fn, updated=['__annotations__'])
+        # async calculations (async def calculate) are awaited throughout the whole chain of decorators
+        self.is_async = _is_async(fn)
 
     @property
     def name(self):
@@ -50,45 +107,162 @@ class DATProDecorator(ABC):
 
     @property
     def original_callable(self) -> Callable:
+        if instrumentation.enabled and not isinstance(self._original_callable, DATProDecorator):
+            return self._timed_original
         return self._original_callable
 
-    @abstractmethod
+    @functools.cached_property
+    def layer(self) -> str:
+        """
+        The name of the decorator in the vault of the original class
+        """
+        return next((name for name, _, fn in self.original_class.vault if fn is self), self.name)
+
     def __call__(self, input_model: InModel, **kwargs):
+        """
+        Depending on the decorated function, either the result or an awaitable is returned
+        """
+        if instrumentation.enabled:
+            return self._timed_call(self._acall if self.is_async else self._call, self.layer, input_model, **kwargs)
+        if self.is_async:
+            return self._acall(input_model, **kwargs)
+        return self._call(input_model, **kwargs)
+
+    def _timed_original(self, input_model: InModel, **kwargs):
+        # the innermost decorator times the calculation itself
+        return self._timed_call(self._original_callable, 'calculate', input_model, **kwargs)
+
+    def _timed_call(self, fn: Callable, layer: str, input_model: InModel, **kwargs):
+        timer = instrumentation.timer(self.original_class.name, layer)
+        if self.is_async:
+            async def timed():
+                with timer:
+                    return await fn(input_model, **kwargs)
+
+            return timed()
+        with timer:
+            return fn(input_model, **kwargs)
+
+    @abstractmethod
+    def _call(self, input_model: InModel, **kwargs):
+        pass
+
+    @abstractmethod
+    async def _acall(self, input_model: InModel, **kwargs):
         pass
 
 
 class RuleErrorHandler(DATProDecorator):
 
-    def __call__(self, input_model: InModel, **kwargs):
+    @staticmethod
+    def _error_response(e: Exception, status_code: Optional[int] = None):
+        if status_code is None:  # a passed deadline is not the fault of the content owner
+            status_code = 504 if isinstance(e, DeadlineExceeded) else 567
+        content = jsonable_encoder(InternalException.from_exception(e))
+        media_type = binary_media_type()
+        if media_type is not None:
+            return binary_response(content, media_type, status_code=status_code)
+        return JSONResponse(status_code=status_code, content=content)
+
+    def _call(self, input_model: InModel, **kwargs):
         try:
             res = self.original_callable(input_model, **kwargs)
         except Exception as e:  # catch exceptions in the content owner routine
-            return JSONResponse(status_code=567, content=jsonable_encoder(InternalException.from_exception(e)))
+            return self._error_response(e)
+        return res
+
+    async def _acall(self, input_model: InModel, **kwargs):
+        try:
+            res = await self.original_callable(input_model, **kwargs)
+        except Exception as e:  # catch exceptions in the content owner routine
+            return self._error_response(e)
         return res
 
 
 class RuleWarningHandler(DATProDecorator):
+    """
+    This decorator collects the warnings of the calculation (see Framework.warnings) and provides them as header.
+    The client may choose the log level via the X-Log-Level header (per request): warnings are collected and
+    serialized at the levels debug (default) and info, they are discarded at the level ignore.
+    """
 
     class LogLevels(enum.Enum):
         debug = "debug"
         info = "info"
         ignore = "ignore"
 
-    def warning_level_header(self, x_log_level: LogLevels = Header(LogLevels.debug)):
-        self._level = x_log_level
+    _log_level = ContextVar('log_level', default=LogLevels.debug)
+
+    @classmethod
+    def set_log_level(cls, level: LogLevels):
+        cls._log_level.set(level)
+
+    @staticmethod
+    @context_header(_log_level)
+    def warning_level_header(x_log_level: LogLevels = Header(LogLevels.debug)):
+        return x_log_level
+
+    @classmethod
+    def collecting(cls) -> bool:
+        """
+        Whether the warnings of the current request are collected
+        """
+        return cls._log_level.get() is not cls.LogLevels.ignore
 
     def __init__(self, original_class: ABCEndpoint):
         super().__init__(original_class)
-        original_class.update_endpoint_kwargs(dependencies=[Depends(self.warning_level_header)])
+        original_class.add_endpoint_dependency(Depends(self.warning_level_header))
+
+    @staticmethod
+    def _respond(response_content, list_wng):
+        wng_header = None
+        if list_wng:  # Add custom header if warnings have been recorded
+            wng_header = {'X-DATPro-Warnings': _serialize_warning_header(list_wng)}
+        if isinstance(response_content, Response):  # e.g. the error response of a stack
+            if wng_header:
+                response_content.headers.update(wng_header)
+            return response_content
+        media_type = binary_media_type()
+        if media_type is not None:  # the client accepts a binary format (content negotiation)
+            content = serialize(response_content) if isinstance(response_content, TracedModel) else \
+                jsonable_encoder(response_content)
+            return binary_response(content, media_type, headers=wng_header)
+        if isinstance(response_content, TracedModel):
+            # usually, the json has been produced when signing already
+            body = response_content._body
+            if body is None:
+                body = encode_json(serialize(response_content))
+            return PreEncodedJSONResponse(content=body, headers=wng_header)
+        if wng_header:
+            return JSONResponse(content=jsonable_encoder(response_content), headers=wng_header)
+        return response_content
 
-    def __call__(self, input_model: InModel, **kwargs):
-        print(self._level)
-        with warnings.catch_warnings(record=True) as list_wng:
+    def _call(self, input_model: InModel, **kwargs):
+        with warnings.collect(self.collecting()) as list_wng:
             response_content = self.original_callable(input_model, **kwargs)
-            if list_wng:  # Add custom header if warnings have been recorded
-                wng_header = {'X-DATPro-Warnings': _serialize_warning_header(list_wng)}
-                return JSONResponse(content=jsonable_encoder(response_content), headers=wng_header)
-            return response_content
+        return self._respond(response_content, list_wng)
+
+    async def _acall(self, input_model: InModel, **kwargs):
+        with warnings.collect(self.collecting()) as list_wng:
+            response_content = await self.original_callable(input_model, **kwargs)
+        return self._respond(response_content, list_wng)
+
+
+class RuleProcessHandler(DATProDecorator):
+    """
+    This decorator is used to run the calculate function of CPU bound rules in the process pool (executor = "process").
+    Warnings raised in the worker process are raised again, exceptions are re-raised by the pool.
+    """
+
+    def _call(self, input_model: InModel, **kwargs):
+        output, list_wng = process.submit(type(self.original_class), input_model).result()
+        _replay_warnings(list_wng)
+        return output
+
+    async def _acall(self, input_model: InModel, **kwargs):
+        output, list_wng = await asyncio.wrap_future(process.submit(type(self.original_class), input_model))
+        _replay_warnings(list_wng)
+        return output
 
 
 class RuleTraceabilityHandler(DATProDecorator):
@@ -97,20 +271,39 @@ class RuleTraceabilityHandler(DATProDecorator):
         sg = inspect.signature(fn)
         return_type_before = sg.return_annotation
         super().__init__(original_class)
-        self.return_type = create_model(f'{name}Response', input=(sg.parameters['input_model'].annotation, ...),
+        self.return_type = create_model(f'{name}Response', __base__=TracedModel,
+                                        input=(sg.parameters['input_model'].annotation, ...),
                                         output=(return_type_before, ...))
 
-    def __call__(self, input_model: InModel, **kwargs):
+    def _call(self, input_model: InModel, **kwargs):
         res = self.original_callable(input_model, **kwargs)
-        response_content = self.return_type(input=input_model, output=res)
-        return response_content
+        return self.trace(input_model, res)
+
+    async def _acall(self, input_model: InModel, **kwargs):
+        res = await self.original_callable(input_model, **kwargs)
+        return self.trace(input_model, res)
+
+    def trace(self, input_model: InModel, output):
+        return self.return_type(input=input_model, output=output)
 
 
 class RuleSignedHandler(DATProDecorator):
-    def __call__(self, input_model: InModel, **kwargs):
+    def _call(self, input_model: InModel, **kwargs):
         res = self.original_callable(input_model, **kwargs)
-        sig = sign_json(res.dict(), self.original_class.owner, SIGNING_KEY)
-        return self.return_type(**sig)
+        return self.sign(res)
+
+    async def _acall(self, input_model: InModel, **kwargs):
+        res = await self.original_callable(input_model, **kwargs)
+        return self.sign(res)
+
+    def sign(self, res):
+        content = serialize(res)
+        signatures, body, content_hash = sign_canonical(content, self.original_class.owner, SIGNING_KEY)
+        if audit.enabled:
+            audit.record(self.original_class.name, content['input'], signatures)
+        signed = self.return_type(**content, signatures=signatures)
+        signed._body, signed._hash = body, content_hash
+        return signed
 
     def __init__(self, original_class: ABCEndpoint, traceable_model: Type[CalculationModel]):
         self.return_type = create_model(traceable_model.__name__,
@@ -119,6 +312,103 @@ class RuleSignedHandler(DATProDecorator):
         super().__init__(original_class)
 
 
+class MerkleSignedHandler(RuleSignedHandler):
+    """
+    This decorator is used to sign stacks in merkle mode (see Framework.merkle).
+    Only a compact digest of the input, the output and the hashes of the (already signed) intermediates is signed,
+    instead of canonicalizing and signing the whole nested response once per nesting level.
+    """
+    def __init__(self, original_class: ABCEndpoint, traceable_model: Type[CalculationModel]):
+        super().__init__(original_class, traceable_model)
+        self.return_type = create_model(traceable_model.__name__, __base__=self.return_type, digest=(dict, ...))
+
+    def sign(self, res):
+        intermediates = getattr(res, 'intermediates', None)
+        digest = merkle_digest(serialize(res.input), serialize(res.output), intermediates)
+        sig = sign_json({'digest': digest}, self.original_class.owner, SIGNING_KEY)
+        if audit.enabled:
+            audit.record(self.original_class.name, digest['input'], sig['signatures'])
+        return self.return_type(input=res.input, intermediates=intermediates, output=res.output, digest=digest,
+                                signatures=sig['signatures'])
+
+
+class RuleCacheHandler(DATProDecorator):
+    """
+    This decorator is used to memoize the signed responses of deterministic calculations (opt-in via cacheable).
+    The cache key is the canonical hash of the input model (see _calculation_key).
+    Warnings raised during the calculation are stored along with the response and raised again on each cache hit,
+    so that they still cascade up to the warning handler.
+    """
+
+    def __init__(self, original_class: ABCEndpoint, cache: LRUCache):
+        super().__init__(original_class)
+        self.cache = cache
+        self._traced_stack = original_class if _is_traced_stack(original_class) else None
+
+    def _lookup(self, input_model: InModel):
+        key = _calculation_key(input_model, self._traced_stack)
+        entry = self.cache.get(key)
+        if entry is not None:
+            _replay_warnings(entry[1])
+        return key, entry
+
+    def _store(self, key, res, list_wng):
+        self.cache.put(key, (res, list_wng))
+        _replay_warnings(list_wng)
+        return res
+
+    def _call(self, input_model: InModel, **kwargs):
+        key, entry = self._lookup(input_model)
+        if entry is not None:
+            return entry[0]
+        with warnings.collect() as list_wng:
+            res = self.original_callable(input_model, **kwargs)
+        return self._store(key, res, list_wng)
+
+    async def _acall(self, input_model: InModel, **kwargs):
+        key, entry = self._lookup(input_model)
+        if entry is not None:
+            return entry[0]
+        with warnings.collect() as list_wng:
+            res = await self.original_callable(input_model, **kwargs)
+        return self._store(key, res, list_wng)
+
+
+class RuleCoalescingHandler(DATProDecorator):
+    """
+    This decorator is used to coalesce identical concurrent calls (opt-in via coalesce).
+    While a signed response is calculated for a canonical input hash, identical calls wait for it.
+    Warnings raised during the calculation are provided to each waiter along with the response.
+    """
+
+    def __init__(self, original_class: ABCEndpoint, flights: SingleFlight):
+        super().__init__(original_class)
+        self.flights = flights
+        self._traced_stack = original_class if _is_traced_stack(original_class) else None
+
+    def _calculate(self, input_model: InModel, **kwargs):
+        with warnings.collect() as list_wng:
+            res = self.original_callable(input_model, **kwargs)
+        return res, list_wng
+
+    async def _acalculate(self, input_model: InModel, **kwargs):
+        with warnings.collect() as list_wng:
+            res = await self.original_callable(input_model, **kwargs)
+        return res, list_wng
+
+    def _call(self, input_model: InModel, **kwargs):
+        res, list_wng = self.flights.call(_calculation_key(input_model, self._traced_stack),
+                                          lambda: self._calculate(input_model, **kwargs))
+        _replay_warnings(list_wng)
+        return res
+
+    async def _acall(self, input_model: InModel, **kwargs):
+        res, list_wng = await self.flights.acall(_calculation_key(input_model, self._traced_stack),
+                                                 lambda: self._acalculate(input_model, **kwargs))
+        _replay_warnings(list_wng)
+        return res
+
+
 class StackTraceabilityHandler(DATProDecorator):
     """
     This function is used to decorate the calculate function of subclasses of ABCStack.
@@ -126,24 +416,248 @@ class StackTraceabilityHandler(DATProDecorator):
         **as well as intermediate data/nested calls** to the response model
 
     The decorated function is expected to **exactly** one keyword argument "input_model"
-    Before the decorated function is called, the tracer result is cleaned up.
+    Before the decorated function is called, the tracer result is cleaned up (for the current request only).
+
+    The client may choose the trace level of the response via the X-Trace-Level header:
+     - full: the intermediates are embedded as they are (default)
+     - hashes: each intermediate is replaced by its hash (see Framework.merkle.node_hash)
+     - none: the intermediates are left out
+    The response is signed as it is sent, i.e. it can be verified at each level.
+    The trace level applies to the requested stack only, nested stacks are traced in full (and hashed as such).
     """
 
+    class TraceLevels(enum.Enum):
+        full = "full"
+        hashes = "hashes"
+        none = "none"
+
+    _trace_level = ContextVar('trace_level', default=TraceLevels.full)
+
+    @staticmethod
+    @context_header(_trace_level)
+    def trace_level_header(x_trace_level: TraceLevels = Header(TraceLevels.full)):
+        return x_trace_level
+
     def __init__(self, original_class: ABCEndpoint, tracer):
         self.tracer = tracer
         fn = original_class.vault[-1][-1]
         sg = inspect.signature(fn)
         return_type = sg.return_annotation
-        dyn_res_model = create_model(f'{tracer.stack.name}Response',
+        dyn_res_model = create_model(f'{tracer.stack.name}Response', __base__=TracedModel,
                                      input=(sg.parameters['input_model'].annotation, ...),
-                                     intermediates=(OrderedDict[str, Any], ...),
+                                     intermediates=(Optional[OrderedDict[str, Any]], None),
                                      output=(return_type, ...))
         self.return_type = dyn_res_model
         super().__init__(original_class)
+        original_class.add_endpoint_dependency(Depends(self.trace_level_header))
 
-    def __call__(self, input_model: InModel, **kwargs):
+    def _call(self, input_model: InModel, **kwargs):
         self.tracer.reset()  # Clean tracer
-        output = self.original_callable(input_model=input_model, **kwargs)
-        if self.tracer.intermediates:
-            return self.return_type(input=input_model, output=output, intermediates=self.tracer.intermediates)
-        return self.return_type(input=input_model, output=output)
+        token = self._trace_level.set(self.TraceLevels.full)  # for the nested stacks
+        try:
+            output = self.original_callable(input_model=input_model, **kwargs)
+        finally:
+            self._trace_level.reset(token)
+        return self.trace(input_model, output, self._trace_level.get())
+
+    async def _acall(self, input_model: InModel, **kwargs):
+        self.tracer.reset()  # Clean tracer
+        token = self._trace_level.set(self.TraceLevels.full)  # for the nested stacks
+        try:
+            output = await self.original_callable(input_model=input_model, **kwargs)
+        finally:
+            self._trace_level.reset(token)
+        return self.trace(input_model, output, self._trace_level.get())
+
+    def trace(self, input_model: InModel, output, level: TraceLevels = TraceLevels.full):
+        intermediates = self.tracer.intermediates
+        if not intermediates or level is self.TraceLevels.none:
+            return self.return_type(input=input_model, output=output)
+        if level is self.TraceLevels.hashes:
+            intermediates = OrderedDict[str, Any]((name, node_hash(node)) for name, node in intermediates.items())
+        return self.return_type(input=input_model, output=output, intermediates=intermediates)
+
+
+class RuleCompiledHandler(DATProDecorator):
+    """
+    This decorator is the compiled counterpart of the traceable, signed, warning and error handling decorators of a rule.
+    They are run in a single pass: the validated input and output are signed and written to the response as they are,
+    without building (and validating again) the traceable and signed models in between.
+    The separate decorators are kept in the vault, e.g. for stacks and introspection.
+    """
+
+    def __init__(self, original_class: ABCEndpoint):
+        super().__init__(original_class)
+        layers = {name: fn for name, _, fn in original_class.vault}
+        self._original_callable = layers.get('process', layers['original'])
+        self.is_async = _is_async(self._original_callable)
+        self._output_type = inspect.signature(self._original_callable).return_annotation
+
+    def _respond(self, input_model: InModel, output, list_wng):
+        if not isinstance(output, self._output_type):  # trust instances of the output model only
+            output = self._output_type.validate(output)
+        content = {'input': serialize(input_model), 'output': serialize(output)}
+        signatures, body, _ = sign_canonical(content, self.original_class.owner, SIGNING_KEY)
+        if audit.enabled:
+            audit.record(self.original_class.name, content['input'], signatures)
+        headers = {'X-DATPro-Warnings': _serialize_warning_header(list_wng)} if list_wng else None
+        media_type = binary_media_type()
+        if media_type is not None:
+            return binary_response({**content, 'signatures': signatures}, media_type, headers=headers)
+        return PreEncodedJSONResponse(content=body, headers=headers)
+
+    def _call(self, input_model: InModel, **kwargs):
+        with warnings.collect(RuleWarningHandler.collecting()) as list_wng:
+            try:
+                output = self.original_callable(input_model, **kwargs)
+                return self._respond(input_model, output, list_wng)
+            except Exception as e:  # catch exceptions in the content owner routine
+                return RuleErrorHandler._error_response(e)
+
+    async def _acall(self, input_model: InModel, **kwargs):
+        with warnings.collect(RuleWarningHandler.collecting()) as list_wng:
+            try:
+                output = await self.original_callable(input_model, **kwargs)
+                return self._respond(input_model, output, list_wng)
+            except Exception as e:  # catch exceptions in the content owner routine
+                return RuleErrorHandler._error_response(e)
+
+
+class RuleBatchHandler(DATProDecorator):
+    """
+    This decorator is used to calculate a list of inputs within one request.
+    Each item is traced and signed on its own, warnings and errors are reported per item,
+    so that one bad input does not fail the whole batch.
+
+    If batch_callable is provided (e.g. a vectorized calculate_batch), the outputs are obtained in a single call
+    and decorated afterwards. Should this call fail, the items are calculated one by one to isolate the bad ones.
+    Likewise if it raises warnings, which do not name the items they concern (see Framework.warnings.warn).
+
+    The headers of the request (see request_dependencies) apply to each item: no item is started once the deadline
+    has passed, the error of such an item is a DeadlineExceeded. Hence, the items calculated in time are responded
+    rather than cancelling the whole batch on the deadline.
+    """
+    deadline_per_item = True
+
+    def __init__(self, original_class: ABCEndpoint, batch_callable: Optional[Callable] = None):
+        super().__init__(original_class)
+        self._batch_callable = batch_callable
+        self.is_async = self.is_async or _is_async(batch_callable)
+        layers = {name: fn for name, _, fn in original_class.vault}
+        self._signed = layers['signed']
+        self._traceable = layers.get('traceable')
+        self._item_callable = layers.get('coalesced', layers.get('cached', self._signed))
+        self.item_type = create_model(f'{original_class.name}BatchItem',
+                                      result=(Optional[self._signed.return_type], None),
+                                      warnings=(Optional[List[str]], None),
+                                      error=(Optional[InternalException], None))
+        self.return_type = List[self.item_type]
+        input_type = inspect.signature(original_class.vault[0][-1]).parameters['input_model'].annotation
+        self.__signature__ = inspect.Signature(
+            [inspect.Parameter('input_models', inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=List[input_type])],
+            return_annotation=self.return_type)
+
+    @staticmethod
+    def request_dependencies(timeout: Optional[float]) -> list:
+        """
+        The dependencies of the routes of batches and streams, which read the headers applying to each item
+        (log level, accept and deadline)
+        :param timeout: the default timeout of the rule
+        """
+        return [Depends(RuleWarningHandler.warning_level_header), Depends(accept_header),
+                Depends(deadline.header(timeout))]
+
+    def _calculate_item(self, input_model: InModel):
+        with warnings.collect(RuleWarningHandler.collecting()) as list_wng:
+            try:
+                with deadline.guard(self.original_class.name):
+                    result, error = self._item_callable(input_model=input_model), None
+            except Exception as e:  # catch exceptions in the content owner routine
+                result, error = None, InternalException.from_exception(e)
+        return self.item_type(result=result, error=error, warnings=_warning_messages(list_wng) or None)
+
+    async def _acalculate_item(self, input_model: InModel):
+        with warnings.collect(RuleWarningHandler.collecting()) as list_wng:
+            try:
+                with deadline.guard(self.original_class.name):
+                    result = await deadline.wait(self._item_callable(input_model=input_model),
+                                                 self.original_class.name)
+                    error = None
+            except Exception as e:  # catch exceptions in the content owner routine
+                result, error = None, InternalException.from_exception(e)
+        return self.item_type(result=result, error=error, warnings=_warning_messages(list_wng) or None)
+
+    @property
+    def item_is_async(self) -> bool:
+        return self._item_callable.is_async
+
+    def calculate_item(self, input_model: InModel):
+        """
+        Calculate a single item, an awaitable is returned if the item is calculated asynchronously
+        """
+        if self.item_is_async:
+            return self._acalculate_item(input_model)
+        return self._calculate_item(input_model)
+
+    def _decorate_vectorized(self, input_models: List[InModel], outputs, list_wng):
+        if len(outputs) != len(input_models):  # the items are calculated one by one instead
+            return None
+        item_warnings = [[] for _ in input_models]
+        for wng in list_wng:
+            indices = getattr(wng, 'items', None)
+            if indices is None or not all(0 <= index < len(input_models) for index in indices):
+                return None  # the warning cannot be attributed, hence the items are calculated one by one instead
+            for index in indices:
+                item_warnings[index].append(wng)
+        return [self.item_type(result=self._signed.sign(self._traceable.trace(input_model, output)),
+                               warnings=_warning_messages(item_wng) or None)
+                for input_model, output, item_wng in zip(input_models, outputs, item_warnings)]
+
+    def _calculate_vectorized(self, input_models: List[InModel]):
+        with warnings.collect() as list_wng:
+            try:
+                with deadline.guard(self.original_class.name):
+                    outputs = list(self._batch_callable(input_models))
+            except Exception:  # the bad inputs are isolated by calculating them one by one (or skipped on the deadline)
+                return None
+        return self._decorate_vectorized(input_models, outputs, list_wng)
+
+    async def _acalculate_vectorized(self, input_models: List[InModel]):
+        with warnings.collect() as list_wng:
+            try:
+                with deadline.guard(self.original_class.name):
+                    outputs = self._batch_callable(input_models)
+                    if inspect.isawaitable(outputs):
+                        outputs = await deadline.wait(outputs, self.original_class.name)
+                    outputs = list(outputs)
+            except Exception:  # the bad inputs are isolated by calculating them one by one (or skipped on the deadline)
+                return None
+        return self._decorate_vectorized(input_models, outputs, list_wng)
+
+    def __call__(self, input_models: List[InModel], **kwargs):
+        if self.is_async:
+            return self._acall(input_models)
+        return self._call(input_models)
+
+    @staticmethod
+    def _respond(items: list):
+        media_type = binary_media_type()
+        if media_type is not None:  # the client accepts a binary format (content negotiation)
+            return binary_response([serialize(item) for item in items], media_type)
+        return items
+
+    def _call(self, input_models: List[InModel], **kwargs):
+        if self._batch_callable is not None:
+            items = self._calculate_vectorized(input_models)
+            if items is not None:
+                return self._respond(items)
+        return self._respond([self._calculate_item(input_model) for input_model in input_models])
+
+    async def _acall(self, input_models: List[InModel], **kwargs):
+        if self._batch_callable is not None:
+            items = await self._acalculate_vectorized(input_models)
+            if items is not None:
+                return self._respond(items)
+        if self.item_is_async:
+            return self._respond([await self._acalculate_item(input_model) for input_model in input_models])
+        return self._respond([self._calculate_item(input_model) for input_model in input_models])
@@ -0,0 +1,115 @@
+import asyncio
+import contextvars
+import inspect
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel
+
+from Framework.abc.Endpoint import ABCEndpoint
+from Framework.abc.StackTracer import ABCStackTracer
+from Framework.decorators import _is_async
+
+
+class _Node(NamedTuple):
+    name: str
+    fn: Callable
+    inputs: Callable
+    depends_on: Tuple[str, ...]
+
+    def kwargs(self, results: Dict[str, BaseModel]) -> dict:
+        return {name: results[name] for name in self.depends_on}
+
+
+class StackGraph:
+    """
+    The graph is used to declare the sub calculations of a stack together with their data dependencies.
+    Independent sub calculations are run concurrently, so that the latency of a stack is given by its critical path
+    instead of the sum of all sub calculations.
+
+    Each sub calculation is added with a function that creates its input model.
+    The first argument of this function is the input model of the stack,
+    all further arguments are named after the dependencies whose (signed) results are needed, e.g.
+
+        graph.add(add, lambda input_model: input_model)
+        graph.add(subtract, lambda input_model, Add: InputModel(x=Add.output.z, y=input_model.y))
+
+    Stacks with an async calculate function run the graph on the event loop (graph.run has to be awaited),
+    otherwise a thread pool is used.
+    Once all sub calculations are done, the tracer records them in the order they have been added.
+    """
+
+    def __init__(self, tracer: ABCStackTracer, max_workers: Optional[int] = None):
+        self.tracer = tracer
+        self.max_workers = max_workers
+        self._nodes: List[_Node] = []
+        self._executor = None
+
+    @property
+    def is_async(self) -> bool:
+        return _is_async(self.tracer.stack.vault[0][-1])
+
+    def add(self, dependency: ABCEndpoint, inputs: Callable) -> 'StackGraph':
+        """
+        Add a sub calculation, which depends on the results named by the parameters of inputs (but the first one)
+        """
+        depends_on = tuple(inspect.signature(inputs).parameters)[1:]
+        known = {node.name for node in self._nodes}
+        if dependency.name in known:
+            raise KeyError(f'{dependency.name} has already been added to the graph of {self.tracer.stack.name}!')
+        unknown = set(depends_on) - known
+        if unknown:
+            raise KeyError(f'{dependency.name} depends on {unknown}, which have to be added to the graph first!')
+        self._nodes.append(_Node(dependency.name, self.tracer(dependency), inputs, depends_on))
+        return self
+
+    def run(self, input_model: BaseModel):
+        """
+        Calculate all sub calculations and return their results by name
+        """
+        if self.is_async:
+            return self._arun(input_model)
+        return self._run(input_model)
+
+    def _run(self, input_model: BaseModel) -> Dict[str, BaseModel]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix=f'{self.tracer.stack.name}Graph')
+        results, futures, pending = {}, {}, list(self._nodes)
+        try:
+            while pending or futures:
+                for node in [n for n in pending if all(d in results for d in n.depends_on)]:
+                    pending.remove(node)
+                    sub_input = node.inputs(input_model, **node.kwargs(results))
+                    # the sub calculations have to be recorded by the tracer of the current request (context)
+                    future = self._executor.submit(contextvars.copy_context().run, node.fn, sub_input)
+                    futures[future] = node
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures.pop(future).name] = future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+        return self._ordered(results)
+
+    async def _arun(self, input_model: BaseModel) -> Dict[str, BaseModel]:
+        tasks = {}
+
+        async def run_node(node: _Node):
+            results = {name: await tasks[name] for name in node.depends_on}
+            return await node.fn(node.inputs(input_model, **results))
+
+        # nodes are added after their dependencies, hence the awaited tasks do already exist
+        for node in self._nodes:
+            tasks[node.name] = asyncio.ensure_future(run_node(node))
+        try:
+            results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return self._ordered(results)
+
+    def _ordered(self, results: Dict[str, BaseModel]) -> Dict[str, BaseModel]:
+        names = [node.name for node in self._nodes]
+        self.tracer.order(names)
+        return {name: results[name] for name in names}
@@ -0,0 +1,27 @@
+"""
+Request headers, which apply to the whole request including all sub calls (e.g. the log level or the deadline),
+are kept in context variables, which are set by a dependency of the endpoints.
+"""
+import functools
+from contextvars import ContextVar
+from typing import Any, Callable
+
+
+def context_header(variable: ContextVar) -> Callable[[Callable[..., Any]], Callable]:
+    """
+    Decorator turning a function of request headers into a dependency, which sets the context variable to its result
+        @context_header(_media_type)
+        def accept_header(accept: Optional[str] = Header(None)):
+            return negotiate(accept)
+
+    The dependency is async, because FastAPI runs sync dependencies in the threadpool, i.e. in a copy of the context
+    of the request, where the variable would be set in vain. Its signature (the headers) is the one of the function.
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable:
+        @functools.wraps(fn)
+        async def dependency(*args, **kwargs):
+            variable.set(fn(*args, **kwargs))
+
+        return dependency
+
+    return decorator
@@ -0,0 +1,94 @@
+"""
+Incremental recalculation of stacks from a previous signed response.
+
+The intermediates of the previous response are provided to the stack tracers of the current request (context).
+A sub calculation, whose input is unchanged, is not called again: its previous result is verified and reused.
+Nested stacks, whose input has changed, are recalculated incrementally from their previous intermediates in turn.
+
+The previous response has to be signed by the owner of the stack, whose signature binds each intermediate to the name
+of its dependency (e.g. the result of another rule cannot be passed off as the one of Add), otherwise nothing is reused.
+An intermediate is reused only if it is signed by the owner of its dependency, otherwise it is calculated again.
+Only intermediates that are reused are verified, a modified one raises a SignatureVerifyException.
+"""
+import contextlib
+import logging
+from contextvars import ContextVar
+from typing import Optional, Type
+
+from pydantic import BaseModel
+from signedjson.key import get_verify_key
+from signedjson.sign import SignatureVerifyException
+
+from Framework.cache import canonical_hash, json_hash
+from Framework.merkle import verify_signed_node, verify_signed_tree
+
+logger = logging.getLogger('Framework')
+
+# the previous intermediates of the stack that is calculating in the current context, None if there are none
+_previous: ContextVar[Optional[dict]] = ContextVar('previous_intermediates', default=None)
+
+
+def _candidates(name: str):
+    """
+    The previous results of a dependency, repeated calls are named name#2, name#3, ... (see ListStackTracer)
+    """
+    previous = _previous.get()
+    if not previous:
+        return []
+    return [node for key, node in previous.items()
+            if (key == name or key.startswith(name + '#')) and isinstance(node, dict)]  # hashes cannot be reused
+
+
+def reuse(name: str, owner: str, input_model: BaseModel, signed_type: Type[BaseModel], signing_key,
+          verify_key=None) -> Optional[BaseModel]:
+    """
+    :param owner: of the dependency, the only signature name of a result that is reused
+    :param verify_key: to verify results signed by another service (see Framework.remote), by default the one of the key
+    :return: the verified previous result of the dependency for the same input, None if it has to be calculated
+    """
+    candidates = _candidates(name)
+    if not candidates:
+        return None
+    key = canonical_hash(input_model)
+    for node in candidates:
+        if set(node.get('signatures') or ()) == {owner} and json_hash(node.get('input')) == key:
+            verify_signed_tree(node, verify_key or get_verify_key(signing_key), path=f'/{name}', owner=owner)
+            return signed_type.parse_obj(node)
+    return None
+
+
+@contextlib.contextmanager
+def nested(name: str):
+    """
+    Provide the previous intermediates of a dependency to its own tracer while calling it
+    """
+    if _previous.get() is None:
+        yield
+        return
+    intermediates = next((node.get('intermediates') for node in _candidates(name)), None)
+    token = _previous.set(intermediates if isinstance(intermediates, dict) else None)
+    try:
+        yield
+    finally:
+        _previous.reset(token)
+
+
+@contextlib.contextmanager
+def previous_response(response: Optional[dict], name: str, owner: str, signing_key):
+    """
+    Recalculate the stack of the current context incrementally from its previous (signed) response
+    :param name: of the stack
+    :param owner: of the stack, the only signature name of the previous response
+    """
+    intermediates = (response or {}).get('intermediates')
+    if isinstance(intermediates, dict):
+        try:
+            verify_signed_node(response, get_verify_key(signing_key), path=f'/{name}', owner=owner)
+        except SignatureVerifyException as e:
+            logger.warning('%s is calculated from scratch, the previous response cannot be verified: %s', name, e)
+            intermediates = None
+    token = _previous.set(intermediates if isinstance(intermediates, dict) else None)
+    try:
+        yield
+    finally:
+        _previous.reset(token)
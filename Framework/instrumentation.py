@@ -0,0 +1,137 @@
+"""
+Timing of each layer of the vault and of each traced sub call.
+
+ - per rule and layer latency histograms as well as call and error counters, rendered in Prometheus text format
+ - a Server-Timing response header for clients that opt in via the X-Server-Timing request header
+
+Instrumentation is disabled by default, the decorators then merely check the enabled flag.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+OPT_IN_HEADER = 'x-server-timing'
+
+enabled = False
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, str], list] = dict()  # (rule, layer) -> [bucket counts..., sum, count, errors]
+_collectors: List[Callable[[], List[str]]] = []
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('request_timings', default=None)
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def register_collector(collector: Callable[[], List[str]]):
+    """
+    Further metrics (lines in Prometheus text format) to be rendered along with the timings
+    """
+    _collectors.append(collector)
+
+
+def observe(rule: str, layer: str, seconds: float, error: bool = False):
+    with _lock:
+        entry = _histograms.get((rule, layer))
+        if entry is None:
+            entry = _histograms[(rule, layer)] = [0] * (len(BUCKETS) + 4)
+        entry[bisect.bisect_left(BUCKETS, seconds)] += 1
+        entry[-3] += seconds
+        entry[-2] += 1
+        entry[-1] += error
+    timings = _request_timings.get()
+    if timings is not None:
+        name = f'{rule}.{layer}'
+        timings[name] = timings.get(name, 0.) + seconds
+
+
+class timer:
+    """
+    Context manager to observe the duration of a layer
+    """
+    __slots__ = ('rule', 'layer', 'start')
+
+    def __init__(self, rule: str, layer: str):
+        self.rule = rule
+        self.layer = layer
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        observe(self.rule, self.layer, time.perf_counter() - self.start, error=exc_type is not None)
+
+
+def _labels(rule: str, layer: str) -> str:
+    return f'rule="{rule}",layer="{layer}"'
+
+
+def render() -> str:
+    """
+    The metrics in Prometheus text format
+    """
+    with _lock:
+        histograms = {key: list(value) for key, value in _histograms.items()}
+    lines = ['# HELP datpro_layer_duration_seconds Duration of each layer of the vault (including the inner layers)',
+             '# TYPE datpro_layer_duration_seconds histogram']
+    for (rule, layer), entry in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), entry[:len(BUCKETS) + 1]):
+            cumulative += count
+            lines.append(f'datpro_layer_duration_seconds_bucket{{{_labels(rule, layer)},le="{bound}"}} {cumulative}')
+        lines.append(f'datpro_layer_duration_seconds_sum{{{_labels(rule, layer)}}} {entry[-3]}')
+        lines.append(f'datpro_layer_duration_seconds_count{{{_labels(rule, layer)}}} {entry[-2]}')
+    for name, index, description in (('calls', -2, 'Number of calls'), ('errors', -1, 'Number of exceptions')):
+        lines.append(f'# HELP datpro_layer_{name}_total {description} of each layer of the vault')
+        lines.append(f'# TYPE datpro_layer_{name}_total counter')
+        lines.extend(f'datpro_layer_{name}_total{{{_labels(rule, layer)}}} {entry[index]}'
+                     for (rule, layer), entry in sorted(histograms.items()))
+    for collector in _collectors:
+        lines.extend(collector())
+    return '\n'.join(lines) + '\n'
+
+
+def _server_timing(timings: Dict[str, float]) -> str:
+    return ', '.join(f'{name};dur={seconds * 1e3:.3f}' for name, seconds in timings.items())
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that adds the Server-Timing header, if the client opts in (X-Server-Timing: true)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or Headers(scope=scope).get(OPT_IN_HEADER, '').lower() not in ('1', 'true'):
+            return await self.app(scope, receive, send)
+        timings = dict()
+        token = _request_timings.set(timings)
+
+        async def send_with_timings(message):
+            if message['type'] == 'http.response.start' and timings:
+                MutableHeaders(scope=message).append('Server-Timing', _server_timing(timings))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            _request_timings.reset(token)
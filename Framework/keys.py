@@ -0,0 +1,59 @@
+"""
+The signing key of the responses.
+
+All processes serving the same rules have to sign with the same key, otherwise a response of one worker could not be
+verified with the verify key of another one (and all signatures would change on each restart).
+The key is read on import of the decorators, in this order, from
+ - the environment variable DATPRO_SIGNING_KEY: "<algorithm> <version> <base64 seed>", e.g. "ed25519 a_xyz 3m...",
+ - the file named by the environment variable DATPRO_SIGNING_KEY_FILE (same format, the first key is used),
+otherwise a random key is generated, which is fine for development and tests.
+A key file is created by `python -m Framework.serve --generate-key <file>`.
+"""
+import os
+from typing import Optional
+
+from signedjson.key import decode_signing_key_base64, generate_signing_key, read_signing_keys, write_signing_keys
+
+KEY_ENV = 'DATPRO_SIGNING_KEY'
+KEY_FILE_ENV = 'DATPRO_SIGNING_KEY_FILE'
+
+
+def _parse_key(line: str):
+    try:
+        algorithm, version, key_base64 = line.split()
+    except ValueError:
+        raise ValueError(f'{KEY_ENV} has to be of the format "<algorithm> <version> <base64 seed>"') from None
+    return decode_signing_key_base64(algorithm, version, key_base64)
+
+
+def load_signing_key(default_version: str = 'test'):
+    """
+    :return: the configured signing key, a random one (of the default version) if none is configured
+    """
+    if os.environ.get(KEY_ENV):
+        return _parse_key(os.environ[KEY_ENV])
+    if os.environ.get(KEY_FILE_ENV):
+        with open(os.environ[KEY_FILE_ENV]) as stream:
+            keys = read_signing_keys(stream)
+        if not keys:
+            raise ValueError(f'{os.environ[KEY_FILE_ENV]} does not contain a signing key')
+        return keys[0]
+    return generate_signing_key(default_version)
+
+
+def is_configured() -> bool:
+    """
+    Whether the signing key is persistent, i.e. not generated randomly on import
+    """
+    return bool(os.environ.get(KEY_ENV) or os.environ.get(KEY_FILE_ENV))
+
+
+def generate_key_file(path: str, version: Optional[str] = None):
+    """
+    Write a new random signing key to the file, which must not exist yet
+    """
+    key = generate_signing_key(version or os.urandom(3).hex())
+    with open(path, 'x') as stream:
+        write_signing_keys(stream, [key])
+    os.chmod(path, 0o600)
+    return key
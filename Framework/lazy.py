@@ -0,0 +1,182 @@
+"""
+Fast startup with many rules.
+
+LazyEndpoint mounts the routes of a rule without instantiating (i.e. decorating) it,
+the rule is instantiated on its first request or when warming up in the background.
+cache_openapi caches the OpenAPI schema, optionally as a file, that is reused as long as the rules do not change.
+"""
+import enum
+import inspect
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Type
+
+import fastapi
+from fastapi import APIRouter, FastAPI, Header
+from pydantic import BaseModel
+from starlette.requests import Request
+
+from Framework.abc.Endpoint import ABCEndpoint
+import Framework.deadline as deadline
+from Framework.abc.Stack import ABCStack
+from Framework.admission import Admission
+from Framework.cache import json_hash
+from Framework.decorators import RuleBatchHandler, RuleWarningHandler, StackTraceabilityHandler
+from Framework.negotiation import accept_header
+from Framework.streaming import NDJSONResponse
+
+_build_lock = threading.RLock()
+
+
+class LazyEndpoint:
+    """
+    Placeholder of a rule/stack, that provides the same routes but instantiates the rule on its first request
+    """
+
+    def __init__(self, rule_class: Type[ABCEndpoint]):
+        self.rule_class = rule_class
+        self.name = rule_class.__name__
+        self.tag = rule_class.tag
+        self._instance = None
+        self.admission = Admission.of(rule_class)
+        self.app = APIRouter()
+        path = "/" + self.name
+        input_model = rule_class._input_model()
+        self.app.get(path + "/schema", summary='Obtain the input_schema')(rule_class.input_schema)
+        self.app.get(path + "/mapping", summary='Obtain mappings')(rule_class.mapping)
+        if rule_class.cacheable:
+            self.app.get(path + "/cache", summary='Obtain cache statistics')(self.cache_stats)
+        if rule_class.coalesce:
+            self.app.get(path + "/coalescing", summary='Obtain coalescing statistics')(self.coalescing_stats)
+        if self.admission.limited:
+            self.app.get(path + "/admission", summary='Obtain admission statistics')(self.admission.stats)
+        self.app.post(path, summary=rule_class.summary)(self._endpoint('calculate', 'input_model', input_model))
+        self.app.post(path + "/batch",
+                      summary='Calculate a list of inputs, results, warnings and errors are provided per item'
+                      )(self._endpoint('calculate_batch', 'input_models', List[input_model]))
+        self.app.post(path + "/stream", response_class=NDJSONResponse,
+                      dependencies=RuleBatchHandler.request_dependencies(rule_class.timeout),
+                      summary='Calculate newline delimited json inputs, each item is streamed back when it is ready'
+                      )(self.calculate_stream)
+        if issubclass(rule_class, ABCStack):
+            self.app.post(path + "/recalculate",
+                          summary='Calculate a new input, reusing the unchanged results of a previous response'
+                          )(self._endpoint('recalculate', 'recalculation', rule_class._recalculation_model()))
+        if hasattr(rule_class, 'calculate_columnar'):  # vectorized rules
+            self.app.post(path + "/columns",
+                          summary='Calculate columns of inputs (json object of arrays or application/x-npz) at once'
+                          )(self._columnar_endpoint(rule_class.Layouts))
+
+    @property
+    def instance(self) -> ABCEndpoint:
+        if self._instance is None:
+            with _build_lock:
+                if self._instance is None:
+                    self._instance = self.rule_class()
+        return self._instance
+
+    def cache_stats(self):
+        return self.instance.cache.stats()
+
+    def coalescing_stats(self):
+        return self.instance.flights.stats()
+
+    async def calculate_stream(self, request: Request):
+        return await self.instance.calculate_stream(request)  # admitted by the stream itself
+
+    def _columnar_endpoint(self, layouts: Type[enum.Enum]) -> Callable:
+        async def calculate_columnar(request: Request, layout: layouts = layouts.columns):
+            return await self.instance.calculate_columnar(request, layout)
+
+        return calculate_columnar
+
+    @staticmethod
+    def warm_up(endpoints: Iterable['LazyEndpoint']):
+        """
+        Instantiate the rules in a background thread
+        """
+        endpoints = list(endpoints)
+        threading.Thread(target=lambda: [e.instance for e in endpoints], name='LazyEndpointWarmUp',
+                         daemon=True).start()
+
+    def _endpoint(self, handler: str, parameter: str, annotation) -> Callable:
+        log_levels = RuleWarningHandler.LogLevels
+        trace_levels = StackTraceabilityHandler.TraceLevels
+        traced = handler in ('calculate', 'recalculate') and issubclass(self.rule_class, ABCStack)
+
+        async def endpoint(x_log_level: log_levels, accept: Optional[str] = None, x_deadline: Optional[float] = None,
+                           x_timeout: Optional[float] = None, x_trace_level: trace_levels = trace_levels.full,
+                           **kwargs):
+            await accept_header(accept)
+            deadline.start(self.rule_class.timeout, x_deadline, x_timeout)
+            if traced:
+                await StackTraceabilityHandler.trace_level_header(x_trace_level)
+            await RuleWarningHandler.warning_level_header(x_log_level)
+            instance = self.instance
+            return await self.admission.run(getattr(instance, handler), **kwargs)
+
+        parameters = [inspect.Parameter(parameter, inspect.Parameter.KEYWORD_ONLY, annotation=annotation),
+                      inspect.Parameter('x_log_level', inspect.Parameter.KEYWORD_ONLY, annotation=log_levels,
+                                        default=Header(log_levels.debug)),
+                      inspect.Parameter('accept', inspect.Parameter.KEYWORD_ONLY, annotation=Optional[str],
+                                        default=Header(None)),
+                      inspect.Parameter('x_deadline', inspect.Parameter.KEYWORD_ONLY, annotation=Optional[float],
+                                        default=Header(None)),
+                      inspect.Parameter('x_timeout', inspect.Parameter.KEYWORD_ONLY, annotation=Optional[float],
+                                        default=Header(None))]
+        if traced:
+            parameters.append(inspect.Parameter('x_trace_level', inspect.Parameter.KEYWORD_ONLY,
+                                                annotation=trace_levels, default=Header(trace_levels.full)))
+        endpoint.__signature__ = inspect.Signature(parameters)
+        return endpoint
+
+
+def rules_fingerprint(rules: Iterable[Type[ABCEndpoint]]) -> str:
+    """
+    The fingerprint changes whenever a rule (its source code or its models) or the framework changes
+    """
+    items = []
+    for rule in sorted(rules, key=lambda r: (r.__module__, r.__qualname__)):
+        try:
+            source = inspect.getsource(rule)
+        except (OSError, TypeError):  # e.g. dynamically created rules
+            source = None
+        output_model = inspect.signature(rule.calculate).return_annotation
+        output_schema = output_model.schema() if inspect.isclass(output_model) and issubclass(
+            output_model, BaseModel) else None
+        items.append([rule.__module__, rule.__qualname__, source, rule.input_schema(), output_schema])
+    framework = [json_hash(path.read_bytes().decode()) for path in sorted(Path(__file__).parent.rglob('*.py'))]
+    return json_hash([items, framework, fastapi.__version__])
+
+
+def cache_openapi(app: FastAPI, rules: Iterable[Type[ABCEndpoint]], path: Optional[str], build: Callable[[], dict]):
+    """
+    Provide the OpenAPI schema of the app by
+     - the schema that has been generated already, or
+     - the schema stored in path, if it has been generated for the same rules, or
+     - generating (and storing) it
+    """
+    rules = list(rules)
+
+    def openapi() -> dict:
+        if app.openapi_schema is not None:
+            return app.openapi_schema
+        fingerprint = rules_fingerprint(rules) if path else None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                stored = json.load(f)
+            if stored.get('fingerprint') == fingerprint:
+                app.openapi_schema = stored['openapi']
+                return app.openapi_schema
+        schema = build()
+        if path:
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'fingerprint': fingerprint, 'openapi': schema}, f)
+            os.replace(tmp_path, path)
+        app.openapi_schema = schema
+        return schema
+
+    app.openapi = openapi
@@ -0,0 +1,95 @@
+"""
+Merkle style signing of nested stacks.
+
+Instead of signing the whole (nested) response, a stack signs a compact digest consisting of
+ - the hash of its input
+ - the hash of its output
+ - the hash of each intermediate, which are signed on their own already
+The hash of an intermediate that is signed in merkle mode is the hash of its digest,
+otherwise it is the hash of the signed content (i.e. everything but the signatures), which is kept when the canonical
+json is signed, instead of serializing the intermediate again.
+Hence, the signature of the top level stack commits to the whole tree, whereas signing cost does not grow with depth.
+
+Responses with the trace level "hashes" contain the hashes of the intermediates instead of the intermediates.
+"""
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+from signedjson.sign import verify_signed_json, SignatureVerifyException
+
+from Framework.cache import json_hash
+
+_UNSIGNED_KEYS = ('signatures', 'unsigned')
+
+
+def node_hash(node: Any) -> str:
+    """
+    The hash of a signed result, given either as model or as (deserialized json) dictionary, or the hash itself
+    """
+    if isinstance(node, str):  # the intermediate has been replaced by its hash already
+        return node
+    digest = node.get('digest') if isinstance(node, dict) else getattr(node, 'digest', None)
+    if digest is not None:
+        return json_hash(digest)
+    if isinstance(node, BaseModel):
+        content_hash = getattr(node, '_hash', None)
+        if content_hash is not None:  # i.e. the hash of the canonical json of the content (see json_hash)
+            return content_hash
+        return json_hash(node.dict(exclude=set(_UNSIGNED_KEYS)))
+    return json_hash({key: value for key, value in node.items() if key not in _UNSIGNED_KEYS})
+
+
+def merkle_digest(input_data: Any, output_data: Any, intermediates: Optional[Dict[str, Any]]) -> dict:
+    """
+    The digest of a stack response, input_data and output_data have to be json serializable
+    """
+    return {'input': json_hash(input_data),
+            'output': json_hash(output_data),
+            'intermediates': {name: node_hash(node) for name, node in (intermediates or {}).items()}}
+
+
+def verify_signed_node(node: dict, verify_key, path: str = '/', owner: Optional[str] = None) -> int:
+    """
+    Verify the signatures of a (deserialized) response, but not those of its intermediates.
+    The signature of the node commits to its intermediates nevertheless (as content or by their hashes).
+    :param owner: if given, the node has to be signed by this owner only
+    :return: the number of verified signatures
+    :raises SignatureVerifyException: naming the path of the node
+    """
+    signatures = node.get('signatures')
+    if not signatures:
+        raise SignatureVerifyException(f'{path}: no signatures on this object')
+    if owner is not None and set(signatures) != {owner}:
+        raise SignatureVerifyException(f'{path}: signed by {sorted(signatures)} instead of {owner}')
+    if 'digest' in node:
+        expected = merkle_digest(node['input'], node['output'], node.get('intermediates'))
+        if expected != node['digest']:
+            raise SignatureVerifyException(f'{path}: the digest does not match the content')
+        signed = {'digest': node['digest'], 'signatures': signatures}
+    else:
+        signed = node
+    for signature_name in signatures:
+        try:
+            verify_signed_json(signed, signature_name, verify_key)
+        except SignatureVerifyException as e:
+            raise SignatureVerifyException(f'{path}: {e}')
+    return len(signatures)
+
+
+def verify_signed_tree(tree: dict, verify_key, path: str = '', owner: Optional[str] = None) -> int:
+    """
+    Verify the signatures of a (deserialized) response and of all its intermediates.
+    Any subtree, e.g. tree['intermediates']['MyFirstStack'], can be verified on its own as well.
+    Intermediates that have been replaced by their hash are covered by the signature of their parent.
+    :param owner: if given, the response (not its intermediates) has to be signed by this owner only
+    :return: the number of verified signatures
+    :raises SignatureVerifyException: naming the path of the first node that could not be verified
+    """
+    path = path or '/'
+    # verify the intermediates first, so that the deepest node that has been modified is reported
+    verified = 0
+    for name, node in (tree.get('intermediates') or {}).items():
+        if isinstance(node, str):
+            continue
+        verified += verify_signed_tree(node, verify_key, path=f'{path.rstrip("/")}/{name}')
+    return verified + verify_signed_node(tree, verify_key, path, owner)
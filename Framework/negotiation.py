@@ -0,0 +1,86 @@
+"""
+Binary response formats via content negotiation (Accept header).
+
+Responses are sent as json by default, clients may accept MessagePack (application/msgpack) or CBOR (application/cbor)
+instead, provided that msgpack or cbor2 respectively are installed.
+The binary formats carry the same (plain json) content, i.e. a signed response is verified by decoding it
+and verifying the decoded object like a json response (the signature covers the canonical json of the content).
+"""
+import functools
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from fastapi import Header
+from starlette.responses import Response
+
+from Framework.headers import context_header
+
+try:
+    import msgpack
+except ImportError:  # msgpack is an optional dependency
+    msgpack = None
+try:
+    import cbor2
+except ImportError:  # cbor2 is an optional dependency
+    cbor2 = None
+
+ENCODERS = dict()
+if msgpack is not None:
+    ENCODERS['application/msgpack'] = ENCODERS['application/x-msgpack'] = functools.partial(msgpack.packb,
+                                                                                           use_bin_type=True)
+if cbor2 is not None:
+    ENCODERS['application/cbor'] = cbor2.dumps
+
+_JSON = ('application/json', 'application/*', '*/*')
+_media_type: ContextVar[Optional[str]] = ContextVar('media_type', default=None)
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """
+    :return: the binary media type preferred by the client, None for json (also if no supported type is acceptable)
+    """
+    candidates = []
+    for index, part in enumerate((accept or '').split(',')):
+        media_type, *parameters = [item.strip() for item in part.split(';')]
+        quality = 1.
+        for parameter in parameters:
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.
+        if quality > 0:
+            candidates.append((-quality, index, media_type.lower()))
+    for _, _, media_type in sorted(candidates):
+        if media_type in ENCODERS:
+            return media_type
+        if media_type in _JSON:
+            return None
+    return None
+
+
+@context_header(_media_type)
+def accept_header(accept: Optional[str] = Header(None)):
+    return negotiate(accept)
+
+
+def binary_media_type() -> Optional[str]:
+    """
+    The binary media type accepted for the current request, None for json
+    """
+    return _media_type.get()
+
+
+def binary_response(content: Any, media_type: str, status_code: int = 200, headers: dict = None) -> Response:
+    """
+    :param content: plain json content, e.g. the serialized response model
+    """
+    return Response(ENCODERS[media_type](content), status_code=status_code, headers=headers, media_type=media_type)
+
+
+def openapi_content() -> dict:
+    """
+    The alternative media types of the responses for the OpenAPI docs
+    """
+    return {media_type: {'schema': {'description': 'The json content encoded as ' + media_type}}
+            for media_type in ENCODERS if not media_type.startswith('application/x-')}
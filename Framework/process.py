@@ -0,0 +1,75 @@
+"""
+Process pool for CPU bound rules (executor = "process").
+
+Each worker process holds its own instances of the rules, which are created when the worker starts (pre-warmed)
+or on their first calculation.
+Warnings are recorded in the worker and returned along with the output, exceptions are re-raised by the pool,
+so that the warning and error handlers of the parent process behave exactly as for calculations in threads.
+"""
+import asyncio
+import inspect
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional, Type
+from warnings import WarningMessage
+
+import Framework.warnings as warnings
+
+_instances = dict()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _instance(rule_class: Type):
+    if rule_class not in _instances:
+        _instances[rule_class] = rule_class()
+    return _instances[rule_class]
+
+
+def _init_worker(rule_classes: Iterable[Type]):
+    for rule_class in rule_classes:
+        _instance(rule_class)
+
+
+def _calculate(rule_class: Type, input_model):
+    """
+    Run the original (undecorated) calculate function of the rule in the worker process
+    """
+    with warnings.collect() as list_wng:
+        output = _instance(rule_class).vault[0][-1](input_model)
+        if inspect.isawaitable(output):
+            output = asyncio.run(output)
+    # the recorded warnings are stripped down to picklable attributes
+    return output, [WarningMessage(w.message, w.category, w.filename, w.lineno) for w in list_wng]
+
+
+def start(rule_classes: Iterable[Type] = (), max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Start the process pool, each worker instantiates the given rule classes on start
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            max_workers = max_workers or os.cpu_count()
+            _pool = ProcessPoolExecutor(max_workers=max_workers,
+                                        initializer=_init_worker, initargs=(tuple(rule_classes),))
+            # make sure that all workers have been started and initialized before serving the first request
+            for future in [_pool.submit(os.getpid) for _ in range(max_workers)]:
+                future.result()
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def submit(rule_class: Type, input_model):
+    """
+    :return: a future of the output and the recorded warnings
+    """
+    return (_pool or start()).submit(_calculate, rule_class, input_model)
@@ -0,0 +1,34 @@
+"""
+State of a rule, which is shared by all of its instances, e.g. by its endpoint, its lazy endpoint and the sub calls of
+stacks (the cache, the calculations in flight and the admission control).
+"""
+import threading
+from typing import Dict, Type, TypeVar
+
+T = TypeVar('T', bound='PerRuleClass')
+
+
+class PerRuleClass:
+    """
+    Mixin providing one instance per rule class via of(rule_class), which subclasses create in from_rule_class
+    """
+    _registry: Dict[Type, 'PerRuleClass'] = dict()
+    _lock = threading.Lock()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._registry = dict()
+
+    @classmethod
+    def of(cls: Type[T], rule_class: Type) -> T:
+        """
+        The instance of the rule class, which is created on first use
+        """
+        with cls._lock:
+            if rule_class not in cls._registry:
+                cls._registry[rule_class] = cls.from_rule_class(rule_class)
+            return cls._registry[rule_class]
+
+    @classmethod
+    def from_rule_class(cls: Type[T], rule_class: Type) -> T:
+        raise NotImplementedError
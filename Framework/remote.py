@@ -0,0 +1,313 @@
+"""
+Remote dependencies: rules (or stacks) of another service, which are passed to stack tracers like local rules, e.g.
+
+    self.add = tracer(RemoteRule('Add', InputModel, OutputModel, 'http://rules:8000', 'Another', verify_key))
+
+The proxy posts the input to /{name} of the remote service and verifies the signatures of the (whole) response,
+which has to be signed by the owner of the remote rule only. It is then recorded as intermediate like the signed result
+of a local rule.
+Remote warnings are raised again, remote errors are raised as RemoteError (or DeadlineExceeded for 504).
+
+ - The connections are kept alive in a pool (at most pool_size), i.e. sub calls do not open a new connection each.
+ - Concurrent sub calls (e.g. of a StackGraph, of an async stack or of concurrent requests) may be batched:
+   with batch_size > 1, the calls arriving within batch_wait seconds are sent as one request to /{name}/batch.
+   The batch is sent on behalf of its first call, i.e. within its deadline and at its log level.
+ - Each attempt times out after timeout seconds or on the deadline of the request, whose remaining seconds are sent
+   along as X-Timeout. Unreachable and busy services (502, 503) are retried up to retries times with exponential
+   backoff, calculations are deterministic, hence it is safe to post them again.
+
+The signatures are verified with verify_key, which has to be given explicitly, also by services that share their
+signing key (see Framework.keys, e.g. get_verify_key(SIGNING_KEY)). The input and output models have to match the
+remote ones.
+"""
+import ast
+import concurrent.futures
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+import weakref
+from concurrent.futures import Future
+from typing import Dict, List, Tuple, Type
+
+from pydantic import BaseModel, Extra, create_model
+
+import Framework.deadline as deadline
+import Framework.instrumentation as instrumentation
+import Framework.warnings as warnings
+from Framework.base import TracedModel
+from Framework.deadline import DeadlineExceeded
+from Framework.decorators import RuleWarningHandler
+from Framework.merkle import verify_signed_tree
+
+RETRY_STATUS = (502, 503)
+_remotes = weakref.WeakSet()
+
+
+class RemoteError(Exception):
+    pass
+
+
+class RemoteResponse(TracedModel):
+    class Config:
+        # further fields, e.g. the intermediates and the digest of a remote stack, are kept as they have been signed
+        extra = Extra.allow
+
+
+class ConnectionPool:
+    """
+    A thread safe pool of keep-alive connections to one service, at most size connections are open at a time
+    """
+
+    def __init__(self, url: str, size: int = 8):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'{url} is not a http(s) url')
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else \
+            http.client.HTTPConnection
+        self.host, self.port, self.prefix = parts.hostname, parts.port, parts.path.rstrip('/')
+        self.opened = 0
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _acquire(self, timeout: float) -> http.client.HTTPConnection:
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f'no connection to {self.host} has been available within {timeout:.3f}s')
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.opened += 1
+        return self._connection_class(self.host, self.port, timeout=timeout)
+
+    def _release(self, connection: http.client.HTTPConnection, reuse: bool):
+        if reuse:
+            with self._lock:
+                self._idle.append(connection)
+        else:
+            connection.close()
+        self._slots.release()
+
+    def post(self, path: str, body: bytes, headers: Dict[str, str], timeout: float) \
+            -> Tuple[int, http.client.HTTPMessage, bytes]:
+        """
+        :return: status, headers and body of the response
+        """
+        connection = self._acquire(timeout)
+        reuse = False
+        try:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            connection.request('POST', self.prefix + path, body=body, headers=headers)
+            response = connection.getresponse()
+            content = response.read()
+            reuse = not response.will_close
+            return response.status, response.headers, content
+        finally:  # connections in an unknown state (e.g. after a timeout) are closed
+            self._release(connection, reuse)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class _Batch:
+    __slots__ = ('items', 'full')
+
+    def __init__(self):
+        self.items: List[Tuple[BaseModel, Future]] = []
+        self.full = threading.Event()
+
+
+class RemoteRule:
+    """
+    A proxy of a rule (or stack) of another service, to be passed to a stack tracer like a local rule
+    :param name: the name of the remote rule, its endpoint is /{name}
+    :param input_model: the input model of the remote rule
+    :param output_model: the output model of the remote rule
+    :param url: the url of the remote service, e.g. http://rules:8000
+    :param owner: the owner of the remote rule, i.e. the only signature name that is accepted
+    :param verify_key: to verify the signatures of the remote service
+    :param timeout: seconds per attempt (the deadline of the request may be earlier)
+    :param retries: further attempts if the service cannot be reached or is busy (502, 503)
+    :param backoff: seconds to wait before the first retry, doubled for each further one
+    :param pool_size: maximum number of connections to the remote service
+    :param batch_size: maximum number of concurrent calls sent as one batch request, 1 = no batching
+    :param batch_wait: seconds the first call of a batch waits for further ones
+    """
+
+    def __init__(self, name: str, input_model: Type[BaseModel], output_model: Type[BaseModel], url: str, owner: str,
+                 verify_key, timeout: float = 10., retries: int = 2, backoff: float = 0.05, pool_size: int = 8,
+                 batch_size: int = 1, batch_wait: float = 0.002):
+        self.name = name
+        if not owner or verify_key is None:
+            raise ValueError(f'{name} at {url} needs the owner and the verify key of the remote rule, '
+                             f'its responses cannot be verified otherwise!')
+        self.url = url.rstrip('/')
+        self.owner = owner
+        self.verify_key = verify_key
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.pool = ConnectionPool(url, pool_size)
+        self.return_type = create_model(f'{name}Response', __base__=RemoteResponse, input=(input_model, ...),
+                                        output=(output_model, ...), signatures=(dict, ...))
+        self.is_async = False
+        # like the vault of a rule, so that stack tracers call the proxy as the signed layer
+        self.vault = [('original', output_model, self), ('signed', self.return_type, self)]
+        self.calls = self.requests = self.retried = self.batches = self.batched_calls = 0
+        self._batch = _Batch()
+        self._lock = threading.Lock()
+        _remotes.add(self)
+
+    def __call__(self, input_model: BaseModel) -> BaseModel:
+        with self._lock:
+            self.calls += 1
+        if self.batch_size > 1:
+            result, messages = self._batched(input_model)
+        else:
+            result, messages = self._single(input_model)
+        # the remote warnings cascade up to the warning handler of the stack
+        warnings.replay([warnings.WarningMessage(RuntimeWarning(message), RuntimeWarning, f'{self.url}/{self.name}', 0)
+                         for message in messages])
+        return result
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if not RuleWarningHandler.collecting():
+            headers['X-Log-Level'] = RuleWarningHandler.LogLevels.ignore.value
+        return headers
+
+    def _post(self, path: str, body: bytes) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        for attempt in range(self.retries + 1):
+            timeout, headers = self.timeout, self._headers()
+            remaining = deadline.remaining()
+            if remaining is not None:
+                if remaining <= 0:
+                    raise DeadlineExceeded(f'The deadline of the request has passed while calling {self.name} '
+                                           f'at {self.url}')
+                timeout = min(timeout, remaining)
+                headers['X-Timeout'] = f'{remaining:.3f}'
+            with self._lock:
+                self.requests += 1
+            try:
+                status, response_headers, content = self.pool.post(path, body, headers, timeout)
+            except (OSError, http.client.HTTPException) as e:
+                error = RemoteError(f'{self.name} at {self.url} cannot be reached: {type(e).__name__} {e}')
+            else:
+                if status not in RETRY_STATUS:
+                    return status, response_headers, content
+                error = RemoteError(f'{self.name} at {self.url} is unavailable ({status})')
+            if attempt == self.retries:
+                raise error
+            with self._lock:
+                self.retried += 1
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def _raise_for(self, status: int, content: bytes):
+        if status == 200:
+            return
+        try:
+            detail = json.loads(content)
+        except ValueError:
+            detail = content.decode(errors='replace')
+        if isinstance(detail, dict) and 'msg' in detail:  # InternalException
+            detail = f'{detail.get("exception_type")}: {detail["msg"]}'
+        if status == 504:
+            raise DeadlineExceeded(f'{self.name} at {self.url}: {detail}')
+        raise RemoteError(f'{self.name} at {self.url} responded {status}: {detail}')
+
+    def _result(self, data: dict) -> BaseModel:
+        verify_signed_tree(data, self.verify_key, path=f'/{self.name}', owner=self.owner)
+        return self.return_type.parse_obj(data)
+
+    def _single(self, input_model: BaseModel) -> Tuple[BaseModel, List[str]]:
+        status, headers, content = self._post(f'/{self.name}', input_model.json().encode())
+        self._raise_for(status, content)
+        header = headers.get('X-DATPro-Warnings')  # see _serialize_warning_header
+        messages = [ast.literal_eval(item) for item in header.split(';')] if header else []
+        return self._result(json.loads(content)), messages
+
+    def _batched(self, input_model: BaseModel) -> Tuple[BaseModel, List[str]]:
+        future = Future()
+        with self._lock:
+            batch = self._batch
+            batch.items.append((input_model, future))
+            leader = len(batch.items) == 1
+            if len(batch.items) >= self.batch_size:
+                self._batch = _Batch()
+                batch.full.set()
+        if leader:  # the first call waits for further ones and sends the batch
+            batch.full.wait(self.batch_wait)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = _Batch()
+            self._send(batch.items)
+        remaining = deadline.remaining()
+        try:
+            return future.result(None if remaining is None else max(remaining, 0.))
+        except concurrent.futures.TimeoutError:
+            raise DeadlineExceeded(f'The deadline of the request has passed while calling {self.name} '
+                                   f'at {self.url}') from None
+
+    def _send(self, items: List[Tuple[BaseModel, Future]]):
+        with self._lock:
+            self.batches += 1
+            self.batched_calls += len(items)
+        if len(items) == 1:
+            input_model, future = items[0]
+            try:
+                future.set_result(self._single(input_model))
+            except Exception as e:
+                future.set_exception(e)
+            return
+        try:
+            body = b'[' + b','.join(input_model.json().encode() for input_model, _ in items) + b']'
+            status, _, content = self._post(f'/{self.name}/batch', body)
+            self._raise_for(status, content)
+            results = json.loads(content)
+            if len(results) != len(items):
+                raise RemoteError(f'{self.name} at {self.url} responded {len(results)} results to {len(items)} inputs')
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        for (_, future), item in zip(items, results):
+            try:
+                error = item.get('error')
+                if error:
+                    raise RemoteError(f'{self.name} at {self.url}: {error.get("exception_type")}: {error.get("msg")}')
+                future.set_result((self._result(item['result']), item.get('warnings') or []))
+            except Exception as e:
+                future.set_exception(e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'url': self.url, 'calls': self.calls, 'requests': self.requests, 'retries': self.retried,
+                    'batches': self.batches, 'batched_calls': self.batched_calls, 'connections': self.pool.opened}
+
+    def close(self):
+        self.pool.close()
+
+
+def _collect() -> List[str]:
+    current = [(remote.name, remote.stats()) for remote in sorted(list(_remotes), key=lambda r: r.name)]
+    lines = []
+    for metric, help_text, key in (
+            ('calls_total', 'Number of calls of remote rules', 'calls'),
+            ('requests_total', 'Number of requests (attempts) sent to remote rules', 'requests'),
+            ('retries_total', 'Number of requests to remote rules that have been retried', 'retries'),
+            ('connections_total', 'Number of connections opened to remote rules', 'connections')):
+        lines += [f'# HELP datpro_remote_{metric} {help_text}', f'# TYPE datpro_remote_{metric} counter']
+        lines += [f'datpro_remote_{metric}{{rule="{name}",url="{values["url"]}"}} {values[key]}'
+                  for name, values in current]
+    return lines
+
+
+instrumentation.register_collector(_collect)
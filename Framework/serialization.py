@@ -0,0 +1,88 @@
+"""
+Serialize once: the models are converted to plain json objects once, which are signed as canonical json and written
+to the response body in the order of the model (i.e. the intermediates in the order they have been called).
+
+The canonical json has to be identical to the one that is produced again when verifying a signature,
+hence canonicaljson (and its C accelerated encoder of the standard library) is used for signing.
+"""
+import functools
+import hashlib
+import json
+from typing import Any, Callable, Dict, Tuple, Type
+
+from canonicaljson import encode_canonical_json
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON
+from starlette.responses import Response
+from unpaddedbase64 import encode_base64
+
+_SCALARS = (bool, int, float, str)
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return model_serializer(type(value))(value)
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_plain(item) for item in value]
+    return value
+
+
+@functools.lru_cache(maxsize=None)
+def model_serializer(model_type: Type[BaseModel]) -> Callable[[BaseModel], Dict[str, Any]]:
+    """
+    Precompute a serializer per model, that converts instances to plain (json) data like model.dict() does.
+    Fields of scalar types are copied as they are, only the other fields are converted recursively.
+    """
+    scalars = frozenset(name for name, field in model_type.__fields__.items()
+                        if field.shape == SHAPE_SINGLETON and field.type_ in _SCALARS)
+
+    def serialize(model: BaseModel) -> Dict[str, Any]:
+        return {name: value if name in scalars else _plain(value) for name, value in model.__dict__.items()}
+
+    return serialize
+
+
+def serialize(model: BaseModel) -> Dict[str, Any]:
+    return model_serializer(type(model))(model)
+
+
+def encode_json(json_object: Any) -> bytes:
+    """
+    The json of a response body, encoded like starlette's JSONResponse does, i.e. the keys keep their order
+    """
+    return json.dumps(json_object, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode()
+
+
+def sign_canonical(json_object: Dict[str, Any], signature_name: str, signing_key) -> Tuple[dict, bytes, str]:
+    """
+    Sign the json object like signedjson.sign.sign_json does, the json object must not be signed already.
+    :return: the signatures, the json of the signed json object (including the signatures) in the order of its keys
+        and the hash of the canonical json that has been signed (see merkle.node_hash)
+    """
+    message = encode_canonical_json(json_object)
+    key_id = f'{signing_key.alg}:{signing_key.version}'
+    signatures = {signature_name: {key_id: encode_base64(signing_key.sign(message).signature)}}
+    body = encode_json({**json_object, 'signatures': signatures})
+    return signatures, body, hashlib.sha256(message).hexdigest()
+
+
+def encode_batch_item(item: BaseModel) -> bytes:
+    """
+    The json of a batch item (result, warnings and error), the signed json of its result is reused
+    """
+    content = encode_json(jsonable_encoder(item, exclude={'result'}, exclude_none=True))
+    if item.result is None:
+        return content
+    result = item.result._body or encode_json(serialize(item.result))
+    # "result" is the first field of the item ("error" is never set along with a result)
+    return b'{"result":' + result + (b',' + content[1:] if len(content) > 2 else b'}')
+
+
+class PreEncodedJSONResponse(Response):
+    """
+    A json response, whose body has been encoded already
+    """
+    media_type = "application/json"
@@ -0,0 +1,253 @@
+"""
+Pre-fork multi-worker serving for production (POSIX only).
+
+uvicorn's own worker processes (--workers) are spawned, i.e. each of them imports the rules again, builds all models
+of main_app() again and, unless a signing key is configured, signs with a random key of its own.
+Here, the app is built once in the parent process (including the OpenAPI schema), which then forks the workers.
+They share the app, the models and the signing key copy-on-write and only run the startup events on their own
+(e.g. starting the process pool). Workers that die are replaced, SIGINT/SIGTERM shut all of them down gracefully.
+The startup time and the memory of the parent and of each worker (RSS, PSS and USS on Linux) are logged.
+
+The signing key is read from DATPRO_SIGNING_KEY or DATPRO_SIGNING_KEY_FILE (see Framework.keys), otherwise all
+workers share a random key, which changes on each restart.
+Metrics (--metrics) are collected per worker.
+
+Run from the repository root:
+    python -m Framework.serve --generate-key signing.key
+    DATPRO_SIGNING_KEY_FILE=signing.key python -m Framework.serve main --workers 4 --host 0.0.0.0
+"""
+import argparse
+import asyncio
+import gc
+import importlib
+import json
+import logging
+import logging.config
+import os
+import select
+import signal
+import time
+from typing import Any, Dict, List, Mapping, Optional, Union
+
+import uvicorn
+from starlette.applications import Starlette
+
+import Framework.audit as audit
+import Framework.keys as keys
+
+logger = logging.getLogger('uvicorn.error')
+
+
+def memory_usage(pid: int) -> Dict[str, int]:
+    """
+    :return: the resident (rss), proportional (pss) and unique (uss) memory of the process in bytes,
+        as far as provided by /proc (empty on other platforms)
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as stream:
+            fields = {line.split(':')[0]: int(line.split()[1]) * 1024 for line in stream if line.endswith('kB\n')}
+        return {'rss': fields['Rss'], 'pss': fields['Pss'],
+                'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)}
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        with open(f'/proc/{pid}/status') as stream:
+            return {'rss': next(int(line.split()[1]) * 1024 for line in stream if line.startswith('VmRSS:'))}
+    except (OSError, StopIteration, ValueError):
+        return dict()
+
+
+def _format_memory(usage: Dict[str, int]) -> str:
+    return ', '.join(f'{name.upper()} {value / 2 ** 20:.1f} MiB' for name, value in usage.items()) or 'unknown memory'
+
+
+class _WorkerServer(uvicorn.Server):
+    """
+    Notifies the parent process as soon as the startup of the worker is complete
+    """
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int, forked: float):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+        self.forked = forked
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            elapsed = (time.perf_counter() - self.forked) * 1e3
+            os.write(self.ready_fd, f'{os.getpid()} {elapsed:.1f}\n'.encode())
+
+
+class PreforkServer:
+    """
+    Serves an app that has been built in this (parent) process by forked worker processes
+    """
+
+    def __init__(self, app, workers: Optional[int] = None, **config_kwargs):
+        self.config = uvicorn.Config(app, **config_kwargs)
+        self.workers = workers or os.cpu_count()
+        self.pids: Dict[int, float] = dict()  # worker pid -> time of the fork
+        self.ready: Dict[int, float] = dict()  # worker pid -> startup time after the fork in ms
+        self.all_ready = False
+        self.should_exit = False
+
+    def _fork(self, sockets: list, ready_fd: int) -> int:
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = forked
+            return pid
+        # worker process: uvicorn installs its own signal handlers
+        status = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.config.setup_event_loop()
+            asyncio.run(_WorkerServer(self.config, ready_fd, forked).serve(sockets=sockets))
+        except BaseException:
+            logger.exception('Worker [%d] failed', os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _handle_exit(self, sig, frame):
+        self.should_exit = True
+
+    def _report_ready(self, lines: List[str], started: float):
+        for line in lines:
+            pid, elapsed = line.split()
+            self.ready[int(pid)] = float(elapsed)
+            logger.info('Worker [%s] ready %s ms after the fork: %s', pid, elapsed, _format_memory(memory_usage(int(pid))))
+        if len(self.ready) == self.workers and not self.all_ready:
+            self.all_ready = True
+            logger.info('%d workers ready %.1f ms after the start', self.workers, (time.perf_counter() - started) * 1e3)
+
+    def run(self) -> int:
+        """
+        Fork the workers and supervise them until SIGINT/SIGTERM
+        :return: the exit status, 1 if a worker has failed on startup
+        """
+        started = time.perf_counter()
+        if not self.config.loaded:
+            self.config.load()
+        sockets = [self.config.bind_socket()]
+        ready_read, ready_write = os.pipe()
+        # objects that survive the startup are never collected, so that their pages stay shared with the workers
+        gc.collect()
+        gc.freeze()
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        logger.info('Started parent process [%d]: %s', os.getpid(), _format_memory(memory_usage(os.getpid())))
+        for _ in range(self.workers):
+            self._fork(sockets, ready_write)
+
+        status, buffer = 0, b''
+        while not self.should_exit:
+            readable, _, _ = select.select([ready_read], [], [], .5)
+            if readable:
+                buffer += os.read(ready_read, 4096)
+                *lines, buffer = buffer.split(b'\n')
+                self._report_ready([line.decode() for line in lines], started)
+            while self.pids:
+                pid, code = os.waitpid(-1, os.WNOHANG)
+                code = os.waitstatus_to_exitcode(code) if pid else code
+                if not pid:
+                    break
+                self.pids.pop(pid, None)
+                if self.should_exit:
+                    continue
+                if pid not in self.ready:  # a worker failing on startup would fail over and over again
+                    logger.error('Worker [%d] exited on startup (status %d), shutting down', pid, code)
+                    status, self.should_exit = 1, True
+                    break
+                del self.ready[pid]
+                logger.warning('Worker [%d] exited (status %d), forking a new one', pid, code)
+                self._fork(sockets, ready_write)
+
+        logger.info('Shutting down %d workers', len(self.pids))
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.pids):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids.clear()
+        for sock in sockets:
+            sock.close()
+        os.close(ready_read)
+        os.close(ready_write)
+        logger.info('Finished parent process [%d]', os.getpid())
+        return status
+
+
+def load_app(target: str, metrics: bool = False, audit_log: Union[str, Mapping[str, Any], None] = None):
+    """
+    :param target: "module" to serve the main_app of all rules of the module or
+        "module:attribute" to serve an app or the app returned by a factory (callable)
+    :param metrics: see main_app, for the main_app of the module only
+    :param audit_log: see main_app, for the main_app of the module only
+    """
+    module_name, _, attribute = target.partition(':')
+    module = importlib.import_module(module_name)
+    if not attribute:
+        from Framework import ABCEndpoint
+        return ABCEndpoint.main_app(metrics=metrics, audit_log=audit_log)
+    app = module
+    for name in attribute.split('.'):
+        app = getattr(app, name)
+    return app if isinstance(app, Starlette) else app()
+
+
+def _audit_log(value: str) -> Union[str, Dict[str, Any]]:
+    """
+    The directory of the audit log or a json object of its arguments
+    """
+    if not value.lstrip().startswith('{'):
+        return value
+    try:
+        return audit.options(json.loads(value))
+    except ValueError as e:  # including invalid json
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m Framework.serve', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('target', nargs='?', help='"module" (e.g. main) or "module:app" or "module:factory"')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--log-level', default='info')
+    parser.add_argument('--metrics', action='store_true', help='time each layer, see main_app(metrics=True)')
+    parser.add_argument('--audit-log', metavar='DIR', type=_audit_log,
+                        help='record each signed result in the directory, see audit, or pass the arguments of the '
+                             'audit log as json object, e.g. \'{"directory": "audit", "policy": "block"}\'')
+    parser.add_argument('--generate-key', metavar='FILE', help='write a new signing key to the file and exit')
+    args = parser.parse_args(argv)
+
+    if args.generate_key:
+        key = keys.generate_key_file(args.generate_key)
+        print(f'Written the signing key {key.alg}:{key.version} to {args.generate_key}, '
+              f'serve with {keys.KEY_FILE_ENV}={args.generate_key}')
+        return 0
+    if not args.target:
+        parser.error('the target is required')
+
+    config_kwargs = dict(host=args.host, port=args.port, log_level=args.log_level)
+    logging.config.dictConfig(uvicorn.config.LOGGING_CONFIG)
+    logger.setLevel(args.log_level.upper())
+    if not keys.is_configured():
+        logger.warning('No signing key configured (%s or %s), the workers share a random key until restarted',
+                       keys.KEY_ENV, keys.KEY_FILE_ENV)
+    start = time.perf_counter()
+    app = load_app(args.target, metrics=args.metrics, audit_log=args.audit_log)
+    app.openapi()
+    logger.info('Built the app of %s in %.1f ms', args.target, (time.perf_counter() - start) * 1e3)
+    return PreforkServer(app, workers=args.workers, **config_kwargs).run()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,146 @@
+"""
+Streaming of large sets of inputs as newline delimited json (NDJSON).
+
+The inputs are read from the request body as they arrive, each line is calculated like an item of a batch and
+written to the response as soon as it is ready (in the order of the inputs).
+At most `window` lines are pending at a time: when the window is full, reading the request body pauses until the oldest
+result has been sent to the client. Hence, memory stays bounded and slow clients slow down the reading (backpressure).
+
+A stream is admitted like a single request (see Framework.admission) and holds its admission until the response has been
+sent: synchronous lines are granted a worker of the threadpool each, rules with a limited concurrency calculate
+one line at a time.
+
+The headers of the request apply to each line like to the items of a batch (log level and deadline). Clients accepting
+a binary format (see Framework.negotiation) receive the sequence of the encoded items instead of json lines.
+Lines longer than `line_bytes` are not buffered: they are discarded as they arrive and answered with an error item.
+"""
+import asyncio
+import inspect
+from typing import AsyncIterator, Callable, Optional
+
+from pydantic import ValidationError
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from Framework.admission import AdmissionRejected, error_response
+from Framework.base import InternalException
+from Framework.negotiation import ENCODERS, binary_media_type
+from Framework.serialization import encode_batch_item, serialize
+
+
+class NDJSONResponse(StreamingResponse):
+    """
+    A streaming response, that may be sent while the request body is still being read.
+    StreamingResponse listens for the disconnect of the client meanwhile, which would consume the request body,
+    the disconnect is noticed when reading the request body instead.
+    """
+    media_type = "application/x-ndjson"
+
+    def __init__(self, content, release: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        finally:  # also if the client has disconnected
+            if self.release is not None:
+                self.release()
+        if self.background is not None:
+            await self.background()
+
+
+class LineTooLong(ValueError):
+    pass
+
+
+async def _read_lines(request: Request, max_bytes: int) -> AsyncIterator[Optional[bytes]]:
+    """
+    The non-blank lines of the request body, None in place of each line longer than max_bytes (which is discarded)
+    """
+    buffer, discarding = b'', False
+    async for chunk in request.stream():
+        *lines, buffer = (buffer + chunk).split(b'\n')
+        for line in lines:
+            if discarding or len(line) > max_bytes:
+                discarding = False
+                yield None
+            elif line.strip():
+                yield line
+        if len(buffer) > max_bytes:  # the rest of the line is discarded as it arrives
+            buffer, discarding = b'', True
+    if discarding or len(buffer) > max_bytes:
+        yield None
+    elif buffer.strip():
+        yield buffer
+
+
+class RuleStreamHandler:
+    """
+    This handler is used to calculate a stream of inputs of arbitrary length, see Framework.streaming
+    Each line of the response is an item of the batch handler (result, warnings and error)
+    """
+    is_async = True
+
+    def __init__(self, original_class, batch_handler, window: int, line_bytes: int):
+        if window < 1:
+            raise ValueError(f'{original_class.name} has a stream window of {window}, please choose at least 1!')
+        self.batch_handler = batch_handler
+        self.request_dependencies = batch_handler.request_dependencies
+        self.window = window
+        self.line_bytes = line_bytes
+        self.admission = original_class.admission
+        self._input_type = inspect.signature(original_class.vault[0][-1]).parameters['input_model'].annotation
+
+    async def _calculate_line(self, line: Optional[bytes], running: asyncio.Semaphore):
+        if line is None:
+            error = LineTooLong(f'The line exceeds {self.line_bytes} bytes (stream_line_bytes)')
+            return self.batch_handler.item_type(error=InternalException.from_exception(error))
+        try:
+            input_model = self._input_type.parse_raw(line)
+        except ValidationError as e:  # a bad line does not fail the whole stream
+            return self.batch_handler.item_type(error=InternalException.from_exception(e))
+        async with running:
+            return await self.admission.calculate(self.batch_handler.calculate_item, input_model,
+                                                  is_async=self.batch_handler.item_is_async)
+
+    async def _items(self, request: Request, media_type: Optional[str]) -> AsyncIterator[bytes]:
+        slots = asyncio.Semaphore(self.window)
+        # the stream holds a single slot of the admission of the rule
+        running = asyncio.Semaphore(1 if self.admission.limited else self.window)
+        pending = asyncio.Queue()  # bounded by the slots
+
+        async def read():
+            try:
+                async for line in _read_lines(request, self.line_bytes):
+                    await slots.acquire()
+                    await pending.put(asyncio.ensure_future(self._calculate_line(line, running)))
+            finally:
+                await pending.put(None)
+
+        reader = asyncio.ensure_future(read())
+        try:
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                item = await task
+                yield encode_batch_item(item) + b'\n' if media_type is None else ENCODERS[media_type](serialize(item))
+                # the line has been sent once the generator resumes, so the slot is free for the next line
+                slots.release()
+            await reader  # raises e.g. if the client disconnected while sending the inputs
+        finally:
+            reader.cancel()
+            while not pending.empty():
+                task = pending.get_nowait()
+                if task is not None:
+                    task.cancel()
+
+    async def __call__(self, request: Request):
+        try:
+            release = await self.admission.hold()
+        except AdmissionRejected as e:
+            return error_response(e)
+        media_type = binary_media_type()
+        return NDJSONResponse(self._items(request, media_type), release=release,
+                              media_type=media_type or NDJSONResponse.media_type)
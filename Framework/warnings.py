@@ -1,12 +1,80 @@
 """
-This module is just a dummy overriding the warn function.
+This module overrides the warn function of the warnings module, which is provided as is otherwise.
+
+Warnings of the content owners (Framework.warnings.warn) are collected per request (context) instead of being recorded
+by warnings.catch_warnings, which swaps the global state of the warnings module and is hence not safe in threads.
+The collector is kept in a context variable, i.e. it is shared by the sub calculations of the request, also by those
+in the threadpool or in tasks, while concurrent requests collect their warnings separately.
+Outside of a collector (e.g. when calling a calculation directly), warn falls back to the warnings module.
+
+Warnings raised by a batch calculation (calculate_batch or calculate_columns) may name the indices of the inputs they
+concern (items), so that they are reported for these items rather than recalculating the batch one by one.
 """
+import operator
+import sys
+from contextvars import ContextVar
+from typing import Iterable, List, Optional, Union
 from warnings import *
+from warnings import WarningMessage
+
 _warn = warn
+# the list collecting the warnings of the current context, False to discard them, None to use the warnings module
+_collector: ContextVar[Optional[Union[list, bool]]] = ContextVar('warnings_collector', default=None)
 
 
-def my_warning(message, category=RuntimeWarning, stacklevel=1, source=None):
-    _warn(message.__repr__(), category, stacklevel, source)
+def my_warning(message, category=RuntimeWarning, stacklevel=1, source=None, items=None):
+    """
+    :param items: the index or the indices of the inputs of a batch calculation, which the warning concerns
+    """
+    collected = _collector.get()
+    if collected is None:
+        _warn(message.__repr__(), category, stacklevel + 1, source)
+    elif collected is not False:
+        frame = sys._getframe(stacklevel)
+        wng = WarningMessage(category(message.__repr__()), category, frame.f_code.co_filename, frame.f_lineno,
+                             source=source)
+        if items is not None:
+            wng.items = _indices(items)
+        collected.append(wng)
+
+
+def _indices(items) -> tuple:
+    try:
+        return operator.index(items),
+    except TypeError:  # e.g. a list or an array of indices
+        return tuple(map(operator.index, items))
 
 
 warn = my_warning
+
+
+class collect:
+    """
+    Context manager to collect the warnings of the current context, which are provided as list of WarningMessage
+        with warnings.collect() as list_wng:
+            ...
+    :param enabled: False to discard the warnings instead (e.g. for the log level ignore)
+    """
+    __slots__ = ('collected', 'token')
+
+    def __init__(self, enabled: bool = True):
+        self.collected: Union[List[WarningMessage], bool] = [] if enabled else False
+
+    def __enter__(self) -> List[WarningMessage]:
+        self.token = _collector.set(self.collected)
+        return [] if self.collected is False else self.collected
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _collector.reset(self.token)
+
+
+def replay(list_wng: Iterable[WarningMessage]):
+    """
+    Raise collected warnings again, e.g. so that they cascade up to the warning handler
+    """
+    collected = _collector.get()
+    if collected is None:
+        for wng in list_wng:
+            warn_explicit(wng.message, wng.category, wng.filename, wng.lineno, source=wng.source)
+    elif collected is not False:
+        collected.extend(list_wng)
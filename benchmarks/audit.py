@@ -0,0 +1,76 @@
+"""
+Benchmark of the audit log (see Framework.audit)
+
+ - latency: a signed calculation without audit log, with the audit log, and writing plus fsyncing each entry
+   synchronously on the request thread instead
+ - group commit: many concurrent calculations, entries written per fsync and entries dropped by a small queue
+ - lookup: finding the entries of an input hash in the segments
+
+Run from the repository root:
+    python -m benchmarks.audit --calls 20000
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Framework.audit as audit
+from Framework.cache import canonical_hash
+from benchmarks.common import BenchInput, per_call_us, set_log_level, trivial_rule
+
+
+def signed_call(rule):
+    signed = {name: fn for name, _, fn in rule.vault}['signed']
+    return lambda: signed(input_model=BenchInput(x=1., y=2.))
+
+
+def concurrent_calls(rule, calls: int, threads: int = 8) -> float:
+    signed = {name: fn for name, _, fn in rule.vault}['signed']
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(lambda i: signed(input_model=BenchInput(x=float(i), y=2.)), range(calls)))
+    return time.perf_counter() - start
+
+
+def main(calls: int = 20000):
+    set_log_level()
+    rule = trivial_rule('AuditAdd')()
+    call = signed_call(rule)
+    with tempfile.TemporaryDirectory() as directory:
+        print('latency of a signed calculation')
+        print(f'  no audit log       : {per_call_us(call, 2000):7.1f} us')
+        audit.enable(directory)
+        print(f'  audit log          : {per_call_us(call, 2000):7.1f} us')
+        audit.disable()
+        synchronous = audit.AuditLog(directory)
+
+        def call_and_commit():
+            call()
+            synchronous._commit([(time.time(), 'AuditAdd', {'x': 1., 'y': 2.}, {})])
+
+        print(f'  synchronous fsync  : {per_call_us(call_and_commit, 200, repeat=3):7.1f} us')
+
+    seconds = concurrent_calls(rule, calls)
+    print(f'{calls} calculations in 8 threads, no audit log: {calls / seconds:.0f} calculations/s')
+    for max_queue in (100000, 100):
+        with tempfile.TemporaryDirectory() as directory:
+            sink = audit.enable(directory, max_queue=max_queue)
+            seconds = concurrent_calls(rule, calls)
+            audit.disable()
+            stats = sink.stats()
+            print(f'{calls} calculations in 8 threads, queue of {max_queue}: {calls / seconds:.0f} calculations/s, '
+                  f'{stats["written"]} written in {stats["commits"]} commits '
+                  f'({stats["written"] / max(stats["commits"], 1):.0f} per fsync), {stats["dropped"]} dropped')
+            if max_queue > calls:
+                input_hash = canonical_hash(BenchInput(x=42., y=2.))
+                start = time.perf_counter()
+                found = list(audit.read(directory, input_hash))
+                print(f'lookup of an input hash in {stats["written"]} entries: {len(found)} found in '
+                      f'{(time.perf_counter() - start) * 1e3:.1f} ms')
+                assert len(found) == 1 and found[0]['rule'] == 'AuditAdd', found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the audit log')
+    parser.add_argument('--calls', type=int, default=20000)
+    main(parser.parse_args().calls)
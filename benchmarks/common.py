@@ -0,0 +1,67 @@
+"""
+Models and helpers shared by the benchmarks
+"""
+import json
+import timeit
+import types
+from typing import Dict, Tuple, Type
+
+from pydantic import BaseModel
+
+from Framework.abc.Rule import ABCRule
+from Framework.decorators import RuleWarningHandler
+
+
+class BenchInput(BaseModel):
+    x: float
+    y: float
+
+
+class BenchOutput(BaseModel):
+    z: float
+
+
+def trivial_rule(name: str, **attributes) -> Type[ABCRule]:
+    """
+    Create (and register) a rule that just adds both inputs
+    """
+    def calculate(self, input_model: BenchInput) -> BenchOutput:
+        return BenchOutput(z=input_model.x + input_model.y)
+
+    return types.new_class(name, (ABCRule[BenchInput, BenchOutput],),
+                           exec_body=lambda ns: ns.update(calculate=calculate, **attributes))
+
+
+def set_log_level(level: RuleWarningHandler.LogLevels = RuleWarningHandler.LogLevels.debug):
+    """
+    The log level is usually set per request via the X-Log-Level header, it needs to be set when calling directly
+    """
+    RuleWarningHandler.set_log_level(level)
+
+
+def per_call_us(fn, number: int, repeat: int = 5) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+async def post(app, path: str, body, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    Post the json body to the app in process (without network)
+    :return: the status, the headers and the body of the response
+    """
+    messages, request = [], {'type': 'http.request', 'body': json.dumps(body).encode(), 'more_body': False}
+
+    async def receive():
+        return request
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'http_version': '1.1', 'method': 'POST', 'path': path, 'raw_path': path.encode(),
+             'root_path': '', 'scheme': 'http', 'query_string': b'', 'server': ('benchmark', 80),
+             'client': ('benchmark', 1),
+             'headers': [(b'content-type', b'application/json')] +
+                        [(key.lower().encode(), value.encode()) for key, value in headers.items()]}
+    await app(scope, receive, send)
+    start = next(message for message in messages if message['type'] == 'http.response.start')
+    body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+    return start['status'], {key.decode(): value.decode() for key, value in start['headers']}, body
@@ -0,0 +1,50 @@
+"""
+Per call overhead of the stacked decorators of a rule vs. the compiled single pass (see RuleCompiledHandler)
+
+Run from the repository root:
+    python -m benchmarks.compiled
+"""
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import Response, JSONResponse
+from starlette.testclient import TestClient
+
+from benchmarks.common import BenchInput, trivial_rule, set_log_level, per_call_us
+
+StackedRule = trivial_rule('StackedRule')
+CompiledRule = trivial_rule('CompiledRule', compiled=True)
+
+
+def render(response) -> bytes:
+    """
+    The stacked decorators return models, which are serialized by FastAPI afterwards
+    """
+    if isinstance(response, Response):
+        return response.body
+    return JSONResponse(content=jsonable_encoder(response)).body
+
+
+def measure(rule_class, number):
+    input_model = BenchInput(x=1, y=2)
+    rule = rule_class()
+    set_log_level()
+    original = per_call_us(lambda: rule.vault[0][-1](input_model), number)
+    decorated = per_call_us(lambda: render(rule.calculate(input_model)), number)
+    app = FastAPI()
+    app.include_router(rule.app)
+    client = TestClient(app)
+    http = per_call_us(lambda: client.post(f'/{rule.name}', json={'x': 1, 'y': 2}), number // 10)
+    return rule.name, original, decorated, http
+
+
+def main(number=2000):
+    rows = [measure(rule_class, number) for rule_class in (StackedRule, CompiledRule)]
+    print('original: calculate only, decorated: all decorators incl. rendering the response body, '
+          'http: in-process request')
+    print(f'{"rule":<14}{"original [us]":>15}{"decorated [us]":>16}{"overhead [us]":>15}{"http [us]":>12}')
+    for name, original, decorated, http in rows:
+        print(f'{name:<14}{original:>15.1f}{decorated:>16.1f}{decorated - original:>15.1f}{http:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Throughput of a CPU bound rule, run in the threadpool (executor = "thread") vs. a process pool (executor = "process")
+
+Run from the repository root:
+    python -m benchmarks.executor
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import BaseModel
+
+import Framework.process as process
+from Framework.abc.Rule import ABCRule
+from benchmarks.common import set_log_level
+
+
+class LoopInput(BaseModel):
+    n: int
+
+
+class LoopOutput(BaseModel):
+    total: int
+
+
+def _sum_of_squares(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+class ThreadLoop(ABCRule[LoopInput, LoopOutput]):
+    def calculate(self, input_model: LoopInput) -> LoopOutput:
+        return LoopOutput(total=_sum_of_squares(input_model.n))
+
+
+class ProcessLoop(ABCRule[LoopInput, LoopOutput]):
+    executor = "process"
+
+    def calculate(self, input_model: LoopInput) -> LoopOutput:
+        return LoopOutput(total=_sum_of_squares(input_model.n))
+
+
+def throughput(rule, calls: int, n: int, threads: int) -> float:
+    """
+    Calls per second, the calls are issued by as many threads as FastAPI's threadpool would use
+    """
+    set_log_level()
+    input_model = LoopInput(n=n)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: rule.calculate(input_model), range(calls)))
+    return calls / (time.perf_counter() - start)
+
+
+def main(calls=64, n=200_000, threads=16):
+    process.start([ProcessLoop])
+    try:
+        rows = [(rule_class.executor, throughput(rule_class(), calls, n, threads))
+                for rule_class in (ThreadLoop, ProcessLoop)]
+    finally:
+        process.shutdown()
+    print(f'{calls} calls of sum of squares up to {n:_}, {threads} threads, {os.cpu_count()} CPUs')
+    print(f'{"executor":<10}{"calls/s":>10}')
+    for executor, calls_per_second in rows:
+        print(f'{executor:<10}{calls_per_second:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark of remote rule dependencies (see Framework.remote)
+
+A second app, standing in for the remote service, is served by uvicorn in a thread of this process.
+The stacks of the local app call its rules over http: sequentially (keep-alive connections of the pool), concurrently
+(one request per call versus batches) and with failures (content owner errors, a wrong verify key or owner, no service).
+
+Run from the repository root:
+    python -m benchmarks.remote --requests 200
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import socket
+import threading
+import time
+
+import uvicorn
+from signedjson.key import generate_signing_key, get_verify_key
+
+import Framework.warnings as warnings
+from Framework import ABCEndpoint, ABCStack, SimpleStackTracer, ListStackTracer, RemoteRule, SIGNING_KEY, logger
+from Framework.abc.Rule import ABCRule
+from Framework.merkle import verify_signed_tree
+from benchmarks.common import BenchInput, BenchOutput, post
+
+FAN_OUT = 16
+
+
+class RemoteMultiply(ABCRule[BenchInput, BenchOutput]):
+    def calculate(self, input_model: BenchInput) -> BenchOutput:
+        if input_model.x < 0:
+            warnings.warn(f'{input_model.x} is negative')
+        return BenchOutput(z=input_model.x * input_model.y)
+
+
+class RemoteDivide(ABCRule[BenchInput, BenchOutput]):
+    def calculate(self, input_model: BenchInput) -> BenchOutput:
+        return BenchOutput(z=input_model.x / input_model.y)
+
+
+class RemoteChain(ABCStack[BenchInput, BenchOutput]):
+    def __init__(self, multiply: RemoteRule, divide: RemoteRule):
+        tracer = SimpleStackTracer(self)
+        super().__init__(tracer)
+        self.multiply = tracer(multiply)
+        self.divide = tracer(divide)
+
+    def calculate(self, input_model: BenchInput) -> BenchOutput:
+        product = self.multiply(input_model)
+        return self.divide(BenchInput(x=product.output.z, y=input_model.y)).output
+
+
+class RemoteFanOut(ABCStack[BenchInput, BenchOutput]):
+    def __init__(self, multiply: RemoteRule):
+        tracer = ListStackTracer(self)
+        super().__init__(tracer)
+        self.multiply = tracer(multiply)
+
+    async def calculate(self, input_model: BenchInput) -> BenchOutput:
+        results = await asyncio.gather(*(self.multiply(BenchInput(x=input_model.x + i, y=input_model.y))
+                                         for i in range(FAN_OUT)))
+        return BenchOutput(z=sum(res.output.z for res in results))
+
+
+class _ThreadServer(uvicorn.Server):
+    def install_signal_handlers(self):
+        pass  # the signals are handled by the main thread
+
+
+@contextlib.contextmanager
+def remote_service(app):
+    """
+    Serve the app on a free port in a thread of this process, provides its url
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    # uvicorn binds the port on its own, as the sockets it is given are not set up like its own ones (e.g. nodelay)
+    server = _ThreadServer(uvicorn.Config(app, port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def run(app, path: str, bodies: list, headers: dict = None) -> tuple:
+    """
+    Post the bodies to the app at once
+    :return: the responses and the seconds per request
+    """
+    async def post_all():
+        return await asyncio.gather(*(post(app, path, body, headers or {}) for body in bodies))
+
+    start = time.perf_counter()
+    responses = asyncio.run(post_all())
+    return responses, (time.perf_counter() - start) / len(bodies)
+
+
+def main(requests: int = 200):
+    logger.setLevel(logging.WARNING)
+    verify_key = get_verify_key(SIGNING_KEY)
+    with remote_service(ABCEndpoint._app([RemoteMultiply(), RemoteDivide()])) as url:
+        owner = RemoteMultiply.owner
+        multiply, divide = RemoteRule('RemoteMultiply', BenchInput, BenchOutput, url, owner, verify_key), \
+            RemoteRule('RemoteDivide', BenchInput, BenchOutput, url, RemoteDivide.owner, verify_key)
+        batched = RemoteRule('RemoteMultiply', BenchInput, BenchOutput, url, owner, verify_key, batch_size=FAN_OUT)
+        chain, fan_out, batched_fan_out = ABCEndpoint._app([RemoteChain(multiply, divide)]), \
+            ABCEndpoint._app([RemoteFanOut(multiply)]), ABCEndpoint._app([RemoteFanOut(batched)])
+
+        print('sequential requests of a stack with two remote sub calls')
+        (status, headers, body), = run(chain, '/RemoteChain', [{'x': -3, 'y': 2}])[0]
+        verified = verify_signed_tree(json.loads(body), verify_key)
+        print(f'  status {status}, {verified} signatures verified, warnings {headers.get("x-datpro-warnings")}')
+        seconds = min(sum(run(chain, '/RemoteChain', [{'x': i, 'y': 2}])[1] for i in range(requests))
+                      for _ in range(3)) / requests
+        print(f'  {seconds * 1e3:.2f} ms per request, {multiply.stats()["connections"]} connection(s) opened '
+              f'for {multiply.stats()["requests"]} requests to RemoteMultiply')
+
+        print(f'concurrent sub calls: a stack calling RemoteMultiply {FAN_OUT} times at once')
+        for name, stack, remote in (('one request per call', fan_out, multiply),
+                                    (f'batches of up to {FAN_OUT} calls', batched_fan_out, batched)):
+            before = remote.stats()
+            responses, seconds = run(stack, '/RemoteFanOut', [{'x': i, 'y': 2} for i in range(requests // 4)])
+            after = remote.stats()
+            assert all(status == 200 for status, _, _ in responses), responses[0]
+            print(f'  {name:<26}: {seconds * 1e3:.2f} ms per request, '
+                  f'{after["requests"] - before["requests"]} requests for {after["calls"] - before["calls"]} calls')
+
+        print('failures')
+        (status, _, body), = run(chain, '/RemoteChain', [{'x': 1, 'y': 0}])[0]
+        print(f'  remote error: {status} {body.decode()}')
+        wrong_key = get_verify_key(generate_signing_key(SIGNING_KEY.version))
+        forged = RemoteRule('RemoteMultiply', BenchInput, BenchOutput, url, owner, wrong_key)
+        (status, _, body), = run(ABCEndpoint._app([RemoteChain(forged, divide)]), '/RemoteChain', [{'x': 1, 'y': 2}])[0]
+        print(f'  wrong verify key: {status} {body.decode()}')
+        impostor = RemoteRule('RemoteMultiply', BenchInput, BenchOutput, url, 'Impostor', verify_key)
+        (status, _, body), = run(ABCEndpoint._app([RemoteChain(impostor, divide)]), '/RemoteChain',
+                                 [{'x': 1, 'y': 2}])[0]
+        print(f'  wrong owner: {status} {body.decode()}')
+    unreachable = RemoteRule('RemoteMultiply', BenchInput, BenchOutput, url, owner, verify_key, retries=2,
+                             backoff=0.05)
+    down = ABCEndpoint._app([RemoteChain(unreachable, divide)])
+    (status, _, body), = run(down, '/RemoteChain', [{'x': 1, 'y': 2}])[0]
+    print(f'  service down: {status} {body.decode()} ({unreachable.stats()["requests"]} attempts)')
+    (status, _, body), = run(down, '/RemoteChain', [{'x': 1, 'y': 2}], {'X-Timeout': '0.07'})[0]
+    print(f'  service down, X-Timeout 0.07: {status} {body.decode()}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of remote rule dependencies')
+    parser.add_argument('--requests', type=int, default=200)
+    main(parser.parse_args().requests)
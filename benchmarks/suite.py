@@ -0,0 +1,195 @@
+"""
+Benchmark suite, run fully in-process (ASGI test client, no network)
+
+ - startup: main_app() and the first OpenAPI schema for N synthetic rules (eager and lazy)
+ - http: latency and throughput of a trivial rule vs. a bare FastAPI route
+ - layers: marginal cost of each layer of the vault of a trivial rule
+ - nesting: latency and response size of stacks by depth and width
+
+The metrics are written as flat json ({"metric": value}), so that runs of different commits can be compared.
+
+Run from the repository root:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --output bench_new.json --compare bench.json
+"""
+import argparse
+import contextlib
+import json
+import platform
+import statistics
+import subprocess
+import time
+import types
+from typing import Dict, List
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from Framework import ABCStack, SimpleStackTracer, logger
+from Framework.abc.Endpoint import ABCEndpoint
+from benchmarks.common import BenchInput, BenchOutput, trivial_rule, set_log_level, per_call_us
+
+LAYERS = ("original", "traceable", "signed", "warning_handling", "error_handling")
+
+
+@contextlib.contextmanager
+def registered(rules):
+    """
+    Temporarily replace the registered rules, e.g. to measure the startup for a given number of rules
+    """
+    saved = ABCEndpoint.rules
+    ABCEndpoint.rules = set(rules)
+    try:
+        yield
+    finally:
+        ABCEndpoint.rules = saved
+
+
+def latencies_us(client: TestClient, path: str, body, number: int) -> List[float]:
+    ret = []
+    for _ in range(number):
+        start = time.perf_counter()
+        response = client.post(path, json=body)
+        ret.append((time.perf_counter() - start) * 1e6)
+        assert response.status_code == 200, response.text
+    return ret
+
+
+def latency_metrics(prefix: str, latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {f'{prefix}.p50_us': latencies[len(latencies) // 2],
+            f'{prefix}.p99_us': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            f'{prefix}.throughput_per_s': 1e6 / statistics.mean(latencies)}
+
+
+def bench_startup(synthetic_rules, sizes) -> Dict[str, float]:
+    metrics = {}
+    for size in sizes:
+        for lazy in (False, True):
+            mode = 'lazy' if lazy else 'eager'
+            with registered(synthetic_rules[:size]):
+                start = time.perf_counter()
+                app = ABCEndpoint.main_app(lazy=lazy)
+                metrics[f'startup.{mode}.rules_{size}.main_app_ms'] = (time.perf_counter() - start) * 1e3
+                start = time.perf_counter()
+                TestClient(app).get('/openapi.json')
+                metrics[f'startup.{mode}.rules_{size}.first_openapi_ms'] = (time.perf_counter() - start) * 1e3
+    return metrics
+
+
+def bench_http(rule_class, number: int) -> Dict[str, float]:
+    bare = FastAPI()
+
+    @bare.post('/bare', response_model=BenchOutput)
+    def bare_route(input_model: BenchInput) -> BenchOutput:
+        return BenchOutput(z=input_model.x + input_model.y)
+
+    rule = rule_class()
+    app = FastAPI()
+    app.include_router(rule.app)
+    body = {'x': 1, 'y': 2}
+    return {**latency_metrics('http.bare_fastapi', latencies_us(TestClient(bare), '/bare', body, number)),
+            **latency_metrics('http.rule', latencies_us(TestClient(app), f'/{rule.name}', body, number))}
+
+
+def bench_layers(rule_class, number: int) -> Dict[str, float]:
+    rule = rule_class()
+    set_log_level()
+    input_model = BenchInput(x=1, y=2)
+    layers = {name: fn for name, _, fn in rule.vault}
+    metrics, previous = {}, 0.
+    for name in LAYERS:
+        cumulative = per_call_us(lambda: layers[name](input_model), number)
+        metrics[f'layers.{name}.cumulative_us'] = cumulative
+        metrics[f'layers.{name}.marginal_us'] = cumulative - previous
+        previous = cumulative
+    return metrics
+
+
+def nested_stack(depth: int, width: int, leaves) -> ABCStack:
+    """
+    Each level is a stack calling the level below and width - 1 leaf rules, the lowest level calls leaf rules only
+    """
+    child = leaves[0]()
+    for level in range(1, depth + 1):
+        dependencies = [child] + [leaf() for leaf in leaves[1:width]]
+
+        def __init__(self, dependencies=tuple(dependencies)):
+            sst = SimpleStackTracer(self)
+            ABCStack.__init__(self, sst)
+            self.calls = [sst(dependency) for dependency in dependencies]
+
+        def calculate(self, input_model: BenchInput) -> BenchOutput:
+            return BenchOutput(z=sum(call(input_model).output.z for call in self.calls))
+
+        stack_class = types.new_class(f'Nested{depth}x{width}Level{level}', (ABCStack[BenchInput, BenchOutput],),
+                                      exec_body=lambda ns: ns.update(__init__=__init__, calculate=calculate))
+        child = stack_class()
+    return child
+
+
+def bench_nesting(shapes, leaves, number: int) -> Dict[str, float]:
+    metrics = {}
+    for depth, width in shapes:
+        stack = nested_stack(depth, width, leaves)
+        app = FastAPI()
+        app.include_router(stack.app)
+        client = TestClient(app)
+        prefix = f'nesting.depth_{depth}.width_{width}'
+        metrics.update(latency_metrics(prefix, latencies_us(client, f'/{stack.name}', {'x': 1, 'y': 2}, number)))
+        metrics[f'{prefix}.response_bytes'] = len(client.post(f'/{stack.name}', json={'x': 1, 'y': 2}).content)
+    return metrics
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(quick: bool = False) -> dict:
+    number = 50 if quick else 300
+    sizes = (10, 50) if quick else (10, 100, 300)
+    shapes = ((1, 2), (2, 2), (4, 2), (2, 4)) if quick else ((1, 2), (2, 2), (4, 2), (8, 2), (2, 4), (2, 8))
+    leaves = [trivial_rule(f'Leaf{i}') for i in range(max(width for _, width in shapes))]
+    synthetic_rules = [trivial_rule(f'Synthetic{i}') for i in range(max(sizes))]
+    trivial = trivial_rule('Trivial')
+    metrics = {}
+    metrics.update(bench_startup(synthetic_rules, sizes))
+    metrics.update(bench_http(trivial, number))
+    metrics.update(bench_layers(trivial, number * 10))
+    metrics.update(bench_nesting(shapes, leaves, number))
+    return {'meta': {'commit': git_commit(), 'python': platform.python_version(), 'machine': platform.machine(),
+                     'quick': quick, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'metrics': metrics}
+
+
+def compare(metrics: Dict[str, float], baseline: Dict[str, float]):
+    print(f'{"metric":<56}{"baseline":>12}{"current":>12}{"ratio":>8}')
+    for name, value in metrics.items():
+        if name in baseline:
+            ratio = value / baseline[name] if baseline[name] else float('nan')
+            print(f'{name:<56}{baseline[name]:>12.1f}{value:>12.1f}{ratio:>8.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='json file to write the results to')
+    parser.add_argument('--compare', help='json file of a previous run to compare with')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations and smaller sizes')
+    args = parser.parse_args()
+    logger.disabled = True  # the stack tracer logs each sub call
+    result = run(quick=args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result['metrics'], json.load(f)['metrics'])
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,7 @@ from pydantic import BaseModel, Field
 import uvicorn
 import Framework.warnings as warnings
 
-from Framework import ABCEndpoint, ABCStack, SimpleStackTracer
+from Framework import ABCEndpoint, ABCStack, SimpleStackTracer, StackGraph
 from Framework.abc.Rule import ABCRule
 
 
@@ -33,6 +33,7 @@ class Add(ABCRule[InputModel, OutputModel], tag="SimpleCalculations"):
     The visible documentation (Swagger) of this rule is the docstring of the calculate function
     """
     owner = "Another"
+    cacheable = True
 
     def calculate(self, input_model: InputModel) -> OutputModel:
         """
@@ -48,6 +49,7 @@ class Add(ABCRule[InputModel, OutputModel], tag="SimpleCalculations"):
 
 class Subtract(ABCRule[InputModel, OutputModel], tag="SimpleCalculations"):
     owner = "A third"
+    compiled = True
 
     def calculate(self, input_model: InputModel) -> OutputModel:
         """
@@ -83,7 +85,10 @@ class MyFirstStack(ABCStack[InputModel, OutputModel]):
 class NestedStack(ABCStack[InputModel, OutputModel]):
     """
     A demonstrator to show that it is possible to deeply nest stacks
+    Deeply nested stacks are best signed in merkle mode
     """
+    signing_mode = "merkle"
+
     def __init__(self, stack=MyFirstStack(), subtract=Subtract()):
         sst = SimpleStackTracer(self)
         super().__init__(sst)
@@ -100,6 +105,26 @@ class NestedStack(ABCStack[InputModel, OutputModel]):
         return OutputModel(z=res2.output.z)
 
 
+class ParallelStack(ABCStack[InputModel, OutputModel]):
+    """
+    A demonstrator to show that independent sub calculations can run concurrently
+    """
+    def __init__(self, add=Add(), subtract=Subtract(), stack=MyFirstStack()):
+        sst = SimpleStackTracer(self)
+        super().__init__(sst)
+        self.graph = StackGraph(sst)
+        self.graph.add(add, lambda input_model: input_model)
+        self.graph.add(subtract, lambda input_model: input_model)
+        self.graph.add(stack, lambda input_model, Add, Subtract: InputModel(x=Add.output.z, y=Subtract.output.z))
+
+    def calculate(self, input_model: InputModel) -> OutputModel:
+        """
+        Add and subtract the input parameters at the same time, then run the SimpleStack on both results
+        """
+        results = self.graph.run(input_model)
+        return OutputModel(z=results['MyFirstStack'].output.z)
+
+
 if __name__ == '__main__':
     app = ABCEndpoint.main_app()
     uvicorn.run(app, host="127.0.0.1", port=8000)
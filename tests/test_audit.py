@@ -0,0 +1,44 @@
+"""
+Options of the audit log (see Framework.audit)
+"""
+import argparse
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import Framework.audit as audit
+import Framework.serve as serve
+import main  # noqa: F401, the rules of the app
+from Framework import ABCEndpoint
+
+
+def test_options():
+    assert audit.options('audit') == {'directory': 'audit'}
+    assert audit.options({'directory': 'audit', 'policy': 'block'}) == {'directory': 'audit', 'policy': 'block'}
+    for invalid in ({'policy': 'block'}, {'directory': 'audit', 'policy': 'wait'}, {'directory': 'audit', 'size': 1}):
+        with pytest.raises(ValueError):
+            audit.options(invalid)
+
+
+def test_main_app_passes_the_options(tmp_path):
+    options = {'directory': str(tmp_path), 'policy': 'block', 'commit_delay': 0., 'fsync': False}
+    with TestClient(ABCEndpoint.main_app(audit_log=options)) as client:
+        assert (audit._sink.policy, audit._sink.fsync) == ('block', False)
+        assert client.post('/Add', json={'x': 1, 'y': 2}).status_code == 200
+    assert not audit.enabled
+    entries = [json.loads(line) for path in tmp_path.iterdir() for line in path.read_text().splitlines()]
+    assert [entry['rule'] for entry in entries] == ['Add']
+
+
+def test_main_app_rejects_invalid_options(tmp_path):
+    with pytest.raises(ValueError):
+        ABCEndpoint.main_app(audit_log={'directory': str(tmp_path), 'policy': 'wait'})
+
+
+def test_serve_parses_the_options():
+    assert serve._audit_log('audit') == 'audit'
+    assert serve._audit_log('{"directory": "audit", "batch_size": 16}') == {'directory': 'audit', 'batch_size': 16}
+    for invalid in ('{"directory": "audit", "policy": "wait"}', '{"directory": "audit"'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            serve._audit_log(invalid)
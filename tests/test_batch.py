@@ -0,0 +1,105 @@
+"""
+Batch calculations (see Framework.decorators.RuleBatchHandler)
+"""
+import asyncio
+import time
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+from starlette.testclient import TestClient
+
+import Framework.warnings as warnings
+from Framework import ABCEndpoint
+from Framework.abc.Rule import ABCRule
+
+
+class BatchInput(BaseModel):
+    x: float
+    attributed: bool = True
+
+
+class BatchOutput(BaseModel):
+    z: float
+
+
+class BatchSquare(ABCRule[BatchInput, BatchOutput]):
+    """
+    Warns about negative inputs, naming them only if all inputs ask for it
+    """
+    calls = {'calculate': 0, 'calculate_batch': 0}
+
+    def calculate(self, input_model: BatchInput) -> BatchOutput:
+        type(self).calls['calculate'] += 1
+        if input_model.x < 0:
+            warnings.warn(f'negative {input_model.x}')
+        return BatchOutput(z=input_model.x ** 2)
+
+    def calculate_batch(self, input_models: List[BatchInput]) -> List[BatchOutput]:
+        type(self).calls['calculate_batch'] += 1
+        negative = [index for index, input_model in enumerate(input_models) if input_model.x < 0]
+        if all(input_model.attributed for input_model in input_models):
+            for index in negative:
+                warnings.warn(f'negative {input_models[index].x}', items=index)
+            if len(negative) > 1:
+                warnings.warn('several negative', items=negative)
+        elif negative:
+            warnings.warn('negative')
+        return [BatchOutput(z=input_model.x ** 2) for input_model in input_models]
+
+
+class BatchSleepAsync(ABCRule[BatchInput, BatchOutput]):
+    async def calculate(self, input_model: BatchInput) -> BatchOutput:
+        await asyncio.sleep(0.2)
+        return BatchOutput(z=input_model.x)
+
+
+class BatchSleepSync(ABCRule[BatchInput, BatchOutput]):
+    def calculate(self, input_model: BatchInput) -> BatchOutput:
+        time.sleep(0.2)
+        return BatchOutput(z=input_model.x)
+
+
+@pytest.fixture(scope='module')
+def client():
+    return TestClient(ABCEndpoint.main_app())
+
+
+def batch(client, inputs: List[dict]) -> List[dict]:
+    response = client.post('/BatchSquare/batch', json=inputs)
+    assert response.status_code == 200, response.text
+    assert [item['result']['output']['z'] for item in response.json()] == [item['x'] ** 2 for item in inputs]
+    return response.json()
+
+
+def test_attributed_warnings_keep_the_vectorized_results(client):
+    calls = dict(BatchSquare.calls)
+    items = batch(client, [{'x': 1}, {'x': -2}, {'x': 3}, {'x': -4}])
+    assert BatchSquare.calls == {'calculate': calls['calculate'], 'calculate_batch': calls['calculate_batch'] + 1}
+    assert [item['warnings'] for item in items] == [None, ["'negative -2.0'", "'several negative'"], None,
+                                                    ["'negative -4.0'", "'several negative'"]]
+
+
+def test_unattributed_warnings_are_calculated_one_by_one(client):
+    calls = dict(BatchSquare.calls)
+    items = batch(client, [{'x': 1, 'attributed': False}, {'x': -2}])
+    assert BatchSquare.calls == {'calculate': calls['calculate'] + 2, 'calculate_batch': calls['calculate_batch'] + 1}
+    assert [item['warnings'] for item in items] == [None, ["'negative -2.0'"]]
+
+
+def test_stream_items_carry_their_warnings(client):
+    response = client.post('/BatchSquare/stream', data='{"x": -1}\n{"x": 2}\n')
+    assert response.status_code == 200, response.text
+    assert [line.count(b'negative') for line in response.content.splitlines()] == [1, 0]
+
+
+@pytest.mark.parametrize('path, errors', [
+    ('/BatchSleepAsync/batch', [None, 'DeadlineExceeded', 'DeadlineExceeded']),  # the second is cancelled
+    ('/BatchSleepSync/batch', [None, None, 'DeadlineExceeded']),  # the second cannot be interrupted
+])
+def test_items_after_the_deadline(client, path, errors):
+    response = client.post(path, json=[{'x': 1}, {'x': 2}, {'x': 3}], headers={'X-Timeout': '0.3'})
+    assert response.status_code == 200, response.text
+    items = response.json()
+    assert [item['error'] and item['error']['exception_type'] for item in items] == errors
+    assert items[0]['result']['output'] == {'z': 1.0}
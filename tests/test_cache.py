@@ -0,0 +1,53 @@
+"""
+Caches and flights shared by all instances of a rule class (see Framework.registry)
+"""
+import threading
+
+import pytest
+
+import Framework.warnings as warnings
+import main
+from Framework import ABCStack, SimpleStackTracer
+from Framework.admission import Admission
+from Framework.cache import LRUCache
+from Framework.coalesce import SingleFlight
+
+
+class CachedStack(ABCStack[main.InputModel, main.OutputModel]):
+    cacheable = True
+    coalesce = True
+
+    def __init__(self, operation=main.Add()):
+        sst = SimpleStackTracer(self)
+        super().__init__(sst)
+        self.operation = sst(operation)
+
+    def calculate(self, input_model: main.InputModel) -> main.OutputModel:
+        return self.operation(input_model).output
+
+
+def calculate(stack: ABCStack, input_model: main.InputModel):
+    with warnings.collect():
+        return {name: fn for name, _, fn in stack.vault}['coalesced'](input_model=input_model)
+
+
+@pytest.mark.parametrize('registry', [LRUCache, SingleFlight, Admission])
+def test_one_instance_per_rule_class(registry):
+    instances = []
+    threads = [threading.Thread(target=lambda: instances.append(registry.of(CachedStack))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(instance is instances[0] for instance in instances)
+    assert registry.of(main.Add) is not instances[0]
+
+
+def test_stacks_with_other_dependencies_are_cached_apart():
+    added, subtracted = CachedStack(), CachedStack(operation=main.Subtract())
+    assert added.cache is subtracted.cache
+    input_model = main.InputModel(x=5, y=2)
+    for _ in range(2):
+        assert calculate(added, input_model).output.z == 7
+        assert calculate(subtracted, input_model).output.z == 3
+    assert list(calculate(CachedStack(), input_model).intermediates) == ['Add']
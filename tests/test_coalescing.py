@@ -0,0 +1,109 @@
+"""
+Request coalescing (see Framework.coalesce) with deadlines and disconnects (in-process ASGI calls)
+
+A slow coalescing rule is called by a leader and an identical concurrent call (waiter):
+ - leader timeout: the leader exceeds its deadline (504), the waiter without deadline calculates on its own (200)
+ - leader disconnect: the request of the leader is cancelled, the waiter calculates on its own (200)
+ - waiter timeout: the waiter gives up at its own deadline (504), the leader is not affected (200)
+ - shared error: an error raised by the calculation is returned to both
+"""
+import asyncio
+import logging
+import time
+
+import pytest
+from pydantic import BaseModel
+
+from Framework import ABCEndpoint, logger
+from Framework.abc.Rule import ABCRule
+from benchmarks.common import post
+
+DURATION = 0.3  # of a calculation, in seconds
+TIMEOUT = '0.1'
+
+
+class FlightInput(BaseModel):
+    x: int
+
+
+class FlightOutput(BaseModel):
+    z: int
+
+
+class FlightAsync(ABCRule[FlightInput, FlightOutput]):
+    coalesce = True
+    calls = 0
+
+    async def calculate(self, input_model: FlightInput) -> FlightOutput:
+        type(self).calls += 1
+        await asyncio.sleep(DURATION)
+        if input_model.x < 0:
+            raise ValueError(f'negative {input_model.x}')
+        return FlightOutput(z=input_model.x)
+
+
+class FlightSync(ABCRule[FlightInput, FlightOutput]):
+    coalesce = True
+    calls = 0
+
+    def calculate(self, input_model: FlightInput) -> FlightOutput:
+        type(self).calls += 1
+        time.sleep(DURATION)
+        if input_model.x < 0:
+            raise ValueError(f'negative {input_model.x}')
+        return FlightOutput(z=input_model.x)
+
+
+async def leader_and_waiter(app, path: str, x: int, leader_headers: dict, waiter_headers: dict,
+                            disconnect: bool = False):
+    """
+    :return: the status of the leader (None if disconnected), the status and the body of the waiter
+        and the seconds the waiter took
+    """
+    leader = asyncio.ensure_future(post(app, path, {'x': x}, leader_headers))
+    await asyncio.sleep(0.02)  # the leader is in flight
+    start = time.perf_counter()
+    waiter = asyncio.ensure_future(post(app, path, {'x': x}, waiter_headers))
+    if disconnect:
+        await asyncio.sleep(0.05)
+        leader.cancel()
+    waiter_status, _, waiter_body = await waiter
+    seconds = time.perf_counter() - start
+    try:
+        leader_status = (await leader)[0]
+    except asyncio.CancelledError:
+        leader_status = None
+    return leader_status, waiter_status, waiter_body, seconds
+
+
+@pytest.fixture(scope='module')
+def app():
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    yield ABCEndpoint.main_app()
+    logger.setLevel(level)
+
+
+def test_leader_timeout(app):  # sync calculations cannot be stopped at the deadline of the leader
+    calls = FlightAsync.calls
+    leader, waiter, body, _ = asyncio.run(leader_and_waiter(app, '/FlightAsync', 0, {'X-Timeout': TIMEOUT}, {}))
+    assert (leader, waiter) == (504, 200) and b'"z":' in body, body[:200]
+    assert FlightAsync.calls - calls == 2
+
+
+def test_leader_disconnect(app):
+    leader, waiter, body, _ = asyncio.run(leader_and_waiter(app, '/FlightAsync', 1, {}, {}, disconnect=True))
+    assert (leader, waiter) == (None, 200) and b'"z":' in body, body[:200]
+
+
+@pytest.mark.parametrize('path', ['/FlightAsync', '/FlightSync'])
+def test_waiter_timeout(app, path):
+    leader, waiter, body, seconds = asyncio.run(leader_and_waiter(app, path, 2, {}, {'X-Timeout': TIMEOUT}))
+    assert (leader, waiter) == (200, 504), body[:200]
+    assert seconds < DURATION - 0.05
+
+
+@pytest.mark.parametrize('path', ['/FlightAsync', '/FlightSync'])
+def test_shared_error(app, path):
+    leader, waiter, body, _ = asyncio.run(leader_and_waiter(app, path, -3, {}, {}))
+    assert leader == waiter != 200 and b'negative' in body, body[:200]
@@ -0,0 +1,108 @@
+"""
+The request headers, which are kept in context variables for the whole request (see Framework.headers)
+"""
+import asyncio
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from Framework import ABCEndpoint
+from Framework.abc.Rule import ABCRule
+from Framework.streaming import _read_lines
+
+
+class SlowAdd(ABCRule[main.InputModel, main.OutputModel]):
+    stream_window = 1  # the lines are calculated one after another
+    stream_line_bytes = 64
+
+    async def calculate(self, input_model: main.InputModel) -> main.OutputModel:
+        await asyncio.sleep(0.2)
+        return main.OutputModel(z=input_model.x + input_model.y)
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['eager', 'lazy'])
+def client(request):
+    return TestClient(ABCEndpoint.main_app(lazy=request.param))
+
+
+def test_log_level(client):
+    response = client.post('/Add', json={'x': 1, 'y': 2})
+    assert 'picky' in response.headers['X-DATPro-Warnings']
+    response = client.post('/Add', json={'x': 1, 'y': 2}, headers={'X-Log-Level': 'ignore'})
+    assert response.status_code == 200, response.text
+    assert 'X-DATPro-Warnings' not in response.headers
+
+
+def test_trace_level(client):
+    response = client.post('/MyFirstStack', json={'x': 1, 'y': 2}, headers={'X-Trace-Level': 'hashes'})
+    assert response.status_code == 200, response.text
+    assert all(isinstance(value, str) for value in response.json()['intermediates'].values())
+
+
+def test_accept(client):
+    msgpack = pytest.importorskip('msgpack')
+    response = client.post('/Add', json={'x': 1, 'y': 2}, headers={'Accept': 'application/msgpack'})
+    assert response.headers['content-type'] == 'application/msgpack'
+    assert msgpack.unpackb(response.content)['output'] == {'z': 3.0}
+
+
+def test_timeout(client):
+    response = client.post('/SlowAdd', json={'x': 1, 'y': 2}, headers={'X-Timeout': '0.05'})
+    assert response.status_code == 504, response.text
+    assert client.post('/SlowAdd', json={'x': 1, 'y': 2}).status_code == 200
+
+
+def stream(client, path: str, lines: list, headers: dict = None) -> list:
+    response = client.post(path, data='\n'.join(lines), headers=headers or {})
+    assert response.status_code == 200, response.text
+    return [json.loads(line) for line in response.content.splitlines()]
+
+
+@pytest.mark.parametrize('route', ['batch', 'stream'])
+def test_log_level_of_items(client, route):
+    inputs = [{'x': 1, 'y': 2}, {'x': 2, 'y': 2}]
+    for headers, warnings in (({}, ["'Actually, we are really picky'"]), ({'X-Log-Level': 'ignore'}, None)):
+        if route == 'batch':
+            items = client.post('/Add/batch', json=inputs, headers=headers).json()
+        else:
+            items = stream(client, '/Add/stream', [json.dumps(item) for item in inputs], headers)
+        assert [item.get('warnings') for item in items] == [warnings, warnings]
+
+
+def test_accept_of_stream(client):
+    msgpack = pytest.importorskip('msgpack')
+    response = client.post('/Add/stream', data='{"x": 1, "y": 2}\n{"x": 2, "y": 2}',
+                           headers={'Accept': 'application/msgpack'})
+    assert response.headers['content-type'] == 'application/msgpack'
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(response.content)
+    assert [item['result']['output']['z'] for item in unpacker] == [3.0, 4.0]
+
+
+def test_timeout_of_stream(client):
+    line = json.dumps({'x': 1, 'y': 2})
+    items = stream(client, '/SlowAdd/stream', [line] * 3, {'X-Timeout': '0.3'})
+    assert items[0]['result']['output'] == {'z': 3.0}
+    assert [item['error']['exception_type'] for item in items[1:]] == ['DeadlineExceeded'] * 2
+
+
+def test_line_too_long(client):
+    lines = [json.dumps({'x': 1, 'y': 2}), json.dumps({'x': 1, 'y': 2, 'padding': 'a' * 64}),
+             json.dumps({'x': 3, 'y': 4})]
+    items = stream(client, '/SlowAdd/stream', lines)
+    assert [item.get('error', {}).get('exception_type') for item in items] == [None, 'LineTooLong', None]
+    assert items[2]['result']['output'] == {'z': 7.0}
+
+
+def test_long_lines_are_discarded_as_they_arrive():
+    class Request:
+        async def stream(self):
+            for chunk in (b'{"a": 1}\n{"b": "', b'x' * 10, b'x' * 10, b'"}\n\n{"c"', b': 3}\n' + b'y' * 20):
+                yield chunk
+
+    async def read():
+        return [line async for line in _read_lines(Request(), 16)]
+
+    assert asyncio.run(read()) == [b'{"a": 1}', None, b'{"c": 3}', None]
@@ -0,0 +1,69 @@
+"""
+Incremental recalculation of stacks from a previous signed response (see Framework.incremental)
+"""
+import copy
+
+import pytest
+from signedjson.key import get_verify_key
+from signedjson.sign import sign_json
+from starlette.testclient import TestClient
+
+import main
+from Framework import ABCEndpoint, SIGNING_KEY, verify_signed_tree
+from Framework.cache import LRUCache
+
+
+@pytest.fixture(scope='module')
+def client():
+    return TestClient(ABCEndpoint.main_app())
+
+
+def recalculate(client, path: str, input_data: dict, previous: dict) -> dict:
+    response = client.post(f'{path}/recalculate', json={'input': input_data, 'previous': previous})
+    assert response.status_code == 200, response.text
+    verify_signed_tree(response.json(), get_verify_key(SIGNING_KEY))
+    return response.json()
+
+
+def add_calls() -> int:
+    stats = LRUCache.of(main.Add).stats()  # Add is cacheable, each call is a hit or a miss
+    return stats['hits'] + stats['misses']
+
+
+def test_unchanged_input_is_reused(client):
+    previous = client.post('/MyFirstStack', json={'x': 1, 'y': 2}).json()
+    calls = add_calls()
+    result = recalculate(client, '/MyFirstStack', {'x': 1, 'y': 2}, previous)
+    assert add_calls() == calls
+    assert result['output'] == previous['output']
+
+
+def test_swapped_intermediate_is_not_reused(client):
+    previous = client.post('/MyFirstStack', json={'x': 1, 'y': 2}).json()
+    # the signed result of Subtract for the same input, passed off as the one of Add
+    forged = copy.deepcopy(previous)
+    forged['intermediates']['Add'] = client.post('/Subtract', json={'x': 1, 'y': 2}).json()
+    result = recalculate(client, '/MyFirstStack', {'x': 1, 'y': 2}, forged)
+    assert result['intermediates']['Add']['output'] == {'z': 3.0}
+    assert result['output'] == previous['output'] == {'z': -4.0}
+
+
+def test_swapped_intermediate_of_nested_stack_is_not_reused(client):
+    previous = client.post('/NestedStack', json={'x': 1, 'y': 2}).json()
+    forged = copy.deepcopy(previous)
+    forged['intermediates']['MyFirstStack']['intermediates']['Add'] = \
+        client.post('/Subtract', json={'x': 1, 'y': 2}).json()
+    result = recalculate(client, '/NestedStack', {'x': 1, 'y': 2}, forged)
+    assert result['output'] == previous['output']
+
+
+def test_intermediate_of_another_owner_is_recalculated(client):
+    previous = client.post('/MyFirstStack', json={'x': 1, 'y': 2}).json()
+    # a result of Subtract (owner "A third") as the one of Add (owner "Another"), even though the stack signed it
+    previous.pop('signatures')
+    previous['intermediates']['Add'] = client.post('/Subtract', json={'x': 1, 'y': 2}).json()
+    previous = sign_json(previous, main.MyFirstStack.owner, SIGNING_KEY)
+    calls = add_calls()
+    result = recalculate(client, '/MyFirstStack', {'x': 1, 'y': 2}, previous)
+    assert add_calls() == calls + 1
+    assert result['intermediates']['Add']['output'] == {'z': 3.0}
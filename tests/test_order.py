@@ -0,0 +1,74 @@
+"""
+The responses are written in the order of their models (input, intermediates, output, signatures) with the
+intermediates in the order they have been called, although the canonical json (sorted keys) is signed
+"""
+import json
+
+import pytest
+from signedjson.key import get_verify_key
+from starlette.testclient import TestClient
+
+import main
+from Framework import ABCEndpoint, ABCStack, ListStackTracer, SIGNING_KEY, verify_signed_tree
+
+
+class SubtractTwiceThenAdd(ABCStack[main.InputModel, main.OutputModel]):
+    def __init__(self, add=main.Add(), subtract=main.Subtract()):
+        tracer = ListStackTracer(self)
+        super().__init__(tracer)
+        self.add = tracer(add)
+        self.subtract = tracer(subtract)
+
+    def calculate(self, input_model: main.InputModel) -> main.OutputModel:
+        res1 = self.subtract(input_model)
+        res2 = self.subtract(main.InputModel(x=res1.output.z, y=input_model.y))
+        res3 = self.add(main.InputModel(x=res2.output.z, y=input_model.y))
+        return main.OutputModel(z=res3.output.z)
+
+
+@pytest.fixture(scope='module')
+def client():
+    return TestClient(ABCEndpoint.main_app())
+
+
+def respond(client, path: str, headers: dict = None) -> dict:
+    response = client.post(path, json={'x': 1, 'y': 2}, headers=headers or {})
+    assert response.status_code == 200, response.text
+    data = json.loads(response.content)  # the keys keep the order of the body
+    verify_signed_tree(data, get_verify_key(SIGNING_KEY))
+    return data
+
+
+def test_rule_response_order(client):
+    assert list(respond(client, '/Add')) == ['input', 'output', 'signatures']
+
+
+@pytest.mark.parametrize('path, intermediates', [
+    ('/MyFirstStack', ['Add', 'Subtract']),
+    ('/ParallelStack', ['Add', 'Subtract', 'MyFirstStack']),
+    ('/SubtractTwiceThenAdd', ['Subtract', 'Subtract#2', 'Add']),
+])
+def test_intermediates_in_call_order(client, path, intermediates):
+    data = respond(client, path)
+    assert list(data) == ['input', 'intermediates', 'output', 'signatures']
+    assert list(data['intermediates']) == intermediates
+
+
+def test_nested_intermediates_in_call_order(client):
+    data = respond(client, '/ParallelStack')
+    assert list(data['intermediates']['MyFirstStack']['intermediates']) == ['Add', 'Subtract']
+
+
+@pytest.mark.parametrize('route', ['batch', 'stream'])
+def test_batch_items_in_call_order(client, route):
+    inputs = [{'x': 1, 'y': 2}, {'x': 3, 'y': 4}]
+    if route == 'batch':
+        response = client.post('/ParallelStack/batch', json=inputs)
+    else:
+        response = client.post('/ParallelStack/stream', data='\n'.join(json.dumps(item) for item in inputs))
+    assert response.status_code == 200, response.text
+    items = json.loads(response.content) if route == 'batch' else \
+        [json.loads(line) for line in response.content.splitlines()]
+    assert len(items) == 2
+    for item in items:
+        assert list(item['result']['intermediates']) == ['Add', 'Subtract', 'MyFirstStack']
@@ -0,0 +1,161 @@
+"""
+Traces of stacks under concurrency (in-process ASGI calls, no network)
+
+Many concurrent requests of a sync stack (threadpool), an async stack nesting it and an async stack running a
+StackGraph share the same stack instances. Each response has to carry exactly the intermediates of its own input
+and all of its signatures have to verify.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+from signedjson.key import get_verify_key
+
+from Framework import ABCEndpoint, ABCStack, SimpleStackTracer, StackGraph, SIGNING_KEY, logger, verify_signed_tree
+from Framework.abc.Rule import ABCRule
+from benchmarks.common import post
+
+
+class StressInput(BaseModel):
+    x: float
+    y: float
+
+
+class StressOutput(BaseModel):
+    z: float
+
+
+class StressSub(ABCRule[StressInput, StressOutput]):
+    def calculate(self, input_model: StressInput) -> StressOutput:
+        time.sleep(random.random() * 0.001)
+        return StressOutput(z=input_model.x - input_model.y)
+
+
+class StressMul(ABCRule[StressInput, StressOutput]):
+    def calculate(self, input_model: StressInput) -> StressOutput:
+        return StressOutput(z=input_model.x * input_model.y)
+
+
+class StressAdd(ABCRule[StressInput, StressOutput]):
+    async def calculate(self, input_model: StressInput) -> StressOutput:
+        await asyncio.sleep(random.random() * 0.001)
+        return StressOutput(z=input_model.x + input_model.y)
+
+
+class SyncStack(ABCStack[StressInput, StressOutput]):
+    def __init__(self, sub=StressSub(), mul=StressMul()):
+        sst = SimpleStackTracer(self)
+        super().__init__(sst)
+        self.sub = sst(sub)
+        self.mul = sst(mul)
+
+    def calculate(self, input_model: StressInput) -> StressOutput:
+        res1 = self.sub(input_model)
+        time.sleep(random.random() * 0.001)  # let other requests interleave between the sub calls
+        res2 = self.mul(StressInput(x=res1.output.z, y=input_model.y))
+        return StressOutput(z=res2.output.z)
+
+
+class AsyncStack(ABCStack[StressInput, StressOutput]):
+    def __init__(self, stack=SyncStack(), add=StressAdd()):
+        sst = SimpleStackTracer(self)
+        super().__init__(sst)
+        self.stack = sst(stack)
+        self.add = sst(add)
+
+    async def calculate(self, input_model: StressInput) -> StressOutput:
+        res1 = await self.stack(input_model)
+        res2 = await self.add(StressInput(x=res1.output.z, y=input_model.y))
+        return StressOutput(z=res2.output.z)
+
+
+class GraphStack(ABCStack[StressInput, StressOutput]):
+    def __init__(self, sub=StressSub(), add=StressAdd(), stack=SyncStack()):
+        sst = SimpleStackTracer(self)
+        super().__init__(sst)
+        self.graph = StackGraph(sst)
+        self.graph.add(sub, lambda input_model: input_model)
+        self.graph.add(add, lambda input_model: input_model)
+        self.graph.add(stack, lambda input_model, StressSub, StressAdd:
+                       StressInput(x=StressAdd.output.z, y=StressSub.output.z))
+
+    async def calculate(self, input_model: StressInput) -> StressOutput:
+        results = await self.graph.run(input_model)
+        return StressOutput(z=results['SyncStack'].output.z)
+
+
+def _rule(x: float, y: float, z: float) -> dict:
+    return {'input': {'x': x, 'y': y}, 'output': {'z': z}}
+
+
+def _stack(x: float, y: float, intermediates: dict) -> dict:
+    return {'input': {'x': x, 'y': y}, 'intermediates': intermediates,
+            'output': list(intermediates.values())[-1]['output']}
+
+
+def expected_trace(path: str, x: float, y: float) -> dict:
+    """
+    The response of the input without signatures
+    """
+    def sync_stack(x, y):
+        return _stack(x, y, {'StressSub': _rule(x, y, x - y), 'StressMul': _rule(x - y, y, (x - y) * y)})
+
+    if path == '/SyncStack':
+        return sync_stack(x, y)
+    if path == '/AsyncStack':
+        nested = sync_stack(x, y)
+        z = nested['output']['z']
+        return _stack(x, y, {'SyncStack': nested, 'StressAdd': _rule(z, y, z + y)})
+    return _stack(x, y, {'StressSub': _rule(x, y, x - y), 'StressAdd': _rule(x, y, x + y),
+                         'SyncStack': sync_stack(x + y, x - y)})
+
+
+def strip_signatures(tree):
+    if isinstance(tree, dict):
+        return {key: strip_signatures(value) for key, value in tree.items() if key != 'signatures'}
+    return tree
+
+
+async def stress(app, requests: int, concurrency: int) -> List[str]:
+    semaphore = asyncio.Semaphore(concurrency)
+    verify_key = get_verify_key(SIGNING_KEY)
+    errors = []
+
+    async def check(i: int):
+        path = random.choice(['/SyncStack', '/AsyncStack', '/GraphStack'])
+        x, y = i + 0.5, float(random.randint(-3, 3))
+        async with semaphore:
+            status, _, body = await post(app, path, {'x': x, 'y': y}, {})
+        if status != 200:
+            errors.append(f'{path} x={x} y={y}: status {status} {body[:200]}')
+            return
+        data = json.loads(body)
+        expected = expected_trace(path, x, y)
+        if strip_signatures(data) != expected:
+            errors.append(f'{path} x={x} y={y}: expected {expected}, got {strip_signatures(data)}')
+            return
+        try:
+            verify_signed_tree(data, verify_key)
+        except Exception as e:
+            errors.append(f'{path} x={x} y={y}: {e}')
+
+    await asyncio.gather(*(check(i) for i in range(requests)))
+    return errors
+
+
+@pytest.fixture(scope='module')
+def app():
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    yield ABCEndpoint.main_app()
+    logger.setLevel(level)
+
+
+def test_traces_under_concurrency(app):
+    errors = asyncio.run(stress(app, requests=1000, concurrency=64))
+    assert not errors, errors[:10]
@@ -0,0 +1,106 @@
+"""
+Validation of the columns of vectorized rules (see Framework.abc.VectorRule)
+"""
+import io
+from typing import Dict
+
+import pytest
+from pydantic import BaseModel, confloat, root_validator
+from signedjson.key import get_verify_key
+from starlette.testclient import TestClient
+
+from Framework import ABCEndpoint, SIGNING_KEY, verify_signed_tree
+
+np = pytest.importorskip('numpy')
+from Framework.abc.VectorRule import ABCVectorRule  # noqa: E402
+
+
+class ColumnsInput(BaseModel):
+    x: float
+    y: confloat(ge=0)
+
+
+class OrderedInput(BaseModel):
+    low: int
+    high: int
+
+    @root_validator
+    def low_below_high(cls, values):
+        if values.get('low', 0) > values.get('high', 0):
+            raise ValueError('low exceeds high')
+        return values
+
+
+class ColumnsOutput(BaseModel):
+    z: float
+
+
+class VectorSum(ABCVectorRule[ColumnsInput, ColumnsOutput]):
+    def calculate_columns(self, columns: Dict[str, 'np.ndarray']) -> Dict[str, 'np.ndarray']:
+        return {'z': columns['x'] + columns['y']}
+
+
+class VectorSpan(ABCVectorRule[OrderedInput, ColumnsOutput]):
+    def calculate_columns(self, columns: Dict[str, 'np.ndarray']) -> Dict[str, 'np.ndarray']:
+        return {'z': (columns['high'] - columns['low']).astype('float64')}
+
+
+@pytest.fixture(scope='module')
+def client():
+    return TestClient(ABCEndpoint.main_app())
+
+
+def npz(**columns) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, **columns)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('layout', ['columns', 'rows'])
+def test_valid_columns(client, layout):
+    response = client.post(f'/VectorSum/columns?layout={layout}', json={'x': [1, 2.5], 'y': [0, '1']})
+    assert response.status_code == 200, response.text
+    if layout == 'columns':
+        assert response.json()['input'] == {'x': [1.0, 2.5], 'y': [0.0, 1.0]}
+        assert response.json()['output'] == {'z': [1.0, 3.5]}
+        verify_signed_tree(response.json(), get_verify_key(SIGNING_KEY))
+    else:
+        assert [item['result']['output']['z'] for item in response.json()] == [1.0, 3.5]
+
+
+def test_valid_npz(client):
+    response = client.post('/VectorSum/columns', data=npz(x=np.arange(3.), y=np.ones(3)),
+                           headers={'content-type': 'application/x-npz'})
+    assert response.status_code == 200, response.text
+    assert response.json()['output'] == {'z': [1.0, 2.0, 3.0]}
+
+
+@pytest.mark.parametrize('body', [
+    b'{"x": [1, 2], "y": [1]',  # no json
+    b'[[1, 2], [1, 2]]',  # no object of columns
+    b'{"x": [1, 2]}',  # missing column
+    b'{"x": [1, 2], "y": [1]}',  # ragged columns
+    b'{"x": [[1], [2]], "y": [[1], [2]]}',  # two dimensional columns
+    b'{"x": "12", "y": "12"}',  # no arrays
+    b'{"x": [1, null], "y": [1, 2]}',  # invalid values
+    b'{"x": [1, "a"], "y": [1, 2]}',
+    b'{"x": [1, 2], "y": [1, -2]}',  # constraint of the input model
+])
+@pytest.mark.parametrize('layout', ['columns', 'rows'])
+def test_malformed_columns(client, body, layout):
+    response = client.post(f'/VectorSum/columns?layout={layout}', data=body)
+    assert response.status_code == 422, response.text
+
+
+def test_malformed_npz(client):
+    for body in (b'', b'no npz', b'PK\x03\x04 no zip', npz(x=np.arange(2.), y=-np.ones(2))):
+        response = client.post('/VectorSum/columns', data=body, headers={'content-type': 'application/x-npz'})
+        assert response.status_code == 422, (body[:20], response.text)
+
+
+def test_root_validator(client):
+    response = client.post('/VectorSpan/columns', json={'low': [1, 2], 'high': [3, 4]})
+    assert response.status_code == 200, response.text
+    assert response.json()['output'] == {'z': [2.0, 2.0]}
+    response = client.post('/VectorSpan/columns', json={'low': [1, 5], 'high': [3, 4]})
+    assert response.status_code == 422, response.text
@@ -0,0 +1,112 @@
+"""
+The warnings header under concurrency (in-process ASGI calls, no network)
+
+Many concurrent requests of sync rules (threadpool), async rules, a cached rule and a stack raise warnings, which are
+unique to their input. Each response has to carry exactly its own warnings, none at the log level ignore.
+"""
+import ast
+import asyncio
+import logging
+import random
+import time
+from typing import List, Optional
+
+import pytest
+from pydantic import BaseModel
+
+import Framework.warnings as warnings
+from Framework import ABCEndpoint, ABCStack, SimpleStackTracer, logger
+from Framework.abc.Rule import ABCRule
+from benchmarks.common import post
+
+
+class WarnInput(BaseModel):
+    x: int
+
+
+class WarnOutput(BaseModel):
+    z: int
+
+
+class WarnSync(ABCRule[WarnInput, WarnOutput]):
+    def calculate(self, input_model: WarnInput) -> WarnOutput:
+        warnings.warn(f'sync {input_model.x}')
+        time.sleep(random.random() * 0.001)
+        warnings.warn(f'sync again {input_model.x}')
+        return WarnOutput(z=input_model.x)
+
+
+class WarnAsync(ABCRule[WarnInput, WarnOutput]):
+    async def calculate(self, input_model: WarnInput) -> WarnOutput:
+        warnings.warn(f'async {input_model.x}')
+        await asyncio.sleep(random.random() * 0.001)
+        return WarnOutput(z=input_model.x)
+
+
+class WarnCached(ABCRule[WarnInput, WarnOutput]):
+    cacheable = True
+
+    def calculate(self, input_model: WarnInput) -> WarnOutput:
+        warnings.warn(f'cached {input_model.x}')
+        return WarnOutput(z=input_model.x)
+
+
+class WarnStack(ABCStack[WarnInput, WarnOutput]):
+    def __init__(self, sync=WarnSync(), cached=WarnCached()):
+        tracer = SimpleStackTracer(self)
+        super().__init__(tracer)
+        self.sync = tracer(sync)
+        self.cached = tracer(cached)
+
+    def calculate(self, input_model: WarnInput) -> WarnOutput:
+        warnings.warn(f'stack {input_model.x}')
+        res = self.sync(input_model)
+        self.cached(WarnInput(x=res.output.z % 7))  # cache hits replay the warnings of the same input
+        return WarnOutput(z=res.output.z)
+
+
+def expected_warnings(path: str, x: int) -> List[str]:
+    return {'/WarnSync': [f'sync {x}', f'sync again {x}'],
+            '/WarnAsync': [f'async {x}'],
+            '/WarnCached': [f'cached {x}'],
+            '/WarnStack': [f'stack {x}', f'sync {x}', f'sync again {x}', f'cached {x % 7}']}[path]
+
+
+def parse_header(header: Optional[str]) -> List[str]:
+    """
+    The messages of the warnings header (see _serialize_warning_header)
+    """
+    if not header:
+        return []
+    return [ast.literal_eval(ast.literal_eval(item)) for item in header.split(';')]
+
+
+async def stress(app, requests: int, concurrency: int) -> List[str]:
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = []
+
+    async def check(x: int):
+        path = random.choice(['/WarnSync', '/WarnAsync', '/WarnCached', '/WarnStack'])
+        level = random.choice(['debug', 'info', 'ignore'])
+        async with semaphore:
+            status, headers, _ = await post(app, path, {'x': x}, {'X-Log-Level': level})
+        expected = [] if level == 'ignore' else expected_warnings(path, x)
+        actual = parse_header(headers.get('x-datpro-warnings'))
+        if status != 200 or sorted(actual) != sorted(expected):
+            errors.append(f'{path} x={x} level={level}: status {status}, expected {expected}, got {actual}')
+
+    await asyncio.gather(*(check(x) for x in range(requests)))
+    return errors
+
+
+@pytest.fixture(scope='module')
+def app():
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    yield ABCEndpoint.main_app()
+    logger.setLevel(level)
+
+
+def test_warnings_under_concurrency(app):
+    errors = asyncio.run(stress(app, requests=1000, concurrency=64))
+    assert not errors, errors[:10]